@@ -0,0 +1,243 @@
+"""
+Benchmarks the installer against stand-in nix and git executables and a local HTTP
+server, so its own overhead can be measured without real builds or network access.
+
+    python3 -m benchmarks [--runs N] [--phase PHASE ...] [--compare REV]
+
+Results are saved per commit under .bench/ for comparison between commits.
+"""
+import argparse
+import json
+import os
+import platform
+import shutil
+import statistics
+import subprocess
+import sys
+import tempfile
+from datetime import datetime, timezone
+from typing import Any
+
+from .phases import PHASES
+from .server import BenchServer
+
+REPO_PATH = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+FAKE_TOOLS_PATH = os.path.join(REPO_PATH, 'benchmarks', 'fake_tools')
+RESULTS_PATH = os.path.join(REPO_PATH, '.bench')
+STATES = ['cold', 'warm']
+
+# Variables the installer reads that would point it outside the sandbox or change what a
+# run does, so results depend only on the benchmark's own settings
+ISOLATED_VARS = [
+    'CARDANO_BLOB_STORE', 'GIT_MIRROR_PATH', 'CLONE_MODE', 'INSTALL_JOBS', 'INSTALL_PROFILE',
+    'LOCAL_BINARY_CACHE', 'LOCAL_BINARY_CACHE_KEYS', 'EXPORT_BINARY_CACHE', 'BUILD_MAX_JOBS',
+    'BUILD_CORES', 'NIX_GC_KEEP_GENERATIONS', 'NIX_GC_FULL', 'INSTALL_AIKEN', 'INSTALL_OGMIOS',
+    'CARDANO_NETWORKS', 'NIX_GC',
+]
+
+
+class Sandbox():
+    """
+    A throwaway HOME, CARDANO_PATH and CARDANO_SRC_PATH with the fake tools on PATH.
+    """
+    root: str
+    env: dict[str, str]
+
+    def __init__(self, server: BenchServer, args: argparse.Namespace):
+        self.root = tempfile.mkdtemp(prefix='ez-bench-')
+        home = self.mkdir('home')
+        with open(os.path.join(home, '.bashrc'), 'w') as f:
+            f.write("# bashrc\nexport PATH=$HOME/bin:$PATH\n")
+
+        env = {k: v for k, v in os.environ.items() if k not in ISOLATED_VARS}
+        env.update({
+            'PATH': f"{FAKE_TOOLS_PATH}{os.pathsep}{os.environ.get('PATH', '')}",
+            'HOME': home,
+            'CARDANO_PATH': self.mkdir('cardano'),
+            'CARDANO_SRC_PATH': self.mkdir('src'),
+            'NODE_RELEASE': "8.220.0",
+            'AIKEN_RELEASE': "1.0.21-alpha",
+            'OGMIOS_RELEASE': "6.0.0",
+            'GITHUB_API_URL': server.url,
+            'CARDANO_CONFIG_URL': f"{server.url}/environments",
+            'BUILD_SUBSTITUTERS': f"{server.url}/cache",
+            'BENCH_CALL_LOG': os.path.join(self.root, 'calls.log'),
+            'BENCH_STORE': self.mkdir('store'),
+            'BENCH_REAL_GIT': shutil.which('git') or '/usr/bin/git',
+            'BENCH_NIX_LATENCY': str(args.nix_latency),
+            'BENCH_NIX_BUILD_LATENCY': str(args.nix_build_latency),
+            'BENCH_GIT_LATENCY': str(args.git_latency),
+            'BENCH_GIT_FETCH_LATENCY': str(args.git_fetch_latency),
+            'BENCH_REPO_FILES': str(args.repo_files),
+            'BENCH_JOBS': str(args.jobs),
+        })
+        self.env = env
+
+    def mkdir(self, name: str) -> str:
+        path = os.path.join(self.root, name)
+        os.makedirs(path, exist_ok=True)
+        return path
+
+    def run_phase(self, phase: str) -> dict[str, Any]:
+        result_path = os.path.join(self.root, 'result.json')
+        log_path = os.path.join(self.root, 'output.log')
+        with open(log_path, 'w') as log:
+            proc = subprocess.run(
+                [sys.executable, "-m", "benchmarks.phases", phase, result_path],
+                cwd=REPO_PATH, env=self.env, stdin=subprocess.DEVNULL,
+                stdout=log, stderr=subprocess.STDOUT)
+        if proc.returncode != 0:
+            with open(log_path) as f:
+                output = f.read()[-4000:]
+            raise RuntimeError(f"phase '{phase}' failed:\n{output}")
+        with open(result_path) as f:
+            return json.load(f)
+
+    def remove(self) -> None:
+        shutil.rmtree(self.root, ignore_errors=True)
+
+
+def measure(
+        server: BenchServer, args: argparse.Namespace, phase: str,
+        state: str) -> dict[str, Any]:
+    """
+    Runs a phase `args.runs` times, each in a fresh sandbox (cold) or in one sandbox
+    primed by an unmeasured run (warm).
+    """
+    runs = []
+    sandbox = None
+    for _ in range(args.runs):
+        if sandbox is None:
+            sandbox = Sandbox(server, args)
+            if state == 'warm':
+                sandbox.run_phase(phase)
+        server.reset_counters()
+        result = sandbox.run_phase(phase)
+        result['bytes'] = server.bytes_sent
+        result['requests'] = server.requests
+        runs.append(result)
+        if state == 'cold':
+            sandbox.remove()
+            sandbox = None
+    if sandbox is not None:
+        sandbox.remove()
+
+    walls = [r['wall'] for r in runs]
+    return {
+        'runs': len(runs),
+        'wall_min': min(walls),
+        'wall_median': statistics.median(walls),
+        'wall_mean': statistics.mean(walls),
+        'wall_stdev': statistics.stdev(walls) if len(walls) > 1 else 0.0,
+        'subprocesses': statistics.median(r['subprocesses'] for r in runs),
+        'tools': runs[-1]['tools'],
+        'bytes': statistics.median(r['bytes'] for r in runs),
+        'requests': statistics.median(r['requests'] for r in runs),
+    }
+
+
+def git_revision(rev: str = 'HEAD') -> str | None:
+    try:
+        sha = subprocess.check_output(
+            ["git", "rev-parse", "--verify", "--quiet", f"{rev}^{{commit}}"],
+            cwd=REPO_PATH, text=True).strip()
+    except (OSError, subprocess.CalledProcessError):
+        return None
+    if rev == 'HEAD':
+        dirty = subprocess.run(
+            ["git", "diff", "--quiet", "HEAD", "--", "main.py", "src", "benchmarks"],
+            cwd=REPO_PATH).returncode != 0
+        return f"{sha}-dirty" if dirty else sha
+    return sha
+
+
+def results_file(revision: str) -> str:
+    return os.path.join(RESULTS_PATH, f"{revision}.json")
+
+
+def load_results(rev: str) -> dict[str, Any] | None:
+    revision = git_revision(rev) or rev
+    for candidate in [revision, f"{revision}-dirty"]:
+        try:
+            with open(results_file(candidate)) as f:
+                return json.load(f)
+        except FileNotFoundError:
+            continue
+    return None
+
+
+def print_results(
+        results: dict[str, dict[str, Any]],
+        baseline: dict[str, dict[str, Any]] | None) -> None:
+    header = f"{'phase':<34}{'median':>10}{'min':>10}{'procs':>8}{'bytes':>12}{'reqs':>6}"
+    if baseline is not None:
+        header += f"{'vs base':>10}"
+    print(header)
+    for key, r in results.items():
+        line = (f"{key:<34}{r['wall_median'] * 1000:>8.1f}ms{r['wall_min'] * 1000:>8.1f}ms"
+                f"{r['subprocesses']:>8.0f}{r['bytes']:>12.0f}{r['requests']:>6.0f}")
+        base = (baseline or {}).get(key)
+        if base:
+            change = (r['wall_median'] - base['wall_median']) / base['wall_median'] * 100
+            line += f"{change:>+9.1f}%"
+        print(line)
+
+
+def main() -> None:
+    parser = argparse.ArgumentParser(
+        prog="python3 -m benchmarks", description="Benchmark the Cardano EZ-Installer")
+    parser.add_argument("--runs", type=int, default=5, help="measured runs per phase (default: 5)")
+    parser.add_argument(
+        "--phase", action="append", choices=list(PHASES),
+        help="phase to benchmark (repeatable, default: all)")
+    parser.add_argument(
+        "--state", action="append", choices=STATES,
+        help="cold (fresh sandbox per run) and/or warm (reused sandbox) (default: both)")
+    parser.add_argument("--jobs", type=int, default=4, help="--jobs for full installs")
+    parser.add_argument("--nix-latency", type=float, default=0.0, help="seconds added to every nix call")
+    parser.add_argument("--nix-build-latency", type=float, default=0.0, help="seconds added to nix builds")
+    parser.add_argument("--git-latency", type=float, default=0.0, help="seconds added to every git call")
+    parser.add_argument("--git-fetch-latency", type=float, default=0.0, help="seconds added to git fetches")
+    parser.add_argument("--http-latency", type=float, default=0.0, help="seconds added to every HTTP request")
+    parser.add_argument("--repo-files", type=int, default=200, help="files in each fake source repo")
+    parser.add_argument("--compare", metavar="REV", help="compare with saved results for a commit")
+    parser.add_argument("--no-save", action="store_true", help="don't save results under .bench/")
+    args = parser.parse_args()
+
+    server = BenchServer(args.http_latency)
+    server.start()
+    results = {}
+    try:
+        for phase in args.phase or list(PHASES):
+            for state in args.state or STATES:
+                print(f"Running {phase} ({state})...", file=sys.stderr)
+                results[f"{phase}/{state}"] = measure(server, args, phase, state)
+    finally:
+        server.shutdown()
+
+    baseline = None
+    if args.compare:
+        saved = load_results(args.compare)
+        if saved is None:
+            print(f"No saved results for {args.compare}", file=sys.stderr)
+        else:
+            baseline = saved['results']
+    print_results(results, baseline)
+
+    revision = git_revision()
+    if not args.no_save and revision:
+        os.makedirs(RESULTS_PATH, exist_ok=True)
+        with open(results_file(revision), 'w') as f:
+            json.dump({
+                'revision': revision,
+                'date': datetime.now(timezone.utc).isoformat(),
+                'python': platform.python_version(),
+                'platform': platform.platform(),
+                'params': {k: v for k, v in vars(args).items() if k not in ['compare', 'no_save']},
+                'results': results,
+            }, f, indent=2, sort_keys=True)
+        print(f"\nSaved to {os.path.relpath(results_file(revision), REPO_PATH)}", file=sys.stderr)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,103 @@
+"""
+Runs one benchmarked phase in a fresh interpreter and writes its measurements to a
+JSON file: `python3 -m benchmarks.phases PHASE RESULT_FILE`. Expects the sandbox
+environment set up by the benchmark runner.
+"""
+import json
+import os
+import sys
+import time
+from typing import Any, Callable
+
+from main import install
+from src.choices import InstallChoices
+from src.config_vars import ConfigVars, make_cfg
+from src.dotfiles import update_dotfiles
+from src.install import download_node_configs, fetch_ogmios_source, install_ogmios
+from src.nix_options import NixOptions
+from src.nix_profile import ProfileTransaction
+from src.paths import Network, Paths
+
+Phase = Callable[[], Callable[[], Any]]
+
+
+def env_cfg() -> ConfigVars:
+    return {
+        'NODE_RELEASE': os.environ['NODE_RELEASE'],
+        'AIKEN_RELEASE': os.environ['AIKEN_RELEASE'],
+        'OGMIOS_RELEASE': os.environ['OGMIOS_RELEASE'],
+        'CARDANO_PATH': os.environ['CARDANO_PATH'],
+        'CARDANO_SRC_PATH': os.environ['CARDANO_SRC_PATH'],
+    }
+
+
+def made_paths() -> Paths:
+    paths = Paths(os.environ['CARDANO_PATH'])
+    paths.make_paths()
+    return paths
+
+
+def setup_install() -> Callable[[], Any]:
+    choices: InstallChoices = {
+        'aiken': True, 'ogmios': True, 'networks': list(Network), 'gc': False}
+    return lambda: install(choices, int(os.environ.get('BENCH_JOBS', '4')))
+
+
+def setup_make_cfg() -> Callable[[], Any]:
+    return make_cfg
+
+
+def setup_download_node_configs() -> Callable[[], Any]:
+    paths = made_paths()
+    return lambda: download_node_configs(paths)
+
+
+def setup_update_dotfiles() -> Callable[[], Any]:
+    paths = made_paths()
+    return lambda: update_dotfiles(paths)
+
+
+def setup_install_ogmios() -> Callable[[], Any]:
+    cfg = env_cfg()
+    fetch_ogmios_source(cfg)
+    return lambda: install_ogmios(cfg, ProfileTransaction(), NixOptions())
+
+
+# Each setup runs untimed and returns the timed part of the phase
+PHASES: dict[str, Phase] = {
+    'install': setup_install,
+    'make_cfg': setup_make_cfg,
+    'download_node_configs': setup_download_node_configs,
+    'update_dotfiles': setup_update_dotfiles,
+    'install_ogmios': setup_install_ogmios,
+}
+
+
+def logged_calls() -> list[str]:
+    try:
+        with open(os.environ['BENCH_CALL_LOG']) as f:
+            return f.read().splitlines()
+    except FileNotFoundError:
+        return []
+
+
+def main() -> None:
+    phase, result_path = sys.argv[1:3]
+    timed = PHASES[phase]()
+
+    calls_before = len(logged_calls())
+    start = time.perf_counter()
+    timed()
+    wall = time.perf_counter() - start
+    calls = logged_calls()[calls_before:]
+
+    tools: dict[str, int] = {}
+    for call in calls:
+        tool = call.split(' ', 1)[0]
+        tools[tool] = tools.get(tool, 0) + 1
+    with open(result_path, 'w') as f:
+        json.dump({'wall': wall, 'subprocesses': len(calls), 'tools': tools}, f)
+
+
+if __name__ == "__main__":
+    main()
@@ -0,0 +1,142 @@
+import hashlib
+import json
+import threading
+import time
+import urllib.parse
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+
+# Release tags served per repo (cardano-node has enough to need several pages)
+RELEASE_TAGS = {
+    "input-output-hk/cardano-node": [f"8.{i}.0" for i in range(250)],
+    "aiken-lang/aiken": ["v1.0.21-alpha", "v1.0.20-alpha"],
+    "CardanoSolutions/ogmios": ["v6.0.0", "v6.0.0-rc2"],
+}
+
+# Approximate sizes of the published node config files, in bytes
+CONFIG_SIZES = {
+    "config": 10_000,
+    "db-sync-config": 5_000,
+    "submit-api-config": 1_000,
+    "topology": 1_000,
+    "alonzo-genesis": 10_000,
+    "byron-genesis": 1_300_000,
+    "conway-genesis": 5_000,
+    "shelley-genesis": 3_000,
+}
+
+# Name of the key the served narinfos are signed with, which the fake nix.conf trusts
+CACHE_KEY_NAME = "bench-cache-1"
+
+
+def config_body(network: str, name: str) -> bytes:
+    """
+    Deterministic JSON stand-in for a node config file.
+    """
+    size = CONFIG_SIZES[name]
+    filler = hashlib.sha256(f"{network}/{name}".encode()).hexdigest()
+    # Padded to exactly `size` bytes while staying valid JSON
+    padding = size - len(json.dumps({"filler": ""}))
+    return json.dumps({"filler": (filler * (padding // len(filler) + 1))[:padding]}).encode()
+
+
+class BenchServer(ThreadingHTTPServer):
+    """
+    Stands in for the GitHub releases API (paginated, with ETags), the node config host
+    (with ETags and If-None-Match) and a binary cache, and counts the bytes it sends.
+    """
+    daemon_threads = True
+    latency: float
+    bytes_sent: int
+    requests: int
+
+    def __init__(self, latency: float = 0.0):
+        super().__init__(("127.0.0.1", 0), BenchHandler)
+        self.latency = latency
+        self.bytes_sent = 0
+        self.requests = 0
+        self._lock = threading.Lock()
+        self._configs: dict[str, bytes] = {}
+
+    @property
+    def url(self) -> str:
+        host, port = self.server_address[:2]
+        return f"http://{host}:{port}"
+
+    def start(self) -> None:
+        threading.Thread(target=self.serve_forever, daemon=True).start()
+
+    def count(self, sent: int) -> None:
+        with self._lock:
+            self.bytes_sent += sent
+            self.requests += 1
+
+    def reset_counters(self) -> None:
+        with self._lock:
+            self.bytes_sent = 0
+            self.requests = 0
+
+    def config(self, network: str, name: str) -> bytes:
+        key = f"{network}/{name}"
+        with self._lock:
+            if key not in self._configs:
+                self._configs[key] = config_body(network, name)
+            return self._configs[key]
+
+
+class BenchHandler(BaseHTTPRequestHandler):
+    protocol_version = "HTTP/1.1"
+    server: BenchServer
+
+    def do_GET(self) -> None:
+        time.sleep(self.server.latency)
+        parts = urllib.parse.urlsplit(self.path)
+        segments = parts.path.strip('/').split('/')
+        if len(segments) == 4 and segments[0] == 'repos' and segments[3] == 'releases':
+            self.releases(f"{segments[1]}/{segments[2]}", urllib.parse.parse_qs(parts.query))
+        elif segments == ['cache', 'nix-cache-info']:
+            self.respond(b"StoreDir: /nix/store\nWantMassQuery: 1\nPriority: 40\n", None)
+        elif len(segments) == 2 and segments[0] == 'cache' and segments[1].endswith('.narinfo'):
+            # Every output is cached, as it would be for a tagged release
+            self.respond(
+                f"StorePath: /nix/store/{segments[1].removesuffix('.narinfo')}\n"
+                f"Sig: {CACHE_KEY_NAME}:AAAA\n".encode(), None)
+        elif len(segments) == 3 and segments[0] == 'environments' and \
+                segments[2].removesuffix('.json') in CONFIG_SIZES:
+            body = self.server.config(segments[1], segments[2].removesuffix('.json'))
+            self.respond(body, f'"{hashlib.md5(body).hexdigest()}"')
+        else:
+            self.respond(b"", None, 404)
+
+    def releases(self, repo: str, query: dict[str, list[str]]) -> None:
+        tags = RELEASE_TAGS.get(repo)
+        if tags is None:
+            self.respond(b"", None, 404)
+            return
+        page = int(query.get('page', ['1'])[0])
+        per_page = int(query.get('per_page', ['30'])[0])
+        body = json.dumps(
+            [{"tag_name": tag} for tag in tags[(page - 1) * per_page:page * per_page]]).encode()
+        link = None
+        if page * per_page < len(tags):
+            link = f'<{self.server.url}/repos/{repo}/releases?per_page={per_page}&page={page + 1}>; rel="next"'
+        self.respond(body, f'"{hashlib.md5(body).hexdigest()}"', link=link)
+
+    def respond(
+            self, body: bytes, etag: str | None, status: int = 200,
+            link: str | None = None) -> None:
+        if_none_match = [t.strip() for t in self.headers.get('If-None-Match', '').split(',')]
+        if etag and etag in if_none_match:
+            status, body = 304, b""
+        self.send_response(status)
+        if etag:
+            self.send_header('ETag', etag)
+        if link and status == 200:
+            self.send_header('Link', link)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+        self.server.count(len(body))
+
+    def log_message(self, format: str, *args: object) -> None:
+        pass
@@ -1,46 +1,337 @@
 #!/usr/bin/env python3
 
-import subprocess
 import sys
+
+# `status` is answered before the installer's modules are imported, to stay fast enough
+# for shell prompts and monitoring agents
+if __name__ == "__main__" and sys.argv[1:2] == ["status"] and \
+        set(sys.argv[2:]) <= {"--json"}:
+    from src.status import main as status_main
+    status_main("--json" in sys.argv[2:])
+    sys.exit(0)
+
+import argparse
+import os
+import tarfile
+import time
+from functools import partial
 from typing import NoReturn
 
-from src.nix_conf import check_nix_conf
-from src.utils import ind, print_success
-from src.config_vars import make_cfg
+from src.nix_conf import check_nix_conf, keeps_build_dependencies
+from src.utils import (STATE_DIRNAME, ind, print_fail, print_neutral, print_success, print_success_generic,
+                       set_log_dir)
+from src.config_vars import ConfigVars, make_cfg
 from src.dotfiles import update_dotfiles
-from src.paths import make_paths
-from src.install import install_node, download_node_configs, prompt_install_aiken, prompt_install_ogmios
+from src.launchers import write_launchers
+from src.local_cache import export_closures, use_local_cache
+from src.nix_gc import DEFAULT_KEEP_GENERATIONS, collect_garbage
+from src.preflight import check_build_parallelism, check_environment
+from src.paths import Network, NetworkPaths, Paths, node_alias
+from src.install import (CONFIG_BASE_URL, aiken_is_current, collect_config_blobs, download_node_configs,
+                         fetch_aiken_source, fetch_node_source, fetch_ogmios_source, install_aiken, install_node,
+                         install_ogmios, node_is_current, ogmios_assets_hash, ogmios_is_current, queue_install)
+from src.history import BASELINE_RUNS, REGRESSION_THRESHOLD, print_history, record_run
+from src.journal import Journal
+from src.choices import CHOICE_VARS, InstallChoices, parse_bool, parse_count, parse_networks, resolve_choices
+from src.nix_options import NixOptions
+from src.nix_profile import ProfileTransaction
+from src.substituters import configured_substituters, preflight_substituters, use_substituters
+from src.scheduler import DEFAULT_JOBS, Task, run_tasks
+from src.snapshot import SnapshotError, print_report, restore
+from src.trace import span, tracer
 
 VERSION = 0.3
 
 
-def install() -> None | NoReturn:
-    print(f"\n** Cardano-EZ-Installer v{VERSION} **")
-    # Check if Nix is installed
-    try:
-        subprocess.check_output(["nix", "--version"])
-    except OSError:
-        print("Error: Nix is not installed on this system.")
-        sys.exit(1)
-    nix_conf_ready = check_nix_conf()
+def install(
+        choices: InstallChoices, jobs: int = DEFAULT_JOBS, max_jobs: int | None = None,
+        build_cores: int | None = None, binary_cache: str | None = None,
+        export_cache: bool = False, resume: bool = False,
+        keep_generations: int = DEFAULT_KEEP_GENERATIONS, full_gc: bool = False) -> None | NoReturn:
+    started = time.time()
+    journal = Journal(os.environ.get('CARDANO_PATH'), resume)
+    opts = NixOptions()
+    with span("check environment"):
+        env = check_environment(choices['networks'])
+        if binary_cache:
+            use_local_cache(binary_cache, opts, os.environ.get('CARDANO_PATH'))
+        nix_conf_json = env['nix_conf']
+        nix_conf_ready = check_nix_conf(nix_conf_json)
 
-    cfg = make_cfg()
+    with span("check config variables"):
+        cfg, skipped = journal.run_step(
+            "check config variables",
+            {var: os.environ.get(var) for var in ConfigVars.__annotations__}, make_cfg)
+        if skipped:
+            print_success(ind("Skipping '.env' checks: variables unchanged since the previous run"))
 
-    if nix_conf_ready:
-        install_node(cfg)
-    else:
+    if not nix_conf_ready:
+        record_run(cfg, env, [net.value for net in choices['networks']], started, "failed", [],
+                   tracer.events)
         sys.exit(1)
 
-    paths = make_paths(cfg)
-    download_node_configs(paths)
-    update_dotfiles(paths)
-    prompt_install_aiken(cfg)
-    prompt_install_ogmios(cfg)
+    set_log_dir(os.path.join(cfg['CARDANO_PATH'], STATE_DIRNAME, 'logs'))
+
+    paths = Paths(cfg['CARDANO_PATH'], choices['networks'])
+    # Each step's inputs are journaled, so a --resume run can skip the steps completed
+    # with the same inputs
+    networks = [net.value for net in paths.networks]
+    tasks = [
+        Task("make paths", paths.make_paths, inputs=[cfg['CARDANO_PATH'], networks]),
+        Task("download configs", partial(download_node_configs, paths), ("make paths",),
+             inputs=[CONFIG_BASE_URL, networks]),
+        Task("update dotfiles", partial(update_dotfiles, paths), ("make paths",),
+             inputs=networks),
+        Task("write launchers", partial(write_launchers, paths, env['cores'], env['memory']),
+             ("make paths",), inputs=[networks, env['cores'], env['memory']]),
+    ]
+    # Components whose recorded install matches the desired state are left untouched
+    components = [
+        ("cardano-node", True, cfg['NODE_RELEASE'], node_is_current, fetch_node_source,
+         install_node),
+        ("aiken", choices['aiken'], cfg['AIKEN_RELEASE'], aiken_is_current, fetch_aiken_source,
+         install_aiken),
+        ("ogmios", choices['ogmios'], [cfg['OGMIOS_RELEASE'], ogmios_assets_hash()],
+         ogmios_is_current, fetch_ogmios_source, install_ogmios),
+    ]
+    # Builds only queue their outputs; the profile is then updated in one transaction
+    txn = ProfileTransaction()
+    builds = []
+    up_to_date = []
+    for name, wanted, version, is_current, fetch, install_component in components:
+        if not wanted:
+            continue
+        if is_current(cfg):
+            print_success(ind(f"{name} is already up to date"))
+            up_to_date.append(name)
+            continue
+        tasks += [
+            Task(f"fetch {name}", partial(fetch, cfg), inputs=[
+                version, os.environ.get('CLONE_MODE'), os.environ.get('GIT_MIRROR_PATH')]),
+            # A skipped build still has to be queued for the profile update
+            Task(f"build {name}", partial(install_component, cfg, txn, opts),
+                 (f"fetch {name}", "probe binary caches"), inputs=version,
+                 replay=partial(queue_install, cfg, txn)),
+        ]
+        builds.append(f"build {name}")
+    if builds:
+        # Builds can run at the same time, so they share the memory budget
+        check_build_parallelism(env, opts, min(len(builds), jobs), max_jobs, build_cores)
+        tasks.append(Task(
+            "probe binary caches", partial(preflight_substituters, nix_conf_json, opts),
+            inputs=configured_substituters(nix_conf_json, opts.local_caches),
+            replay=partial(use_substituters, nix_conf_json, opts)))
+    tasks.append(Task("update nix profile", txn.commit, tuple(builds), inputs=[]))
+    last_step = "update nix profile"
+    if binary_cache and export_cache:
+        tasks.append(Task(
+            "export binary cache", partial(export_closures, binary_cache, cfg['CARDANO_PATH']),
+            (last_step,), inputs=binary_cache))
+        last_step = "export binary cache"
+    if choices['gc']:
+        keep_build_deps = keeps_build_dependencies(nix_conf_json)
+        tasks.append(Task(
+            "collect garbage",
+            partial(collect_garbage, cfg['CARDANO_PATH'], keep_build_deps, keep_generations, full_gc),
+            (last_step,), inputs=[keep_generations, full_gc, keep_build_deps]))
+    # Every run is recorded in the history, with the phases it got through if it failed
+    try:
+        run_tasks(tasks, jobs, journal)
+    except BaseException:
+        record_run(cfg, env, networks, started, "failed", up_to_date, tracer.events)
+        raise
+    record_run(cfg, env, networks, started, "ok", up_to_date, tracer.events)
+    journal.finish()
 
     print_success(ind(
         f"Installation complete!\n"))
 
-    print("Run `preprod-node`, `preview-node`, or `main-node` in a new terminal window to start the node.")
+    aliases = [f"`{node_alias(net)}`" for net in paths.networks]
+    if len(aliases) > 1:
+        aliases = [', '.join(aliases[:-1]) + (',' if len(aliases) > 2 else ''), aliases[-1]]
+    print(f"Run {' or '.join(aliases)} in a new terminal window to start the node.")
+
+
+def exported_cardano_path() -> str | NoReturn:
+    cardano_path = os.environ.get('CARDANO_PATH')
+    if not cardano_path:
+        print_fail(ind("CARDANO_PATH: not exported in .env"))
+        sys.exit(1)
+    return cardano_path
+
+
+def gc_blobs() -> None | NoReturn:
+    collect_config_blobs(Paths(exported_cardano_path()))
+
+
+def report(runs: int, baseline: int, threshold: float) -> None | NoReturn:
+    if print_history(exported_cardano_path(), runs, baseline, threshold / 100):
+        sys.exit(1)
+
+
+def bootstrap(net: Network, source: str, checksums: str | None, jobs: int) -> None | NoReturn:
+    paths = Paths(exported_cardano_path(), [net])
+    network_paths: NetworkPaths = getattr(paths, net.value)
+    print_neutral(ind(f"Restoring the {net.value} database from {source}..."))
+    try:
+        report = restore(
+            network_paths.db, os.path.join(network_paths.path, ".bootstrap-progress.json"),
+            source, checksums, jobs)
+    except SnapshotError as e:
+        print_fail(ind(f"Error restoring the {net.value} database: {e}"))
+        sys.exit(1)
+    except (OSError, tarfile.TarError, KeyboardInterrupt) as e:
+        print_fail(ind(f"Restoring the {net.value} database was interrupted{f': {e}' if str(e) else ''}"))
+        print_neutral(ind("Run the same command again to resume."))
+        sys.exit(1)
+    print_report(report)
+    print_success_generic()
+
+
+def main() -> None | NoReturn:
+    parser = argparse.ArgumentParser(description="Cardano EZ-Installer")
+    subparsers = parser.add_subparsers(dest="command")
+    install_parser = subparsers.add_parser(
+        "install", help="install or update the node, cli, configs and tools (default)")
+    install_parser.add_argument(
+        "--trace", metavar="FILE",
+        help="write a timing trace of every step and command to FILE (Chrome trace-event JSON)")
+    install_parser.add_argument(
+        "--resume", action="store_true",
+        help="continue a failed or interrupted install, skipping the steps it completed "
+        "(unless their inputs have changed)")
+    install_parser.add_argument(
+        "-j", "--jobs", type=lambda val: parse_count("--jobs (or INSTALL_JOBS)", val, 1),
+        default=os.environ.get("INSTALL_JOBS") or str(DEFAULT_JOBS),
+        help=f"maximum number of install steps to run at once (default: $INSTALL_JOBS or {DEFAULT_JOBS})")
+    build_options = install_parser.add_argument_group(
+        "build parallelism",
+        "By default, as many derivations are built at once as fit in memory, with the cores "
+        "split between them (unless nix.conf sets max-jobs or cores). Components built at "
+        "the same time share max-jobs, each nix build getting its part.")
+    build_options.add_argument(
+        "--max-jobs", type=lambda val: parse_count("--max-jobs (or BUILD_MAX_JOBS)", val),
+        metavar="N", default=os.environ.get("BUILD_MAX_JOBS") or None,
+        help="number of derivations built at once, across all nix builds "
+        "(default: $BUILD_MAX_JOBS or auto)")
+    build_options.add_argument(
+        "--cores", type=lambda val: parse_count("--cores (or BUILD_CORES)", val), metavar="N",
+        default=os.environ.get("BUILD_CORES") or None,
+        help="cores each nix build may use, 0 for all (default: $BUILD_CORES or auto)")
+    cache_options = install_parser.add_argument_group(
+        "local binary cache",
+        "A directory (i.e. on a shared mount) that installs export their builds to and "
+        "substitute them from, so only the first host has to compile anything.")
+    cache_options.add_argument(
+        "--binary-cache", metavar="DIR", default=os.environ.get("LOCAL_BINARY_CACHE") or None,
+        help="substitute builds from the binary cache in DIR (default: $LOCAL_BINARY_CACHE)")
+    cache_options.add_argument(
+        "--export-cache", action=argparse.BooleanOptionalAction,
+        default=parse_bool("EXPORT_BINARY_CACHE", os.environ.get("EXPORT_BINARY_CACHE") or "n"),
+        help="copy the installed components into the --binary-cache directory, signed with "
+        "this host's key (default: $EXPORT_BINARY_CACHE or no)")
+    gc_options = install_parser.add_argument_group(
+        "nix-store clean-up",
+        "With --gc, the installed components and everything they were built with are kept, "
+        "so the next upgrade doesn't start from a cold build.")
+    gc_options.add_argument(
+        "--keep-generations", metavar="N",
+        type=lambda val: parse_count("--keep-generations (or NIX_GC_KEEP_GENERATIONS)", val, 1),
+        default=os.environ.get("NIX_GC_KEEP_GENERATIONS") or str(DEFAULT_KEEP_GENERATIONS),
+        help="number of nix profile generations to keep "
+        f"(default: $NIX_GC_KEEP_GENERATIONS or {DEFAULT_KEEP_GENERATIONS})")
+    gc_options.add_argument(
+        "--full-gc", action=argparse.BooleanOptionalAction,
+        default=parse_bool("NIX_GC_FULL", os.environ.get("NIX_GC_FULL") or "n"),
+        help="delete every old generation and unrooted store path instead (nix-collect-garbage "
+        "-d), including build dependencies (default: $NIX_GC_FULL or no)")
+    choice_options = install_parser.add_argument_group(
+        "install choices",
+        f"Answers that are not given here, in .env ({', '.join(CHOICE_VARS.values())}) or in a "
+        "profile file are asked for, or take their defaults with --non-interactive.")
+    choice_options.add_argument(
+        "-y", "--non-interactive", action="store_true",
+        help="never prompt: unanswered choices install everything and clean up the nix-store")
+    choice_options.add_argument(
+        "--profile", metavar="FILE", default=os.environ.get("INSTALL_PROFILE"),
+        help="read answers from a KEY=VALUE file (default: $INSTALL_PROFILE)")
+    choice_options.add_argument(
+        "--aiken", action=argparse.BooleanOptionalAction, help="install Aiken")
+    choice_options.add_argument(
+        "--ogmios", action=argparse.BooleanOptionalAction, help="install Ogmios")
+    choice_options.add_argument(
+        "--networks", type=lambda val: parse_networks("--networks", val),
+        help="comma-separated networks to set up (default: preprod,preview,mainnet)")
+    choice_options.add_argument(
+        "--gc", action=argparse.BooleanOptionalAction,
+        help="clean up the nix-store after installing")
+    status_parser = subparsers.add_parser(
+        "status", help="show the installed versions and the network paths, from recorded "
+        "state only (no network access or nix evaluation)")
+    status_parser.add_argument("--json", action="store_true", help="print the status as JSON")
+    subparsers.add_parser(
+        "gc-blobs", help="delete config blobs no longer linked from any network config directory")
+    report_parser = subparsers.add_parser(
+        "report", help="show recent install runs and flag phases that got slower "
+        "(exits with status 1 if any did)")
+    report_parser.add_argument(
+        "-n", "--runs", type=int, default=10, help="number of recent runs to list (default: 10)")
+    report_parser.add_argument(
+        "--baseline", type=int, default=BASELINE_RUNS, metavar="N",
+        help=f"number of earlier runs whose median is a phase's baseline (default: {BASELINE_RUNS})")
+    report_parser.add_argument(
+        "--threshold", type=float, default=REGRESSION_THRESHOLD * 100, metavar="PERCENT",
+        help="percentage by which a phase may be slower than its baseline before it is flagged "
+        f"(default: {REGRESSION_THRESHOLD * 100:.0f})")
+    bootstrap_parser = subparsers.add_parser(
+        "bootstrap", help="restore a network's node database from a snapshot archive")
+    bootstrap_parser.add_argument(
+        "network", type=Network, choices=list(Network), metavar="NETWORK",
+        help=f"network whose database to fill ({', '.join(net.value for net in Network)})")
+    bootstrap_parser.add_argument(
+        "source", metavar="SOURCE",
+        help="path or http(s) URL of a tar archive of the database (optionally gzip, bzip2, xz, "
+        "zstd or lz4 compressed). An interrupted restore resumes where it stopped for an "
+        "uncompressed archive, but reads a compressed one from the start again")
+    bootstrap_parser.add_argument(
+        "--checksums", metavar="FILE",
+        help="path or URL of a sha256sum list of the archive's files to verify them against")
+    bootstrap_parser.add_argument(
+        "-j", "--jobs", type=int, default=DEFAULT_JOBS,
+        help=f"number of files to write at once (default: {DEFAULT_JOBS})")
+
+    # `install` is the default command, so its options also work without naming it
+    argv = sys.argv[1:]
+    if not argv or argv[0] not in [*subparsers.choices, "-h", "--help"]:
+        argv = ["install", *argv]
+    args = parser.parse_args(argv)
+
+    if args.command == "status":
+        from src.status import main as status_main
+        status_main(args.json)
+    elif args.command == "gc-blobs":
+        gc_blobs()
+    elif args.command == "report":
+        report(args.runs, args.baseline, args.threshold)
+    elif args.command == "bootstrap":
+        bootstrap(args.network, args.source, args.checksums, args.jobs)
+    else:
+        print(f"\n** Cardano-EZ-Installer v{VERSION} **")
+        # Everything is settled up front so the whole install can be scheduled at once
+        choices = resolve_choices(
+            {choice: getattr(args, choice) for choice in CHOICE_VARS}, args.profile,
+            interactive=not args.non_interactive)
+        # Spans are always recorded, as they also make up the run history
+        tracer.enable()
+        try:
+            with span("install", jobs=args.jobs):
+                install(
+                    choices, args.jobs, args.max_jobs, args.cores, args.binary_cache,
+                    args.export_cache, args.resume, args.keep_generations, args.full_gc)
+        finally:
+            if args.trace:
+                tracer.write(args.trace)
 
 
-install()
+if __name__ == "__main__":
+    main()
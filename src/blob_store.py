@@ -0,0 +1,208 @@
+import errno
+import hashlib
+import os
+import re
+import shutil
+import tempfile
+import threading
+import time
+from typing import NamedTuple, TypedDict
+
+from .utils import read_json, state_path, write_json_atomic
+
+# ETags that are a hex digest of the content (i.e. S3/CDN-style MD5s) identify the same
+# bytes across URLs; other ETag schemes (mtime/size based) are only trusted per URL.
+_content_etag_re = re.compile(r'^"[0-9a-fA-F]{32,}"$')
+
+STALE_TMP_SECONDS = 24 * 60 * 60
+HASH_CHUNK_SIZE = 1024 * 1024
+
+UrlRecord = TypedDict('UrlRecord', {
+    'etag': str | None,
+    'last_modified': str | None,
+    'sha256': str,
+})
+
+
+class GcReport(NamedTuple):
+    removed: int
+    bytes_freed: int
+    kept: int
+
+
+def is_content_etag(etag: str | None) -> bool:
+    return etag is not None and bool(_content_etag_re.match(etag))
+
+
+class BlobStore():
+    """
+    Content-addressed store of downloaded files, keyed by SHA-256.
+    Destination paths are materialized as hardlinks to blobs (or symlinks across filesystems),
+    so identical files are stored once however many networks or CARDANO_PATH trees use them.
+    The store keeps an index of the URLs it has fetched, letting any tree that shares it
+    revalidate with conditional requests instead of downloading again.
+    """
+    root: str
+
+    def __init__(self, root: str):
+        self.root = root
+        os.makedirs(os.path.join(root, 'tmp'), exist_ok=True)
+        self._index_path = os.path.join(root, 'index.json')
+        self._links_path = os.path.join(root, 'links.json')
+        self.urls: dict[str, UrlRecord] = read_json(self._index_path, {})
+        self.links: dict[str, str] = read_json(self._links_path, {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_cardano_path(cls, cardano_path: str) -> 'BlobStore':
+        # CARDANO_BLOB_STORE lets several trees (or hosts on a shared mount) use one store
+        root = os.environ.get('CARDANO_BLOB_STORE') or \
+            os.path.dirname(state_path(cardano_path, 'blobs', 'index.json'))
+        return cls(root)
+
+    def blob_path(self, sha256: str) -> str:
+        return os.path.join(self.root, sha256[:2], sha256)
+
+    def has(self, sha256: str) -> bool:
+        return os.path.exists(self.blob_path(sha256))
+
+    def mkstemp(self) -> tuple[int, str]:
+        return tempfile.mkstemp(dir=os.path.join(self.root, 'tmp'))
+
+    def verify(self, sha256: str) -> bool:
+        """
+        Re-hashes a blob before it is reused, since a file linked to it may have been edited
+        in place. A blob that no longer matches its digest is removed.
+        """
+        path = self.blob_path(sha256)
+        digest = hashlib.sha256()
+        try:
+            with open(path, 'rb') as f:
+                while chunk := f.read(HASH_CHUNK_SIZE):
+                    digest.update(chunk)
+        except OSError:
+            return False
+        if digest.hexdigest() == sha256:
+            return True
+        os.unlink(path)
+        return False
+
+    def links_to(self, sha256: str, dest: str) -> bool:
+        try:
+            return os.path.samefile(self.blob_path(sha256), dest)
+        except OSError:
+            return False
+
+    def add(self, tmp_path: str, sha256: str) -> str:
+        """
+        Moves a fully written temp file into the store under its digest.
+        """
+        path = self.blob_path(sha256)
+        if os.path.exists(path) and self.verify(sha256):
+            os.unlink(tmp_path)
+            return path
+        os.makedirs(os.path.dirname(path), exist_ok=True)
+        os.chmod(tmp_path, 0o444)
+        os.replace(tmp_path, path)
+        return path
+
+    def candidates(self, url: str) -> dict[str, str]:
+        """
+        Returns ETag -> digest pairs that may answer a conditional request for `url`.
+        """
+        with self._lock:
+            found = {
+                rec['etag']: rec['sha256'] for rec in self.urls.values()
+                if is_content_etag(rec['etag']) and self.has(rec['sha256'])
+            }
+            own = self.urls.get(url)
+        if own and own['etag'] and self.has(own['sha256']):
+            found[own['etag']] = own['sha256']
+        return found
+
+    def record_url(self, url: str, etag: str | None, last_modified: str | None, sha256: str) -> None:
+        with self._lock:
+            self.urls[url] = {'etag': etag, 'last_modified': last_modified, 'sha256': sha256}
+
+    def materialize(self, sha256: str, dest: str, copy: bool = False) -> None:
+        """
+        Points `dest` at a blob, atomically replacing whatever was there. With `copy`, writes
+        a copy of it instead, for files users edit: an edit to a link would change the blob
+        for every destination sharing it.
+        """
+        blob = self.blob_path(sha256)
+        if not copy and self.links_to(sha256, dest):
+            return
+
+        tmp_dest = os.path.join(
+            os.path.dirname(dest), f".{os.path.basename(dest)}.{os.getpid()}.link")
+        if copy:
+            shutil.copyfile(blob, tmp_dest)
+            os.replace(tmp_dest, dest)
+            with self._lock:
+                self.links.pop(dest, None)
+            return
+        try:
+            os.link(blob, tmp_dest)
+            linked = True
+        except OSError as e:
+            if e.errno not in (errno.EXDEV, errno.EPERM, errno.EMLINK):
+                raise
+            os.symlink(blob, tmp_dest)
+            linked = False
+        os.replace(tmp_dest, dest)
+
+        with self._lock:
+            if linked:
+                self.links.pop(dest, None)
+            else:
+                self.links[dest] = sha256
+
+    def save(self) -> None:
+        with self._lock:
+            write_json_atomic(self._index_path, self.urls)
+            write_json_atomic(self._links_path, self.links)
+
+    def gc(self) -> GcReport:
+        """
+        Deletes blobs that no destination links to any more.
+        Hardlinked blobs are live while their link count is above 1; symlinked ones are
+        tracked in the links registry.
+        """
+        with self._lock:
+            live_links = {
+                dest: sha for dest, sha in self.links.items()
+                if os.path.realpath(dest) == self.blob_path(sha)
+            }
+            self.links = live_links
+        symlinked = set(live_links.values())
+
+        removed = 0
+        bytes_freed = 0
+        kept = 0
+        for dirpath, _, filenames in os.walk(self.root):
+            if os.path.basename(dirpath) == 'tmp':
+                # Leftovers from interrupted downloads (recent ones may still be in flight)
+                for filename in filenames:
+                    path = os.path.join(dirpath, filename)
+                    if time.time() - os.stat(path).st_mtime > STALE_TMP_SECONDS:
+                        os.unlink(path)
+                continue
+            for filename in filenames:
+                if len(filename) != 64:
+                    continue
+                path = os.path.join(dirpath, filename)
+                st = os.stat(path)
+                if st.st_nlink > 1 or filename in symlinked:
+                    kept += 1
+                    continue
+                os.unlink(path)
+                removed += 1
+                bytes_freed += st.st_size
+
+        with self._lock:
+            self.urls = {
+                url: rec for url, rec in self.urls.items() if self.has(rec['sha256'])
+            }
+        self.save()
+        return GcReport(removed, bytes_freed, kept)
@@ -0,0 +1,141 @@
+import os
+import shlex
+import sys
+from typing import Any, NoReturn, TypedDict
+
+from .paths import Network
+from .utils import ind, print_fail
+
+InstallChoices = TypedDict('InstallChoices', {
+    'aiken': bool,
+    'ogmios': bool,
+    'networks': list[Network],
+    'gc': bool,
+})
+
+# Choice -> variable that sets it in .env or a profile file
+CHOICE_VARS = {
+    'aiken': 'INSTALL_AIKEN',
+    'ogmios': 'INSTALL_OGMIOS',
+    'networks': 'CARDANO_NETWORKS',
+    'gc': 'NIX_GC',
+}
+
+CHOICE_PROMPTS = {
+    'aiken': "Do you want to install Aiken? (Y/n): ",
+    'ogmios': "Do you want to install Ogmios? (Y/n): ",
+    'gc': "Clean up nix-store after installing? (Y/n): ",
+}
+
+# Answers used for anything not set when running non-interactively
+DEFAULT_CHOICES: InstallChoices = {
+    'aiken': True,
+    'ogmios': True,
+    'networks': list(Network),
+    'gc': True,
+}
+
+
+def read_profile(path: str) -> dict[str, str] | NoReturn:
+    """
+    Reads KEY=VALUE lines (optionally prefixed with `export`, as in .env) from a profile file.
+    """
+    values = {}
+    try:
+        with open(path, 'r') as f:
+            lines = f.readlines()
+    except OSError as e:
+        print_fail(ind(f"Unable to read install profile '{path}' ({e})"))
+        sys.exit(1)
+    for number, line in enumerate(lines, 1):
+        try:
+            words = shlex.split(line, comments=True)
+        except ValueError as e:
+            print_fail(ind(f"Unable to read install profile '{path}' (line {number}: {e})"))
+            sys.exit(1)
+        if words[:1] == ['export']:
+            words = words[1:]
+        for word in words:
+            key, sep, value = word.partition('=')
+            if sep:
+                values[key] = value
+    return values
+
+
+def parse_bool(var: str, val: str) -> bool | NoReturn:
+    if val.lower() in ['y', 'yes', 'true', '1']:
+        return True
+    if val.lower() in ['n', 'no', 'false', '0']:
+        return False
+    print_fail(ind(f"{var}: expected 'y' or 'n', got '{val}'"))
+    sys.exit(1)
+
+
+def parse_count(var: str, val: str, minimum: int = 0) -> int | NoReturn:
+    try:
+        count = int(val)
+    except ValueError:
+        count = minimum - 1
+    if count < minimum:
+        print_fail(ind(f"{var}: expected a whole number of at least {minimum}, got '{val}'"))
+        sys.exit(1)
+    return count
+
+
+def parse_networks(var: str, val: str) -> list[Network] | NoReturn:
+    names = val.replace(',', ' ').split()
+    valid = [net.value for net in Network]
+    invalid = [name for name in names if name not in valid]
+    if invalid or not names:
+        print_fail(ind(
+            f"{var}: expected one or more of {', '.join(valid)}, got '{val}'"))
+        sys.exit(1)
+    return [net for net in Network if net.value in names]
+
+
+def prompt_yes_no(prompt: str) -> bool | NoReturn:
+    while True:
+        try:
+            user_input = input(prompt).lower()
+        except EOFError:
+            print_fail(f"\n{ind('No answer given: use --non-interactive for unattended installs.')}")
+            sys.exit(1)
+        print("")
+
+        if user_input == 'y' or user_input == '':
+            return True
+        elif user_input == 'n':
+            return False
+        else:
+            print("Invalid response. Please enter 'Y' or 'N'.")
+            continue
+
+
+def resolve_choices(
+        cli: dict[str, Any], profile_path: str | None,
+        interactive: bool) -> InstallChoices | NoReturn:
+    """
+    Settles every install choice before anything runs. Each choice comes from the command
+    line, then the environment (.env), then the profile file; anything still unset is
+    asked for, or takes its default when running non-interactively.
+    """
+    profile = read_profile(profile_path) if profile_path else {}
+    choices: dict[str, Any] = {}
+    for choice, var in CHOICE_VARS.items():
+        parse = parse_networks if choice == 'networks' else parse_bool
+        if cli.get(choice) is not None:
+            choices[choice] = cli[choice]
+        elif os.environ.get(var):
+            choices[choice] = parse(var, os.environ[var])
+        elif profile.get(var):
+            choices[choice] = parse(f"{var} ({profile_path})", profile[var])
+        elif interactive and choice in CHOICE_PROMPTS:
+            choices[choice] = prompt_yes_no(CHOICE_PROMPTS[choice])
+        else:
+            choices[choice] = DEFAULT_CHOICES[choice]
+    return {
+        'aiken': choices['aiken'],
+        'ogmios': choices['ogmios'],
+        'networks': choices['networks'],
+        'gc': choices['gc'],
+    }
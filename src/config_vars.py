@@ -1,9 +1,9 @@
-import json
 import os
 import sys
-import urllib.request
 from typing import Callable, NoReturn, TypedDict
 
+from .release_index import ReleaseIndex
+from .releases import ReleaseChecks, check_releases
 from .utils import ind, ind2, print_fail, print_neutral, print_success
 
 
@@ -26,37 +26,32 @@ def get_var(var: str, validate: Callable[[str],
     return (val if not err else None, err)
 
 
-def check_release_var(org: str, repo: str, release: str) -> str | None:
-    tags_url = f"https://api.github.com/repos/{org}/{repo}/releases"
-    req = urllib.request.Request(tags_url)
-    req.add_header("User-Agent", "Mozilla/5.0")
+# .env release variable -> (org, repo, tag prefix)
+# aiken and ogmios prefix release tags with 'v' (but we omit this in .env)
+RELEASE_REPOS = {
+    'NODE_RELEASE': ("input-output-hk", "cardano-node", ""),
+    'AIKEN_RELEASE': ("aiken-lang", "aiken", "v"),
+    'OGMIOS_RELEASE': ("CardanoSolutions", "ogmios", "v"),
+}
 
-    try:
-        with urllib.request.urlopen(req) as response:
-            data = response.read().decode()
-            releases = json.loads(data)
-            tags = [release["tag_name"] for release in releases]
-            err = None if release in tags else f"{release} is not a valid tag."
 
-            return err
+def check_release_vars() -> dict[str, str | None]:
+    """
+    Validates every exported release variable concurrently.
+    Tags already present in local clones or the release index under CARDANO_PATH
+    are accepted without a network call.
+    """
+    checks: ReleaseChecks = {}
+    for var, (org, repo, prefix) in RELEASE_REPOS.items():
+        release = os.environ.get(var)
+        if release:
+            checks[var] = (org, repo, f"{prefix}{release}")
 
-    except Exception as e:
-        error_message = f"An error occurred with call to GitHub API: {e}"
-        return error_message
-
-
-def check_node_release_var(release: str) -> str | None:
-    check_release_var("input-output-hk", "cardano-node", release)
-
-
-def check_aiken_release_var(release: str) -> str | None:
-    # aiken prefixes release tags with 'v' (but we omit this in .env)
-    check_release_var("aiken-lang", "aiken", f"v{release}")
-
-
-def check_ogmios_release_var(release: str) -> str | None:
-    # ogmios prefixes release tags with 'v' (but we omit this in .env)
-    check_release_var("CardanoSolutions", "ogmios", f"v{release}")
+    cardano_path = os.environ.get('CARDANO_PATH')
+    src_path = os.environ.get('CARDANO_SRC_PATH')
+    index = ReleaseIndex.for_cardano_path(cardano_path) \
+        if cardano_path and not check_path_var(cardano_path) else None
+    return check_releases(checks, index, src_path)
 
 
 def check_path_var(val: str) -> str | None:
@@ -70,10 +65,10 @@ def check_path_var(val: str) -> str | None:
 
 def make_cfg() -> ConfigVars | NoReturn:
     print_neutral(f'\n{ind("Checking .env variables...")}')
+    release_errs = check_release_vars()
     var_checks = {
-        'NODE_RELEASE': check_node_release_var,
-        'AIKEN_RELEASE': check_aiken_release_var,
-        'OGMIOS_RELEASE': check_ogmios_release_var,
+        **{var: (lambda _, var=var: release_errs.get(var))
+           for var in RELEASE_REPOS},
         'CARDANO_SRC_PATH': check_path_var,
         'CARDANO_PATH': check_path_var,
     }
@@ -1,11 +1,10 @@
+import hashlib
 import os
 import platform
-import shutil
 import tempfile
-from itertools import groupby
-from typing import Generator, NoReturn
-from .paths import Network, NetworkPaths, Paths
-from .utils import ind, print_fail, print_neutral, print_success_generic
+from typing import Iterable, Iterator, NoReturn
+from .paths import Network, Paths, node_alias
+from .utils import ind, print_fail, print_neutral, print_success, print_success_generic
 
 # Nix daemon failsafe for MacOS users
 daemon_path = "'/nix/var/nix/profiles/default/etc/profile.d/nix-daemon.sh'"
@@ -14,44 +13,112 @@ daemon_snippet_lines = [
     f"[ -e {daemon_path} ] && . {daemon_path}" + "\n",
     "# End Nix\n"]
 
+# The socket variable and aliases are kept between these markers
+BLOCK_START = "# >>> cardano-ez-installer >>>\n"
+BLOCK_END = "# <<< cardano-ez-installer <<<\n"
 
-def remove_excess_newlines(lines: list[str]) -> Generator[str, None, None]:
+
+# Lines written outside the block by earlier versions, removed wherever they are
+LEGACY_PREFIXES = (
+    "export CARDANO_NODE_SOCKET_PATH",
+    *(f"alias {node_alias(net)}=" for net in Network),
+)
+
+
+def remove_excess_newlines(lines: Iterable[str]) -> Iterator[str]:
     """
-    Prevents accumulation of newlines in dotfiles by removing consecutive newlines in excess of 2.
+    Prevents accumulation of newlines in dotfiles by collapsing runs of blank lines into one.
+    Other lines are passed through untouched.
     """
-    for _, group in groupby(lines, key=lambda line: line.strip() == ""):
-        lines_in_group = list(group)
-        if not lines_in_group[0].strip():
-            yield "\n" if len(lines_in_group) <= 2 else ""
+    blank = False
+    for line in lines:
+        if not line.strip():
+            if not blank:
+                yield "\n"
+            blank = True
         else:
-            yield "\n".join(line.strip() for line in lines_in_group) + "\n"
+            yield line
+            blank = False
 
 
-def overwrite_dotfile_safely(
-        dotfile_path: str, new_content: list[str]) -> None | NoReturn:
+def with_managed_block(
+        lines: Iterable[str], block: list[str], is_darwin: bool) -> Iterator[str]:
     """
-    Creates a temporary backup of a given dotfile before overwriting its contents.
-    Restores the backup if an exception occurs.
+    Yields a dotfile's lines with its managed block replaced by `block` (or `block` appended,
+    if it has none). On darwin the Nix daemon failsafe is moved to the top.
     """
+    if is_darwin:
+        yield from [*daemon_snippet_lines, "\n"]
+
+    def keep(line: str) -> bool:
+        return not line.startswith(LEGACY_PREFIXES) and \
+            not (is_darwin and line.strip() + "\n" in daemon_snippet_lines)
+
+    # Lines of an old block are held back until its end marker, so a block whose end
+    # marker was deleted doesn't swallow the rest of the file
+    old_block: list[str] | None = None
+    block_written = False
+    last_line = "\n"
+    for line in lines:
+        if not line.endswith("\n"):
+            line += "\n"
+        if old_block is not None:
+            if line == BLOCK_END:
+                old_block = None
+            else:
+                old_block.append(line)
+            continue
+        if line == BLOCK_START:
+            old_block = []
+            if not block_written:
+                yield from block
+                block_written = True
+            continue
+        if keep(line):
+            yield line
+            last_line = line
+    if old_block:
+        yield from filter(keep, old_block)
+    elif not block_written:
+        if last_line.strip():
+            yield "\n"
+        yield from block
+
+
+def update_dotfile(path: str, block: list[str], is_darwin: bool) -> bool:
+    """
+    Rewrites a dotfile in one streaming pass into a sibling temp file, which replaces the
+    original (keeping its permissions) with an atomic rename. If the content is unchanged,
+    the temp file is discarded and the dotfile isn't touched. Returns whether it was written.
+    """
+    # Dotfiles are often symlinks (i.e. into a dotfiles repo): update their target
+    path = os.path.realpath(path)
+    old_hash, new_hash = hashlib.sha256(), hashlib.sha256()
 
-    temp_dir = tempfile.mkdtemp()
-    filename = os.path.basename(dotfile_path)
-    backup_path = os.path.join(temp_dir, f"{filename}.bak")
+    def read_lines(f) -> Iterator[str]:
+        for raw in f:
+            old_hash.update(raw)
+            yield raw.decode(errors='surrogateescape')
 
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
     try:
-        shutil.copy2(dotfile_path, backup_path)
-        with open(dotfile_path, 'w') as dotfile:
-            dotfile.writelines(remove_excess_newlines(new_content))
-        print_success_generic()
-
-    except:
-        print_fail(
-            f'\n{ind(f"An error occurred updating {dotfile_path}: restoring original file.")}\n')
-        shutil.copy2(backup_path, dotfile_path)
-
-    finally:
-        shutil.rmtree(temp_dir)
-        # sys.exit(1) # exit here?
+        with open(path, 'rb') as src, os.fdopen(fd, 'wb') as dst:
+            new_lines = remove_excess_newlines(
+                with_managed_block(read_lines(src), block, is_darwin))
+            for line in new_lines:
+                raw = line.encode(errors='surrogateescape')
+                new_hash.update(raw)
+                dst.write(raw)
+        if new_hash.digest() == old_hash.digest():
+            os.unlink(tmp_path)
+            return False
+        os.chmod(tmp_path, os.stat(path).st_mode & 0o7777)
+        os.replace(tmp_path, path)
+        return True
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
 
 
 def update_dotfiles(paths: Paths) -> None | NoReturn:
@@ -64,27 +131,16 @@ def update_dotfiles(paths: Paths) -> None | NoReturn:
     dotfiles = ['.bash_profile', '.bashrc', '.zprofile',
                 '.zshrc'] if is_darwin else ['.bashrc']
 
-    def make_alias(net: Network) -> tuple[str, str]:
-        node_alias = f"{'main' if net.value == 'mainnet' else net.value}-node"
-        network_paths: NetworkPaths = getattr(paths, net.value)
-        config_path = network_paths.config
-        db_path = network_paths.db
-        topology = f"--topology {config_path}/topology.json"
-        database = f"--database-path {db_path}"
-        socket = f"--socket-path $CARDANO_NODE_SOCKET_PATH"
-        port = "--port 1337"
-        config = f"--config {config_path}/config.json"
-
-        return (f"alias {node_alias}=", f"'cardano-node run {topology} {database} {socket} {port} {config}'\n")
-
-    alias_chunks = [make_alias(net) for net in Network]
-    aliases = [f"{alias}{value}" for alias, value in alias_chunks]
+    # The launchers in CARDANO_PATH/bin hold the node options for each network
+    def make_alias(net: Network) -> str:
+        return f"alias {node_alias(net)}='{os.path.join(paths.bin, node_alias(net))}'\n"
 
-    def is_alias_or_socket_path(line: str) -> bool:
-        is_alias = any(line.startswith(prefix) for prefix, _ in alias_chunks)
-        is_socket_path = line.startswith("export CARDANO_NODE_SOCKET_PATH")
-
-        return is_alias or is_socket_path
+    block = [
+        BLOCK_START,
+        f"export CARDANO_NODE_SOCKET_PATH='{paths.socket}'\n",
+        *[make_alias(net) for net in paths.networks],
+        BLOCK_END,
+    ]
 
     for dotfile in dotfiles:
         file_path = os.path.expanduser(f"~/{dotfile}")
@@ -92,25 +148,16 @@ def update_dotfiles(paths: Paths) -> None | NoReturn:
             print_neutral(ind(f"Creating '{file_path}' file..."))
             open(file_path, 'a').close()
 
-        print_neutral(ind(
-            f"Adding {'Nix daemon failsafe, ' if is_darwin else ''}socket variable and aliases to '{file_path}'"))
-
-        with open(file_path, 'r') as f:
-            lines = f.readlines()
-            new_socket = f"export CARDANO_NODE_SOCKET_PATH='{paths.socket}'\n"
-            common_content = [new_socket, *aliases]
-
-            linux_content = [
-                line for line in lines
-                if not is_alias_or_socket_path(line)
-            ] + common_content
-            # Add Nix daemon failsafe to user dotfiles on darwin
-            # (Prevents breakage of Nix from MacOS system updates)
-            darwin_content = [*daemon_snippet_lines, "\n"] + [
-                line for line in lines
-                if
-                not is_alias_or_socket_path(line) and
-                not line.strip() + "\n" in daemon_snippet_lines] + common_content
-
-        overwrite_dotfile_safely(
-            file_path, darwin_content if is_darwin else linux_content)
+        try:
+            updated = update_dotfile(file_path, block, is_darwin)
+        except OSError as e:
+            print_fail(
+                f'\n{ind(f"An error occurred updating {file_path} ({e}): the file was left unchanged.")}\n')
+            continue
+
+        if updated:
+            print_neutral(ind(
+                f"Added {'Nix daemon failsafe, ' if is_darwin else ''}socket variable and aliases to '{file_path}'"))
+            print_success_generic()
+        else:
+            print_success(ind(f"'{file_path}' is already up to date"))
@@ -0,0 +1,192 @@
+import hashlib
+import http.client
+import os
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import NamedTuple, TypedDict
+
+from .blob_store import BlobStore
+from .http_pool import HttpPool
+from .utils import read_json, write_json_atomic
+
+CHUNK_SIZE = 64 * 1024
+MAX_CONDITIONAL_ETAGS = 64
+
+ManifestEntry = TypedDict('ManifestEntry', {
+    'url': str,
+    'etag': str | None,
+    'last_modified': str | None,
+    'sha256': str,
+    'size': int,
+    'mtime_ns': int,
+})
+
+
+class DownloadJob(NamedTuple):
+    url: str
+    dest: str
+    # Written as a copy rather than a link to the shared blob, for files users edit
+    copy: bool = False
+
+
+class DownloadReport(NamedTuple):
+    fetched: list[str]
+    unchanged: list[str]
+    bytes_received: int
+
+
+class DownloadError(Exception):
+    def __init__(self, job: DownloadJob, reason: str):
+        super().__init__(f"Error downloading '{os.path.basename(job.dest)}': {reason}")
+        self.job = job
+
+
+class Downloader():
+    """
+    Fetches files concurrently over pooled keep-alive connections into a blob store.
+    A manifest (ETag, Last-Modified and SHA-256 per destination) lets unchanged files be
+    revalidated with conditional GETs and skipped. Content the store already holds (from
+    another network, tree or host) is matched by ETag and linked in without a download.
+    """
+    manifest_path: str
+    manifest: dict[str, ManifestEntry]
+    store: BlobStore
+
+    def __init__(
+            self, manifest_path: str, store: BlobStore,
+            max_workers: int = 8, timeout: float = 30.0):
+        self.manifest_path = manifest_path
+        self.manifest = read_json(manifest_path, {})
+        self.store = store
+        self.max_workers = max_workers
+        self.timeout = timeout
+        self._lock = threading.Lock()
+
+    def _cached_entry(self, job: DownloadJob) -> ManifestEntry | None:
+        """
+        Returns the manifest entry for a destination if the file on disk still matches it.
+        """
+        entry = self.manifest.get(job.dest)
+        if entry is None or entry['url'] != job.url:
+            return None
+        try:
+            st = os.stat(job.dest)
+        except OSError:
+            return None
+        if st.st_size != entry['size'] or st.st_mtime_ns != entry['mtime_ns']:
+            return None
+        return entry
+
+    def _record(
+            self, job: DownloadJob, etag: str | None, last_modified: str | None,
+            sha256: str) -> None:
+        self.store.record_url(job.url, etag, last_modified, sha256)
+        st = os.stat(job.dest)
+        with self._lock:
+            self.manifest[job.dest] = {
+                'url': job.url,
+                'etag': etag,
+                'last_modified': last_modified,
+                'sha256': sha256,
+                'size': st.st_size,
+                'mtime_ns': st.st_mtime_ns,
+            }
+
+    def _fetch(self, pool: HttpPool, job: DownloadJob) -> int | None:
+        """
+        Returns the number of bytes received, or None if no download was needed.
+        """
+        entry = self._cached_entry(job)
+        candidates = self.store.candidates(job.url)
+        if entry and entry['etag']:
+            candidates.setdefault(entry['etag'], entry['sha256'])
+        headers = {}
+        if candidates:
+            headers["If-None-Match"] = ", ".join(
+                list(candidates)[-MAX_CONDITIONAL_ETAGS:])
+        if entry and entry['last_modified']:
+            headers["If-Modified-Since"] = entry['last_modified']
+
+        with pool.open(job.url, headers) as response:
+            etag = response.getheader("ETag")
+            if response.status == 304:
+                last_modified = response.getheader("Last-Modified")
+                if etag in candidates:
+                    sha256 = candidates[etag]
+                elif entry:
+                    sha256 = entry['sha256']
+                    etag, last_modified = entry['etag'], entry['last_modified']
+                else:
+                    sha256 = None
+                if sha256 and self.store.has(sha256):
+                    # Unchanged on disk since recorded, and not a link that should be a copy
+                    if entry and entry['sha256'] == sha256 and \
+                            not (job.copy and self.store.links_to(sha256, job.dest)):
+                        return None
+                    if self.store.verify(sha256):
+                        self.store.materialize(sha256, job.dest, job.copy)
+                        self._record(job, etag, last_modified, sha256)
+                        return None
+            elif response.status != 200:
+                raise DownloadError(job, f"HTTP {response.status}")
+            else:
+                return self._receive(job, response)
+
+        # A 304 we can't map to an intact stored blob: fall back to an unconditional download
+        with pool.open(job.url) as response:
+            if response.status != 200:
+                raise DownloadError(job, f"HTTP {response.status}")
+            return self._receive(job, response)
+
+    def _receive(self, job: DownloadJob, response: http.client.HTTPResponse) -> int:
+        sha256 = hashlib.sha256()
+        size = 0
+        fd, tmp_path = self.store.mkstemp()
+        try:
+            with os.fdopen(fd, 'wb') as f:
+                while chunk := response.read(CHUNK_SIZE):
+                    sha256.update(chunk)
+                    size += len(chunk)
+                    f.write(chunk)
+            digest = sha256.hexdigest()
+            self.store.add(tmp_path, digest)
+        except BaseException:
+            if os.path.exists(tmp_path):
+                os.unlink(tmp_path)
+            raise
+        self.store.materialize(digest, job.dest, job.copy)
+        self._record(
+            job, response.getheader("ETag"), response.getheader("Last-Modified"), digest)
+        return size
+
+    def fetch_all(self, jobs: list[DownloadJob]) -> DownloadReport:
+        fetched: list[str] = []
+        unchanged: list[str] = []
+        bytes_received = 0
+        errors = []
+        pool = HttpPool(timeout=self.timeout)
+        try:
+            with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+                futures = [(job, executor.submit(self._fetch, pool, job)) for job in jobs]
+                for job, future in futures:
+                    try:
+                        size = future.result()
+                    except DownloadError as e:
+                        errors.append(e)
+                        continue
+                    except Exception as e:
+                        errors.append(DownloadError(job, str(e)))
+                        continue
+                    if size is None:
+                        unchanged.append(job.dest)
+                    else:
+                        fetched.append(job.dest)
+                        bytes_received += size
+        finally:
+            pool.close()
+            write_json_atomic(self.manifest_path, self.manifest)
+            self.store.save()
+
+        if errors:
+            raise errors[0]
+        return DownloadReport(fetched, unchanged, bytes_received)
@@ -0,0 +1,171 @@
+import hashlib
+import json
+import os
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple, NoReturn, TypedDict
+
+from .blob_store import BlobStore
+from .paths import NetworkPaths, Paths
+from .utils import (ind, ind2, print_fail, print_neutral, print_success_generic, read_json,
+                    state_path, write_json_atomic)
+
+GENESIS_ERAS = ["Byron", "Shelley", "Alonzo", "Conway"]
+HASH_CHUNK_BYTES = 1024 * 1024
+
+DigestEntry = TypedDict('DigestEntry', {
+    'ino': int,
+    'size': int,
+    'mtime_ns': int,
+    'digest': str,
+})
+
+
+class GenesisCheck(NamedTuple):
+    network: str
+    # None for the network's config.json itself, when it can't be read
+    era: str | None
+    path: str
+    expected: str | None
+    actual: str | None
+
+
+def canonical_json(value: Any) -> bytes:
+    """
+    Renders JSON the way the node does before hashing the Byron genesis: sorted keys, no
+    whitespace, and only '"' and '\\' escaped in strings.
+    """
+    if isinstance(value, dict):
+        return b"{" + b",".join(
+            canonical_json(k) + b":" + canonical_json(value[k]) for k in sorted(value)) + b"}"
+    if isinstance(value, list):
+        return b"[" + b",".join(canonical_json(v) for v in value) + b"]"
+    if isinstance(value, str):
+        return b'"' + value.replace("\\", "\\\\").replace('"', '\\"').encode() + b'"'
+    if isinstance(value, bool) or value is None:
+        return json.dumps(value).encode()
+    if isinstance(value, int):
+        return str(value).encode()
+    raise ValueError(f"canonical JSON has no representation for {value!r}")
+
+
+def genesis_digest(era: str, path: str) -> str:
+    """
+    Blake2b-256 of a genesis file as the node computes it: of the canonical JSON for Byron,
+    of the raw bytes (streamed) for later eras.
+    """
+    h = hashlib.blake2b(digest_size=32)
+    with open(path, 'rb') as f:
+        if era == "Byron":
+            h.update(canonical_json(json.load(f)))
+        else:
+            while chunk := f.read(HASH_CHUNK_BYTES):
+                h.update(chunk)
+    return h.hexdigest()
+
+
+class DigestCache():
+    """
+    Genesis digests keyed by path, reused while the file's inode, size and mtime are
+    unchanged, so unchanged files are never hashed again.
+    """
+    path: str
+    entries: dict[str, DigestEntry]
+    hashed: int
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = read_json(path, {})
+        self.hashed = 0
+        self._lock = threading.Lock()
+
+    def digest(self, era: str, path: str) -> str:
+        st = os.stat(path)
+        key = f"{era}:{os.path.realpath(path)}"
+        entry = self.entries.get(key)
+        if entry is not None and (entry['ino'], entry['size'], entry['mtime_ns']) == \
+                (st.st_ino, st.st_size, st.st_mtime_ns):
+            return entry['digest']
+        digest = genesis_digest(era, path)
+        with self._lock:
+            self.entries[key] = {
+                'ino': st.st_ino, 'size': st.st_size, 'mtime_ns': st.st_mtime_ns, 'digest': digest}
+            self.hashed += 1
+        return digest
+
+    def save(self) -> None:
+        if self.hashed:
+            write_json_atomic(self.path, self.entries)
+
+
+def check_network(network_paths: NetworkPaths, network: str, cache: DigestCache) -> list[GenesisCheck]:
+    config_dir = network_paths.config
+    config_path = os.path.join(config_dir, "config.json")
+    try:
+        with open(config_path) as f:
+            config = json.load(f)
+        if not isinstance(config, dict):
+            raise ValueError("not a JSON object")
+    except (OSError, ValueError):
+        # i.e. an error page served in its place: the genesis files can't be checked
+        return [GenesisCheck(network, None, config_path, None, None)]
+    checks = []
+    for era in GENESIS_ERAS:
+        expected = config.get(f"{era}GenesisHash")
+        file = config.get(f"{era}GenesisFile")
+        if not expected or not file:
+            continue
+        path = os.path.join(config_dir, file)
+        try:
+            actual = cache.digest(era, path)
+        except (OSError, ValueError):
+            actual = None
+        checks.append(GenesisCheck(network, era, path, expected, actual))
+    return checks
+
+
+def discard(paths: Paths, path: str) -> None:
+    """
+    Removes a mismatched or unreadable file so the next config download fetches it again, along
+    with its blob if that is the same (corrupt) file, since it would be linked straight back.
+    """
+    entry = read_json(state_path(paths.cardano_path, 'config-manifest.json'), {}).get(path)
+    if entry is not None:
+        blob = BlobStore.for_cardano_path(paths.cardano_path).blob_path(entry['sha256'])
+        if os.path.exists(blob) and os.path.exists(path) and os.path.samefile(blob, path):
+            os.remove(blob)
+    if os.path.lexists(path):
+        os.remove(path)
+
+
+def verify_genesis(paths: Paths) -> None | NoReturn:
+    """
+    Checks every network's genesis files against the hashes in its config.json, which the
+    node would otherwise only reject at startup.
+    """
+    print_neutral(ind("Verifying genesis files..."))
+    cache = DigestCache(state_path(paths.cardano_path, 'genesis-digests.json'))
+    with ThreadPoolExecutor(max_workers=len(paths.networks) or 1) as pool:
+        results = pool.map(
+            lambda net: check_network(getattr(paths, net.value), net.value, cache), paths.networks)
+        checks = [check for network_checks in results for check in network_checks]
+    cache.save()
+
+    failed = [check for check in checks if check.era is None or check.actual != check.expected]
+    for check in failed:
+        if check.era is None:
+            print_fail(ind2(f"* {check.network}: {check.path} is unreadable or not valid JSON"))
+            continue
+        found = "unreadable" if check.actual is None else f"hash {check.actual}"
+        print_fail(ind2(
+            f"* {check.network}: {check.path} is {found}, "
+            f"but config.json expects {check.era}GenesisHash {check.expected}"))
+    if failed:
+        for check in failed:
+            discard(paths, check.path)
+        print_fail(ind("Removed these files; run the installer again to download them"))
+        sys.exit(1)
+
+    print_neutral(ind2(f"{len(checks)} genesis files verified ({cache.hashed} hashed)"))
+    print_success_generic()
@@ -0,0 +1,146 @@
+import os
+import sys
+from typing import NoReturn
+
+from .install_record import tag_commit
+from .utils import ind, print_fail, print_neutral, run, run_quiet
+
+# full: complete history of the release tag
+# partial: complete commit history, file contents fetched only for the checked-out tree
+# shallow: only the release commit itself
+CLONE_MODES = ['full', 'partial', 'shallow']
+DEFAULT_CLONE_MODE = 'full'
+
+
+def clone_mode() -> str | NoReturn:
+    mode = os.environ.get('CLONE_MODE') or DEFAULT_CLONE_MODE
+    if mode not in CLONE_MODES:
+        print_fail(ind(
+            f"CLONE_MODE: '{mode}' is not one of {', '.join(CLONE_MODES)}"))
+        sys.exit(1)
+    return mode
+
+
+def is_shallow(repo_path: str) -> bool:
+    return os.path.exists(os.path.join(repo_path, '.git', 'shallow'))
+
+
+def has_tag(repo_path: str, release: str) -> bool:
+    return tag_commit(repo_path, release) is not None
+
+
+def repo_dirname(repo_url: str) -> str:
+    return os.path.basename(repo_url.rstrip('/')).removesuffix('.git')
+
+
+def tag_refspec(release: str) -> str:
+    return f"+refs/tags/{release}:refs/tags/{release}"
+
+
+def update_mirror(mirror_root: str, repo_url: str, release: str, name: str) -> str | NoReturn:
+    """
+    Makes sure a bare reference mirror under `mirror_root` has the release tag.
+    Returns the mirror's object directory, for use as an alternate.
+    """
+    mirror_path = os.path.join(mirror_root, f"{repo_dirname(repo_url)}.git")
+    if not os.path.exists(mirror_path):
+        os.makedirs(mirror_root, exist_ok=True)
+        run_quiet(
+            ["git", "init", "--bare", "--quiet", mirror_path],
+            f"Error creating {name} reference mirror")
+        run_quiet(
+            ["git", "remote", "add", "origin", repo_url],
+            f"Error configuring {name} reference mirror", cwd=mirror_path)
+    if not has_tag(mirror_path, release):
+        run_quiet(
+            ["git", "fetch", "--no-tags", "origin", tag_refspec(release)],
+            f"Error fetching {release} into {name} reference mirror", cwd=mirror_path)
+    return os.path.join(mirror_path, 'objects')
+
+
+def init_checkout(repo_path: str, repo_url: str, name: str) -> None | NoReturn:
+    run_quiet(
+        ["git", "init", "--quiet", repo_path], f"Error creating {name} repository")
+    run_quiet(
+        ["git", "remote", "add", "origin", repo_url],
+        f"Error configuring {name} repository", cwd=repo_path)
+
+
+def use_alternate(repo_path: str, objects_path: str) -> None:
+    """
+    Shares objects with a reference mirror (as `git clone --reference` does).
+    """
+    alternates = os.path.join(repo_path, '.git', 'objects', 'info', 'alternates')
+    existing = []
+    if os.path.exists(alternates):
+        with open(alternates, 'r') as f:
+            existing = f.read().split()
+    if objects_path not in existing:
+        os.makedirs(os.path.dirname(alternates), exist_ok=True)
+        with open(alternates, 'a') as f:
+            f.write(f"{objects_path}\n")
+
+
+def fetch_source(
+        src_path: str, repo_url: str, release: str, name: str) -> str | NoReturn:
+    """
+    Prepares a checkout of `release` under `src_path` according to CLONE_MODE and
+    returns its path. Only the release tag is fetched, and nothing at all if the
+    checkout already has it. Existing checkouts (including full clones made by earlier
+    versions) are switched to the configured mode in place. If GIT_MIRROR_PATH is set,
+    objects are shared through a bare reference mirror there.
+    """
+    mode = clone_mode()
+    repo_path = os.path.join(src_path, repo_dirname(repo_url))
+    print_neutral(ind(f"Fetching {name} source..."))
+
+    if not os.path.exists(repo_path):
+        init_checkout(repo_path, repo_url, name)
+
+    mirror_root = os.environ.get('GIT_MIRROR_PATH')
+    if mirror_root and mode != 'shallow':
+        # Shallow checkouts have no history to share
+        use_alternate(repo_path, update_mirror(mirror_root, repo_url, release, name))
+
+    if mode == 'partial':
+        # Later fetches (and lazily fetched file contents) use the blob filter
+        run_quiet(
+            ["git", "config", "remote.origin.promisor", "true"],
+            f"Error configuring {name} repository", cwd=repo_path)
+        run_quiet(
+            ["git", "config", "remote.origin.partialclonefilter", "blob:none"],
+            f"Error configuring {name} repository", cwd=repo_path)
+
+    fetch_args = None
+    if mode == 'full' and is_shallow(repo_path):
+        fetch_args = ["--unshallow"]
+    elif mode == 'shallow' and not is_shallow(repo_path):
+        fetch_args = ["--depth", "1"]
+    elif not has_tag(repo_path, release):
+        fetch_args = {
+            'full': [],
+            'partial': ["--filter=blob:none"],
+            'shallow': ["--depth", "1"],
+        }[mode]
+    if fetch_args is not None:
+        run(
+            ["git", "fetch", "--no-tags", *fetch_args, "origin", tag_refspec(release)],
+            f"Error fetching {name} release {release}", cwd=repo_path)
+
+    run_quiet(
+        ["git", "reset", "--hard", f"refs/tags/{release}"],
+        f"Error resetting git to release {release}", cwd=repo_path)
+
+    return repo_path
+
+
+def flake_ref(repo_path: str, attr: str, subdir: str | None = None) -> str:
+    """
+    Returns an absolute flake reference for `attr` in a checkout.
+    Nix only accepts shallow git checkouts when told so explicitly.
+    """
+    if is_shallow(repo_path):
+        dir_param = f"&dir={subdir}" if subdir else ""
+        return f"git+file://{repo_path}?shallow=1{dir_param}#{attr}"
+    path = os.path.join(repo_path, subdir) if subdir else repo_path
+    return f"{path}#{attr}"
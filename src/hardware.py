@@ -0,0 +1,69 @@
+import os
+import re
+import subprocess
+import sys
+
+VIRTUAL_DISK_PREFIXES = ("vd", "xvd")
+
+
+def cpu_count() -> int:
+    """
+    Cores available to this process (respecting CPU affinity where supported).
+    """
+    if hasattr(os, 'sched_getaffinity'):
+        return max(1, len(os.sched_getaffinity(0)))
+    return os.cpu_count() or 1
+
+
+def total_memory() -> int | None:
+    """
+    Physical memory in bytes, or None if it can't be determined.
+    """
+    try:
+        return os.sysconf('SC_PAGE_SIZE') * os.sysconf('SC_PHYS_PAGES')
+    except (ValueError, OSError, AttributeError):
+        pass
+    # macOS doesn't expose SC_PHYS_PAGES
+    try:
+        return int(subprocess.check_output(
+            ["sysctl", "-n", "hw.memsize"], stderr=subprocess.DEVNULL, text=True))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def mount_point(path: str) -> str:
+    path = os.path.realpath(path)
+    while not os.path.ismount(path):
+        path = os.path.dirname(path)
+    return path
+
+
+def disk_kind(path: str) -> str | None:
+    """
+    Whether `path` is on an 'ssd' or 'hdd', or None if it can't be told (i.e. network or
+    virtual filesystems).
+    """
+    while not os.path.exists(path):
+        path = os.path.dirname(path)
+    if sys.platform == 'darwin':
+        try:
+            info = subprocess.check_output(
+                ["diskutil", "info", mount_point(path)], stderr=subprocess.DEVNULL, text=True)
+        except (OSError, subprocess.CalledProcessError):
+            return None
+        match = re.search(r"Solid State:\s*(Yes|No)", info)
+        return None if match is None else 'ssd' if match[1] == 'Yes' else 'hdd'
+
+    dev = os.stat(path).st_dev
+    block_path = os.path.realpath(f"/sys/dev/block/{os.major(dev)}:{os.minor(dev)}")
+    # Partitions have no queue of their own: the disk's is one level up
+    for candidate in [block_path, os.path.dirname(block_path)]:
+        # Virtual disks (virtio, xen) report themselves rotational whatever backs them
+        if os.path.basename(candidate).startswith(VIRTUAL_DISK_PREFIXES):
+            return None
+        try:
+            with open(os.path.join(candidate, "queue", "rotational")) as f:
+                return 'hdd' if f.read().strip() == '1' else 'ssd'
+        except OSError:
+            continue
+    return None
@@ -0,0 +1,234 @@
+import os
+import socket
+import sqlite3
+import statistics
+import time
+from contextlib import closing
+from typing import Any
+
+from .config_vars import ConfigVars
+from .preflight import Environment
+from .utils import STATE_DIRNAME, ind, ind2, print_fail, print_neutral, print_success, state_path
+
+HISTORY_DB = "history.sqlite3"
+# Runs (on the same host) whose median duration is a phase's baseline
+BASELINE_RUNS = 5
+REGRESSION_THRESHOLD = 0.25
+# Slowdowns shorter than this are noise, however large relative to the baseline
+MIN_REGRESSION_SECONDS = 5.0
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS runs (
+    id INTEGER PRIMARY KEY,
+    started REAL NOT NULL,
+    duration REAL NOT NULL,
+    status TEXT NOT NULL,
+    node_release TEXT,
+    aiken_release TEXT,
+    ogmios_release TEXT,
+    networks TEXT NOT NULL,
+    bytes_downloaded INTEGER NOT NULL,
+    host TEXT NOT NULL,
+    os TEXT,
+    architecture TEXT,
+    cores INTEGER,
+    memory INTEGER,
+    disk TEXT
+);
+CREATE TABLE IF NOT EXISTS phases (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    duration REAL NOT NULL,
+    skipped INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS components (
+    run_id INTEGER NOT NULL REFERENCES runs(id),
+    name TEXT NOT NULL,
+    -- 'cache' (every output substituted), 'source' (some built), 'resumed' or 'up to date'
+    source TEXT NOT NULL
+);
+"""
+
+
+def connect(path: str) -> sqlite3.Connection:
+    conn = sqlite3.connect(path)
+    conn.executescript(SCHEMA)
+    return conn
+
+
+def summarize_spans(events: list[dict[str, Any]]) -> tuple[list[tuple[str, float, bool]], int, dict[str, str]]:
+    """
+    Reduces a run's trace events to its phase durations (in seconds), the bytes it
+    downloaded and how each built component was obtained.
+    """
+    phases = []
+    bytes_downloaded = 0
+    components = {}
+    for event in events:
+        args = event['args']
+        if event['cat'] == 'phase' and event['name'] != 'install':
+            phases.append((event['name'], event['dur'] / 1e6, bool(args.get('skipped'))))
+            if args.get('skipped') and event['name'].startswith("build "):
+                components[event['name'].removeprefix("build ")] = 'resumed'
+        elif event['cat'] == 'download':
+            bytes_downloaded += args.get('bytes_received', 0)
+        elif event['cat'] == 'cache' and args.get('parent', '').startswith("build "):
+            cached = args['outputs'] > 0 and args.get('substituted') == args['outputs']
+            components[args['parent'].removeprefix("build ")] = 'cache' if cached else 'source'
+    return phases, bytes_downloaded, components
+
+
+def record_run(
+        cfg: ConfigVars, env: Environment, networks: list[str], started: float, status: str,
+        up_to_date: list[str], events: list[dict[str, Any]]) -> None:
+    """
+    Appends a run, with its phase timings and the host's hardware, to the run history.
+    """
+    phases, bytes_downloaded, components = summarize_spans(events)
+    components.update({name: 'up to date' for name in up_to_date})
+    try:
+        with closing(connect(state_path(cfg['CARDANO_PATH'], HISTORY_DB))) as conn, conn:
+            run_id = conn.execute(
+                "INSERT INTO runs (started, duration, status, node_release, aiken_release, "
+                "ogmios_release, networks, bytes_downloaded, host, os, architecture, cores, "
+                "memory, disk) VALUES (?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?, ?)",
+                (started, time.time() - started, status, cfg['NODE_RELEASE'],
+                 cfg['AIKEN_RELEASE'], cfg['OGMIOS_RELEASE'], ",".join(networks),
+                 bytes_downloaded, socket.gethostname(), " ".join(filter(None, env['os'])),
+                 " ".join(filter(None, env['architecture'])), env['cores'], env['memory'],
+                 env['disk'])).lastrowid
+            conn.executemany(
+                "INSERT INTO phases (run_id, name, duration, skipped) VALUES (?, ?, ?, ?)",
+                [(run_id, *phase) for phase in phases])
+            conn.executemany(
+                "INSERT INTO components (run_id, name, source) VALUES (?, ?, ?)",
+                [(run_id, *component) for component in components.items()])
+    except (OSError, sqlite3.Error) as e:
+        print_fail(ind(f"Error recording the run history: {e}"))
+
+
+def build_times(cardano_path: str) -> dict[str, float]:
+    """
+    Median time each component took to build from source on this host, from the history.
+    """
+    path = os.path.join(cardano_path, STATE_DIRNAME, HISTORY_DB)
+    if not os.path.exists(path):
+        return {}
+    try:
+        with closing(connect(path)) as conn:
+            rows = conn.execute(
+                "SELECT components.name, phases.duration FROM phases "
+                "JOIN runs ON runs.id = phases.run_id "
+                "JOIN components ON components.run_id = phases.run_id "
+                "AND phases.name = 'build ' || components.name "
+                "WHERE runs.host = ? AND runs.status = 'ok' AND components.source = 'source'",
+                (socket.gethostname(),)).fetchall()
+    except sqlite3.Error:
+        return {}
+    durations: dict[str, list[float]] = {}
+    for name, duration in rows:
+        durations.setdefault(name, []).append(duration)
+    return {name: statistics.median(values) for name, values in durations.items()}
+
+
+def format_seconds(seconds: float) -> str:
+    if seconds < 60:
+        return f"{seconds:.1f}s"
+    minutes, seconds = divmod(round(seconds), 60)
+    return f"{minutes}m{seconds:02d}s" if minutes < 60 else f"{minutes // 60}h{minutes % 60:02d}m"
+
+
+def format_bytes(n: int) -> str:
+    for unit in ["B", "KiB", "MiB"]:
+        if n < 1024:
+            return f"{n:.0f}{unit}" if unit == "B" else f"{n:.1f}{unit}"
+        n /= 1024
+    return f"{n:.1f}GiB"
+
+
+def print_history(
+        cardano_path: str, runs: int = 10, baseline_runs: int = BASELINE_RUNS,
+        threshold: float = REGRESSION_THRESHOLD) -> bool:
+    """
+    Prints the recent runs, install time per NODE_RELEASE, and the latest successful run's
+    phases against their baseline: the median of the previous `baseline_runs` runs on the
+    same host that ran the phase (with the component obtained the same way, for builds).
+    Returns whether any phase regressed beyond `threshold`.
+    """
+    path = os.path.join(cardano_path, STATE_DIRNAME, HISTORY_DB)
+    if not os.path.exists(path):
+        print_neutral(ind("No runs recorded yet: the history starts with the next install."))
+        return False
+    with closing(connect(path)) as conn:
+        rows = conn.execute(
+            "SELECT id, started, duration, status, node_release, bytes_downloaded, host "
+            "FROM runs ORDER BY id DESC LIMIT ?", (runs,)).fetchall()
+        sources = {}
+        for run_id, name, source in conn.execute("SELECT run_id, name, source FROM components"):
+            sources.setdefault(run_id, {})[name] = source
+        by_release = conn.execute(
+            "SELECT node_release, COUNT(*), GROUP_CONCAT(duration) FROM runs "
+            "WHERE status = 'ok' GROUP BY node_release ORDER BY MIN(started)").fetchall()
+        latest = conn.execute(
+            "SELECT id, host FROM runs WHERE status = 'ok' ORDER BY id DESC LIMIT 1").fetchone()
+        phases = []
+        if latest:
+            phases = conn.execute(
+                "SELECT phases.run_id, phases.name, phases.duration FROM phases "
+                "JOIN runs ON runs.id = phases.run_id "
+                "WHERE runs.host = ? AND runs.status = 'ok' AND NOT phases.skipped "
+                "AND runs.id <= ? ORDER BY runs.id DESC", (latest[1], latest[0])).fetchall()
+
+    print_neutral(ind(f"Last {len(rows)} runs:"))
+    for run_id, started, duration, status, node_release, bytes_downloaded, host in reversed(rows):
+        components = ", ".join(
+            f"{name} ({source})" for name, source in sorted(sources.get(run_id, {}).items()))
+        line = ind2(
+            f"* {time.strftime('%Y-%m-%d %H:%M', time.localtime(started))}  {host}  "
+            f"node {node_release}  {format_seconds(duration)}  "
+            f"{format_bytes(bytes_downloaded)} downloaded  {components or '-'}")
+        if status == 'ok':
+            print_success(line)
+        else:
+            print_fail(f"{line}  [{status}]")
+
+    if by_release:
+        print_neutral(ind("Successful runs by NODE_RELEASE (median duration):"))
+        for node_release, count, durations in by_release:
+            median = statistics.median(float(d) for d in durations.split(","))
+            print_neutral(ind2(f"* {node_release}: {format_seconds(median)} over {count} runs"))
+
+    if not latest:
+        return False
+    latest_id = latest[0]
+
+    def source(run_id: int, phase: str) -> str | None:
+        return sources.get(run_id, {}).get(phase.removeprefix("build ")) \
+            if phase.startswith("build ") else None
+
+    history: dict[str, list[float]] = {}
+    current: dict[str, float] = {}
+    for run_id, name, duration in phases:
+        if run_id == latest_id:
+            current[name] = duration
+        elif source(run_id, name) == source(latest_id, name):
+            history.setdefault(name, []).append(duration)
+
+    print_neutral(ind(f"Phases of the latest successful run on {latest[1]}, against the "
+                      f"median of up to {baseline_runs} earlier runs:"))
+    regressed = False
+    for name, duration in current.items():
+        previous = history.get(name, [])[:baseline_runs]
+        if not previous:
+            print_neutral(ind2(f"* {name}: {format_seconds(duration)} (no baseline yet)"))
+            continue
+        baseline = statistics.median(previous)
+        change = (duration - baseline) / baseline if baseline else 0.0
+        line = ind2(f"* {name}: {format_seconds(duration)} vs {format_seconds(baseline)} "
+                    f"({change:+.0%})")
+        if change > threshold and duration - baseline >= MIN_REGRESSION_SECONDS:
+            regressed = True
+            print_fail(f"{line}  REGRESSED")
+        else:
+            print_neutral(line)
+    return regressed
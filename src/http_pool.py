@@ -0,0 +1,133 @@
+import http.client
+import threading
+import urllib.parse
+from contextlib import contextmanager
+from typing import Iterator, NamedTuple
+
+USER_AGENT = "cardano-ez-installer"
+MAX_REDIRECTS = 5
+
+PoolKey = tuple[str, str, int | None]
+
+
+class Response(NamedTuple):
+    status: int
+    headers: dict[str, str]
+    body: bytes
+
+
+class HttpPool():
+    """
+    Thread-safe pool of keep-alive HTTP(S) connections, keyed by scheme, host and port.
+    Connections are handed back to the pool once a response has been fully read.
+    """
+    timeout: float
+    max_idle: int
+
+    def __init__(self, timeout: float = 10.0, max_idle: int = 8):
+        self.timeout = timeout
+        self.max_idle = max_idle
+        self._idle: dict[PoolKey, list[http.client.HTTPConnection]] = {}
+        self._lock = threading.Lock()
+
+    def _connect(self, key: PoolKey, timeout: float) -> http.client.HTTPConnection:
+        scheme, host, port = key
+        if scheme == 'https':
+            return http.client.HTTPSConnection(host, port, timeout=timeout)
+        if scheme == 'http':
+            return http.client.HTTPConnection(host, port, timeout=timeout)
+        raise ValueError(f"unsupported URL scheme '{scheme}'")
+
+    def _acquire(self, key: PoolKey) -> http.client.HTTPConnection | None:
+        with self._lock:
+            idle = self._idle.get(key)
+            return idle.pop() if idle else None
+
+    def _release(self, key: PoolKey, conn: http.client.HTTPConnection) -> None:
+        with self._lock:
+            idle = self._idle.setdefault(key, [])
+            if len(idle) < self.max_idle:
+                idle.append(conn)
+                return
+        conn.close()
+
+    def _send(
+            self, key: PoolKey, target: str, method: str, headers: dict[str, str],
+            timeout: float) -> tuple[http.client.HTTPConnection, http.client.HTTPResponse]:
+        conn = self._acquire(key)
+        if conn is not None:
+            try:
+                if conn.sock is not None:
+                    conn.sock.settimeout(timeout)
+                conn.request(method, target, headers=headers)
+                return (conn, conn.getresponse())
+            except (http.client.HTTPException, OSError):
+                # The server dropped an idle keep-alive connection: retry on a fresh one
+                conn.close()
+
+        conn = self._connect(key, timeout)
+        try:
+            conn.request(method, target, headers=headers)
+            return (conn, conn.getresponse())
+        except BaseException:
+            conn.close()
+            raise
+
+    @contextmanager
+    def open(
+            self, url: str, headers: dict[str, str] | None = None,
+            method: str = "GET",
+            timeout: float | None = None) -> Iterator[http.client.HTTPResponse]:
+        """
+        Sends a request (following redirects) and yields the unread response.
+        The connection is returned to the pool when the block exits.
+        """
+        req_headers = {"User-Agent": USER_AGENT, **(headers or {})}
+        for _ in range(MAX_REDIRECTS + 1):
+            parts = urllib.parse.urlsplit(url)
+            key: PoolKey = (parts.scheme, parts.hostname or '', parts.port)
+            target = parts.path or '/'
+            if parts.query:
+                target += f"?{parts.query}"
+            conn, response = self._send(
+                key, target, method, req_headers, timeout or self.timeout)
+            location = response.getheader("Location")
+            if response.status in (301, 302, 303, 307, 308) and location:
+                response.read()
+                self._finish(key, conn, response)
+                url = urllib.parse.urljoin(url, location)
+                continue
+            break
+        else:
+            raise http.client.HTTPException(f"too many redirects for {url}")
+
+        try:
+            yield response
+            response.read()
+        except BaseException:
+            conn.close()
+            raise
+        self._finish(key, conn, response)
+
+    def _finish(
+            self, key: PoolKey, conn: http.client.HTTPConnection,
+            response: http.client.HTTPResponse) -> None:
+        if response.will_close:
+            conn.close()
+        else:
+            self._release(key, conn)
+
+    def request(
+            self, url: str, headers: dict[str, str] | None = None,
+            method: str = "GET", timeout: float | None = None) -> Response:
+        with self.open(url, headers, method, timeout) as response:
+            body = response.read()
+            resp_headers = {k.lower(): v for k, v in response.getheaders()}
+            return Response(response.status, resp_headers, body)
+
+    def close(self) -> None:
+        with self._lock:
+            conns = [c for idle in self._idle.values() for c in idle]
+            self._idle.clear()
+        for conn in conns:
+            conn.close()
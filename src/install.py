@@ -1,202 +1,315 @@
+import hashlib
+import json
 import os
-import shutil
-from typing import NoReturn
+import sys
+from typing import NoReturn, TypedDict
 
+from .blob_store import BlobStore
 from .config_vars import ConfigVars
-from .utils import ind, print_neutral, print_success_generic, run, run_quiet
-from .paths import Network, NetworkPaths, Paths
+from .downloader import DownloadError, DownloadJob, Downloader
+from .genesis import verify_genesis
+from .git_source import fetch_source, flake_ref
+from .nix_options import NixOptions
+from .nix_profile import ProfileTransaction
+from .substituters import check_substitutes
+from .trace import span
+from .install_record import is_current, save_component, tag_commit
+from .utils import (ind, ind2, print_fail, print_neutral, print_success_generic, run_capture, run_quiet, state_path,
+                    write_text_atomic)
+from .paths import NetworkPaths, Paths
+
+# Overridable so config downloads can be pointed at a mirror or local stand-in
+CONFIG_BASE_URL = os.environ.get(
+    "CARDANO_CONFIG_URL", "https://book.world.dev.cardano.org/environments")
+
+NODE_NIX_FLAGS = [
+    "--accept-flake-config",
+    "--extra-substituters", "https://cache.zw3rk.com",
+    "--extra-trusted-public-keys",
+    "loony-tools:pr9m4BkM/5/eSTZlkQyRt57Jz7OMBxNSUiMC4FkcNfk=",
+]
+
+OGMIOS_ASSETS = ["flake.nix", "cabal.project.local"]
+
+
+BuiltComponent = TypedDict('BuiltComponent', {
+    'component': str,
+    'release': str,
+    'repo_path': str,
+    'store_paths': list[str],
+    'inputs': str | None,
+})
+
+# A build's outputs, waiting for the profile update
+QueuedInstall = TypedDict('QueuedInstall', {
+    'elements': list[str],
+    'installables': list[str],
+    'flags': list[str],
+    'components': list[BuiltComponent],
+})
+
+
+def record_install(cfg: ConfigVars, built: BuiltComponent) -> None:
+    save_component(cfg['CARDANO_PATH'], built['component'], {
+        'release': built['release'],
+        'commit': tag_commit(built['repo_path'], built['release']) or '',
+        'store_paths': built['store_paths'],
+        'inputs': built['inputs'],
+    })
+
+
+def queue_install(cfg: ConfigVars, txn: ProfileTransaction, queued: QueuedInstall) -> None:
+    """
+    Queues a build's outputs for the profile update, which records the components once
+    it's done. Also replays builds journaled by an interrupted run.
+    """
+    def on_commit() -> None:
+        for built in queued['components']:
+            record_install(cfg, built)
+
+    txn.add(queued['elements'], queued['installables'], queued['flags'], on_commit)
+
+
+def build_outputs(
+        name: str, installables: list[str], flags: list[str], opts: NixOptions,
+        substituters: list[str] | None, quiet: bool = False) -> list[str] | NoReturn:
+    """
+    Builds the installables and returns the `out` output of each, in the same order.
+    """
+    err = f"Error building {name}"
+    with opts.build_slots:
+        output = run_capture(
+            ["nix", "build", "--no-link", "--json", *flags, *opts.args(substituters),
+             *installables], err, quiet=quiet)
+    try:
+        outs = [result['outputs']['out'] for result in json.loads(output)]
+    except (ValueError, TypeError, KeyError):
+        outs = []
+    if len(outs) != len(installables):
+        print_fail(ind2(f"{err}: nix didn't report an output for each of {', '.join(installables)}"))
+        sys.exit(1)
+    return outs
+
+
+def node_is_current(cfg: ConfigVars) -> bool:
+    return is_current(
+        cfg['CARDANO_PATH'], ["cardano-node", "cardano-cli"], cfg['NODE_RELEASE'],
+        os.path.join(cfg['CARDANO_SRC_PATH'], "cardano-node"))
+
+
+def fetch_node_source(cfg: ConfigVars) -> None | NoReturn:
+    fetch_source(
+        cfg['CARDANO_SRC_PATH'], "https://github.com/input-output-hk/cardano-node",
+        cfg['NODE_RELEASE'], "cardano-node")
+
+
+def install_node(
+        cfg: ConfigVars, txn: ProfileTransaction, opts: NixOptions) -> QueuedInstall | NoReturn:
+    """
+    Builds cardano-node and cardano-cli in one evaluation of the node flake and queues
+    them for installation in the nix profile.
+    """
+    node_src_path = os.path.join(cfg['CARDANO_SRC_PATH'], "cardano-node")
+    print_neutral(f"\n{ind('Building cardano-node and cardano-cli...')}")
+
+    installables = [
+        flake_ref(node_src_path, "cardano-node"),
+        flake_ref(node_src_path, "cardano-cli"),
+    ]
+    flags = [*NODE_NIX_FLAGS, "--no-warn-dirty"]
+    substituters = check_substitutes("cardano-node", installables, flags, opts)
+    node_out, cli_out = build_outputs(
+        "cardano-node", installables, flags, opts, substituters, quiet=True)
+
+    queued: QueuedInstall = {
+        'elements': ["cardano-node", ".*cardano-node*", "cardano-cli", ".*cardano-cli*"],
+        'installables': installables,
+        'flags': flags,
+        'components': [
+            {'component': component, 'release': cfg['NODE_RELEASE'], 'repo_path': node_src_path,
+             'store_paths': [out], 'inputs': None}
+            for component, out in [("cardano-node", node_out), ("cardano-cli", cli_out)]
+        ],
+    }
+    queue_install(cfg, txn, queued)
 
+    print_success_generic()
+    return queued
 
-def install_node(cfg: ConfigVars) -> None | NoReturn:
-    original_cwd = os.getcwd()
-    print_neutral(f"\n{ind('Installing cardano-node...')}")
 
-    os.chdir(cfg['CARDANO_SRC_PATH'])
+def fetch_aiken_source(cfg: ConfigVars) -> None | NoReturn:
+    fetch_source(
+        cfg['CARDANO_SRC_PATH'], "https://github.com/aiken-lang/aiken",
+        f"v{cfg['AIKEN_RELEASE']}", "Aiken")
 
-    if not os.path.exists("cardano-node"):
-        run(
-            ["git", "clone", "https://github.com/input-output-hk/cardano-node"],
-            "Error cloning cardano-node repository")
-        os.chdir("cardano-node")
-    else:
-        os.chdir("cardano-node")
-        run_quiet(
-            ["git", "fetch"],
-            "Error fetching cardano-node repository")
-
-    run_quiet(
-        ["git", "reset", "--hard", cfg['NODE_RELEASE']],
-        f"Error resetting git to release {cfg['NODE_RELEASE']}")
-
-    run_quiet(
-        ["nix", "profile", "remove", "cardano-node"],
-        "Error removing cardano-node from nix profile")
-    run_quiet(
-        ["nix", "profile", "remove", ".*cardano-node*"],
-        "Error removing cardano-node from nix profile")
-    run_quiet(
-        ["nix", "profile", "install", "--accept-flake-config",
-         "--extra-substituters", "https://cache.zw3rk.com",
-         "--extra-trusted-public-keys",
-         "loony-tools:pr9m4BkM/5/eSTZlkQyRt57Jz7OMBxNSUiMC4FkcNfk=",
-         ".#cardano-node"],
-        "Error installing cardano-node")
 
-    print_success_generic()
+def aiken_is_current(cfg: ConfigVars) -> bool:
+    return is_current(
+        cfg['CARDANO_PATH'], ["aiken"], f"v{cfg['AIKEN_RELEASE']}",
+        os.path.join(cfg['CARDANO_SRC_PATH'], "aiken"))
+
+
+def install_aiken(
+        cfg: ConfigVars, txn: ProfileTransaction, opts: NixOptions) -> QueuedInstall | NoReturn:
+    aiken_src_path = os.path.join(cfg['CARDANO_SRC_PATH'], "aiken")
+    print_neutral(ind('Building Aiken...'))
 
-    print_neutral(ind("Installing cardano-cli..."))
-
-    run_quiet(
-        ["nix", "profile", "remove", "cardano-cli"],
-        "Error removing cardano-cli from nix profile")
-    run_quiet(
-        ["nix", "profile", "remove", ".*cardano-cli*"],
-        "Error removing cardano-cli from nix profile")
-    run_quiet(
-        ["nix", "profile", "install", "--accept-flake-config",
-         "--extra-substituters", "https://cache.zw3rk.com",
-         "--extra-trusted-public-keys",
-         "loony-tools:pr9m4BkM/5/eSTZlkQyRt57Jz7OMBxNSUiMC4FkcNfk=",
-         "--no-warn-dirty", ".#cardano-cli"],
-        "Error installing cardano-cli")
+    installable = flake_ref(aiken_src_path, "aiken")
+    substituters = check_substitutes("Aiken", [installable], [], opts)
+    store_paths = build_outputs("Aiken", [installable], [], opts, substituters)
+
+    queued: QueuedInstall = {
+        'elements': ["aiken", ".*aiken*"],
+        'installables': [installable],
+        'flags': [],
+        'components': [{
+            'component': "aiken", 'release': f"v{cfg['AIKEN_RELEASE']}",
+            'repo_path': aiken_src_path, 'store_paths': store_paths, 'inputs': None,
+        }],
+    }
+    queue_install(cfg, txn, queued)
 
     print_success_generic()
+    return queued
+
+
+def fetch_ogmios_source(cfg: ConfigVars) -> None | NoReturn:
+    fetch_source(
+        cfg['CARDANO_SRC_PATH'], "https://github.com/CardanoSolutions/ogmios",
+        f"v{cfg['OGMIOS_RELEASE']}", "Ogmios")
+
+
+def ogmios_asset_paths() -> dict[str, str]:
+    ez_installer_path = os.path.dirname(
+        os.path.dirname(os.path.realpath(__file__)))
+    return {
+        ogmios_asset: os.path.join(ez_installer_path, "ogmios-assets", ogmios_asset)
+        for ogmios_asset in OGMIOS_ASSETS
+    }
+
+
+def ogmios_assets_hash() -> str:
+    sha256 = hashlib.sha256()
+    for ogmios_asset, source_path in sorted(ogmios_asset_paths().items()):
+        sha256.update(ogmios_asset.encode())
+        with open(source_path, 'rb') as f:
+            sha256.update(hashlib.sha256(f.read()).digest())
+    return sha256.hexdigest()
+
+
+def git_blob_id(data: bytes) -> str:
+    return hashlib.sha1(b"blob %d\0" % len(data) + data).hexdigest()
+
+
+def read_bytes(path: str) -> bytes | None:
+    try:
+        with open(path, 'rb') as f:
+            return f.read()
+    except FileNotFoundError:
+        return None
+
+
+def ogmios_lock_path(cfg: ConfigVars, assets_hash: str) -> str:
+    """
+    Cached flake.lock for an Ogmios release built with a given set of assets.
+    """
+    key = hashlib.sha256(f"{cfg['OGMIOS_RELEASE']}:{assets_hash}".encode()).hexdigest()[:16]
+    return state_path(cfg['CARDANO_PATH'], "flake-locks", f"ogmios-{key}.lock")
+
+
+def prepare_ogmios_source(
+        cfg: ConfigVars, ogmios_src_path: str, assets_hash: str) -> None | NoReturn:
+    """
+    Adds the installer's assets to the Ogmios server flake and removes its package.yaml
+    files, working from the git index so only paths that differ are written and staged.
+    The flake.lock is cached per release and assets, so `nix flake lock` (which resolves
+    every input over the network) only runs when one of them changes.
+    """
+    ogmios_server_path = os.path.join(ogmios_src_path, "server")
+    lock_path = ogmios_lock_path(cfg, assets_hash)
+    cached_lock = read_bytes(lock_path)
+    wanted = {
+        f"server/{ogmios_asset}": read_bytes(source_path)
+        for ogmios_asset, source_path in ogmios_asset_paths().items()
+    }
+    if cached_lock is not None:
+        wanted["server/flake.lock"] = cached_lock
+
+    index = {}
+    for line in run_capture(
+            ["git", "ls-files", "--stage", "--", *wanted, ":(glob)server/**/package.yaml"],
+            "Error reading the Ogmios git index", cwd=ogmios_src_path, quiet=True).splitlines():
+        meta, _, path = line.partition("\t")
+        index[path] = meta.split()[1]
+
+    to_stage = []
+    for path, data in wanted.items():
+        file_path = os.path.join(ogmios_src_path, path)
+        if read_bytes(file_path) != data:
+            with open(file_path, 'wb') as f:
+                f.write(data)
+        if index.get(path) != git_blob_id(data):
+            to_stage.append(path)
+    if to_stage:
+        run_quiet(
+            ["git", "add", "-f", "--", *to_stage],
+            "Error staging Ogmios changes", cwd=ogmios_src_path)
 
-    os.chdir(original_cwd)
-
-
-def prompt_install_aiken(cfg: ConfigVars) -> None | NoReturn:
-    while True:
-        user_input = input("Do you want to install Aiken? (Y/n): ").lower()
-        print("")
-
-        if user_input == 'y' or user_input == '':
-            install_aiken(cfg)
-            break
-        elif user_input == 'n':
-            break
-        else:
-            print("Invalid response. Please enter 'Y' to install or 'N' to cancel.")
-            continue
-
-
-def install_aiken(cfg: ConfigVars) -> None | NoReturn:
-    original_cwd = os.getcwd()
-    aiken_src_path = f"{cfg['CARDANO_SRC_PATH']}/aiken"
-    print_neutral(ind('Installing Aiken...'))
-
-    if not os.path.exists(aiken_src_path):
-        os.chdir(cfg['CARDANO_SRC_PATH'])
-        run(
-            ["git", "clone", "https://github.com/aiken-lang/aiken"],
-            "Error cloning aiken repository")
-        os.chdir(aiken_src_path)
-    else:
-        os.chdir(aiken_src_path)
+    package_files = [path for path in index if os.path.basename(path) == "package.yaml"]
+    if package_files:
         run_quiet(
-            ["git", "fetch"],
-            "Error fetching Aiken repository")
-
-    release = f"v{cfg['AIKEN_RELEASE']}"
-
-    run_quiet(
-        ["git", "reset", "--hard", release],
-        f"Error resetting git to release {release}")
-    run_quiet(
-        ["nix", "profile", "remove", "aiken"],
-        "Error removing aiken from nix profile")
-    run_quiet(
-        ["nix", "profile", "remove", ".*aiken*"],
-        "Error removing aiken from nix profile")
-    run(
-        ["nix", "profile", "install", ".#aiken"],
-        "Error installing Aiken")
+            ["git", "rm", "-q", "--ignore-unmatch", "--", *package_files],
+            "Error removing Ogmios package.yaml files", cwd=ogmios_src_path)
 
-    print_success_generic()
-    os.chdir(original_cwd)
-
-
-def prompt_install_ogmios(cfg: ConfigVars) -> None | NoReturn:
-    while True:
-        user_input = input("Do you want to install Ogmios? (Y/n): ").lower()
-        print("")
-
-        if user_input == 'y' or user_input == '':
-            install_ogmios(cfg)
-            break
-        elif user_input == 'n':
-            break
-        else:
-            print("Invalid response. Please enter 'Y' to install or 'N' to cancel.")
-            continue
-
-
-def install_ogmios(cfg: ConfigVars) -> None | NoReturn:
-    original_cwd = os.getcwd()
-    ogmios_src_path = f"{cfg['CARDANO_SRC_PATH']}/ogmios"
-    print_neutral(ind('Installing Ogmios...'))
-
-    if not os.path.exists(ogmios_src_path):
-        os.chdir(cfg['CARDANO_SRC_PATH'])
-        run(
-            ["git", "clone", "https://github.com/CardanoSolutions/ogmios"],
-            "Error cloning Ogmios repository")
-        os.chdir(ogmios_src_path)
-    else:
-        os.chdir(ogmios_src_path)
+    if cached_lock is None:
         run_quiet(
-            ["git", "fetch"],
-            "Error fetching Ogmios repository")
-
-    release = f"v{cfg['OGMIOS_RELEASE']}"
-
-    run_quiet(
-        ["git", "reset", "--hard", release],
-        f"Error resetting git to release {release}")
-
-    ogmios_server_path = f"{ogmios_src_path}/server"
-
-    for ogmios_asset in ["flake.nix", "cabal.project.local"]:
-        ez_installer_path = os.path.dirname(
-            os.path.dirname(os.path.realpath(__file__)))
-        source_path = os.path.join(
-            ez_installer_path, "ogmios-assets", ogmios_asset)
-        shutil.copy(
-            source_path,
-            f"{ogmios_server_path}/{ogmios_asset}")
-
-    for dirpath, _, filenames in os.walk(ogmios_server_path):
-        for filename in filenames:
-            if filename == 'package.yaml':
-                os.remove(os.path.join(dirpath, filename))
-
-    os.chdir(ogmios_src_path)
-    run_quiet(
-        ["git", "add", "."],
-        f"Error staging Ogmios changes")
-
-    run_quiet(
-        ["git", "add", "-f", "server/cabal.project.local"],
-        f"Error staging Ogmios cabal.project.local file")
-
-    os.chdir(ogmios_server_path)
-
-    run_quiet(
-        ["nix", "flake", "lock"],
-        f"Error creating flake.lock file")
-    run_quiet(
-        ["nix", "profile", "remove", "server"],
-        "Error removing Ogmios from nix profile")
-    run_quiet(
-        ["nix", "profile", "remove", ".*ogmios*"],
-        "Error removing Ogmios from nix profile")
-    run(
-        ["nix", "profile", "install", "--accept-flake-config",
-         "--no-warn-dirty", ".#ogmios"],
-        "Error installing Ogmios")
+            ["nix", "flake", "lock"],
+            f"Error creating flake.lock file", cwd=ogmios_server_path)
+        lock = read_bytes(os.path.join(ogmios_server_path, "flake.lock"))
+        if lock is None:
+            return
+        run_quiet(
+            ["git", "add", "-f", "--", "server/flake.lock"],
+            "Error staging Ogmios flake.lock file", cwd=ogmios_src_path)
+        # Locks of other releases or assets won't be used again
+        for stale in os.listdir(os.path.dirname(lock_path)):
+            if stale.startswith("ogmios-"):
+                os.remove(os.path.join(os.path.dirname(lock_path), stale))
+        write_text_atomic(lock_path, lock.decode())
+
+
+def ogmios_is_current(cfg: ConfigVars) -> bool:
+    return is_current(
+        cfg['CARDANO_PATH'], ["ogmios"], f"v{cfg['OGMIOS_RELEASE']}",
+        os.path.join(cfg['CARDANO_SRC_PATH'], "ogmios"), ogmios_assets_hash())
+
+
+def install_ogmios(
+        cfg: ConfigVars, txn: ProfileTransaction, opts: NixOptions) -> QueuedInstall | NoReturn:
+    ogmios_src_path = os.path.join(cfg['CARDANO_SRC_PATH'], "ogmios")
+    print_neutral(ind('Building Ogmios...'))
+
+    assets_hash = ogmios_assets_hash()
+    prepare_ogmios_source(cfg, ogmios_src_path, assets_hash)
+
+    installable = flake_ref(ogmios_src_path, "ogmios", "server")
+    flags = ["--accept-flake-config", "--no-warn-dirty"]
+    substituters = check_substitutes("Ogmios", [installable], flags, opts)
+    store_paths = build_outputs("Ogmios", [installable], flags, opts, substituters)
+
+    queued: QueuedInstall = {
+        'elements': ["server", ".*ogmios*"],
+        'installables': [installable],
+        'flags': flags,
+        'components': [{
+            'component': "ogmios", 'release': f"v{cfg['OGMIOS_RELEASE']}",
+            'repo_path': ogmios_src_path, 'store_paths': store_paths, 'inputs': assets_hash,
+        }],
+    }
+    queue_install(cfg, txn, queued)
 
     print_success_generic()
-    os.chdir(original_cwd)
+    return queued
 
 
 def download_node_configs(
@@ -212,15 +325,41 @@ def download_node_configs(
         "conway-genesis",
         "shelley-genesis",
     ]
-    for net in Network:
+    jobs = []
+    for net in paths.networks:
         network_paths: NetworkPaths = getattr(paths, net.value)
-        config_path = network_paths.config
-        os.chdir(config_path)
-        config_src = f"https://book.world.dev.cardano.org/environments/{net.value}"
+        config_src = f"{CONFIG_BASE_URL.rstrip('/')}/{net.value}"
 
         for file in config_files:
-            run_quiet(
-                ["curl", "-O", "-J", f"{config_src}/{file}.json"],
-                f"Error downloading '{file}.json'")
+            # Genesis files must stay as published, so only they share one linked blob;
+            # the others are copies, as users edit them (i.e. topology peers)
+            jobs.append(DownloadJob(
+                f"{config_src}/{file}.json",
+                os.path.join(network_paths.config, f"{file}.json"),
+                copy=not file.endswith("-genesis")))
+
+    downloader = Downloader(
+        state_path(paths.cardano_path, 'config-manifest.json'),
+        BlobStore.for_cardano_path(paths.cardano_path))
+    try:
+        with span("fetch config files", 'download') as span_args:
+            report = downloader.fetch_all(jobs)
+            span_args['bytes_received'] = report.bytes_received
+    except DownloadError as e:
+        print_fail(ind2(str(e)))
+        sys.exit(1)
+
+    print_neutral(ind2(
+        f"{len(report.fetched)} updated, {len(report.unchanged)} unchanged "
+        f"({report.bytes_received} bytes received)"))
+    print_success_generic()
+    # Part of the download step, so a --resume run after a mismatch downloads again
+    verify_genesis(paths)
+
 
+def collect_config_blobs(paths: Paths) -> None:
+    print_neutral(ind("Removing unreferenced config blobs..."))
+    report = BlobStore.for_cardano_path(paths.cardano_path).gc()
+    print_neutral(ind2(
+        f"{report.removed} removed ({report.bytes_freed} bytes freed), {report.kept} in use"))
     print_success_generic()
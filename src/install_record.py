@@ -0,0 +1,70 @@
+import os
+import subprocess
+import threading
+from typing import TypedDict
+
+from .state import profile_store_paths
+from .utils import read_json, state_path, write_json_atomic
+
+ComponentRecord = TypedDict('ComponentRecord', {
+    'release': str,
+    'commit': str,
+    'store_paths': list[str],
+    # Hash of any local inputs layered over the release (i.e. Ogmios assets)
+    'inputs': str | None,
+})
+
+_record_lock = threading.Lock()
+
+
+def record_path(cardano_path: str) -> str:
+    return state_path(cardano_path, 'installed.json')
+
+
+def load_record(cardano_path: str) -> dict[str, ComponentRecord]:
+    return read_json(record_path(cardano_path), {})
+
+
+def save_component(cardano_path: str, component: str, entry: ComponentRecord) -> None:
+    with _record_lock:
+        record = load_record(cardano_path)
+        record[component] = entry
+        write_json_atomic(record_path(cardano_path), record)
+
+
+def tag_commit(repo_path: str, tag: str) -> str | None:
+    """
+    Resolves a tag to its commit in a local clone, without touching the network.
+    """
+    try:
+        return subprocess.check_output(
+            ["git", "rev-parse", "--verify", "--quiet", f"refs/tags/{tag}^{{commit}}"],
+            cwd=repo_path, stderr=subprocess.DEVNULL, text=True).strip() or None
+    except (OSError, subprocess.CalledProcessError):
+        return None
+
+
+def is_current(
+        cardano_path: str, components: list[str], release: str, repo_path: str,
+        inputs: str | None = None) -> bool:
+    """
+    True if every component was last installed from `release` at the commit the tag
+    resolves to locally, with the same local inputs, and its store paths are still
+    in the nix profile.
+    """
+    record = load_record(cardano_path)
+    entries = [record.get(component) for component in components]
+    if not all(entries):
+        return False
+    commit = tag_commit(repo_path, release)
+    installed = profile_store_paths()
+    if commit is None or installed is None:
+        return False
+    for entry in entries:
+        if entry['release'] != release or entry['commit'] != commit or \
+                entry['inputs'] != inputs:
+            return False
+        if not entry['store_paths'] or not all(
+                p in installed and os.path.exists(p) for p in entry['store_paths']):
+            return False
+    return True
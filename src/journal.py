@@ -0,0 +1,79 @@
+import hashlib
+import json
+import os
+import threading
+import time
+from typing import Any, Callable, TypedDict
+
+from .utils import STATE_DIRNAME, read_json, write_json_atomic
+
+JOURNAL_FILENAME = "journal.json"
+
+JournalEntry = TypedDict('JournalEntry', {
+    'key': str,
+    'result': Any,
+    'completed': float,
+})
+
+
+def step_key(name: str, inputs: Any, dep_keys: list[str | None] = []) -> str:
+    """
+    Identifies a step run with the given inputs after dependencies with the given keys,
+    so a step is invalidated whenever anything before it changed.
+    """
+    return hashlib.sha256(json.dumps([name, inputs, dep_keys], sort_keys=True).encode()).hexdigest()
+
+
+class Journal():
+    """
+    Durable record of the install steps completed in a run, with the inputs that produced
+    them and their results. A resumed run skips the steps it records, as long as their
+    inputs are unchanged, and reuses their results.
+    """
+    path: str | None
+    entries: dict[str, JournalEntry]
+
+    def __init__(self, cardano_path: str | None, resume: bool):
+        self.path = os.path.join(cardano_path, STATE_DIRNAME, JOURNAL_FILENAME) \
+            if cardano_path else None
+        self.entries = read_json(self.path, {}) if self.path and resume else {}
+        self._lock = threading.Lock()
+        # A fresh run starts a fresh journal
+        if self.path and not resume and os.path.exists(self.path):
+            os.remove(self.path)
+
+    def _save(self) -> None:
+        if self.path:
+            os.makedirs(os.path.dirname(self.path), exist_ok=True)
+            write_json_atomic(self.path, self.entries)
+
+    def completed(self, name: str, key: str) -> JournalEntry | None:
+        entry = self.entries.get(name)
+        return entry if entry is not None and entry['key'] == key else None
+
+    def record(self, name: str, key: str, result: Any = None) -> None:
+        with self._lock:
+            self.entries[name] = {'key': key, 'result': result, 'completed': time.time()}
+            self._save()
+
+    def run_step(self, name: str, inputs: Any, run: Callable[[], Any]) -> tuple[Any, bool]:
+        """
+        Runs a step outside the scheduler unless it already completed with the same
+        inputs. Returns its result and whether it was skipped.
+        """
+        key = step_key(name, inputs)
+        entry = self.completed(name, key)
+        if entry is not None:
+            return entry['result'], True
+        result = run()
+        self.record(name, key, result)
+        return result, False
+
+    def finish(self) -> None:
+        """
+        Forgets the run once it has completed, so there is nothing left to resume.
+        """
+        with self._lock:
+            self.entries = {}
+            if self.path and os.path.exists(self.path):
+                os.remove(self.path)
@@ -0,0 +1,99 @@
+import os
+import shlex
+from typing import NoReturn
+
+from .paths import Network, NetworkPaths, Paths, node_alias
+from .utils import ind, ind2, print_neutral, print_success_generic, write_text_atomic
+
+GIB = 1024 ** 3
+MIB = 1024 ** 2
+
+NODE_PORTS = {
+    Network.PREPROD: 1337,
+    Network.PREVIEW: 1338,
+    Network.MAINNET: 1339,
+}
+
+# Rough live heap of each network's node, which sets its share of memory when several
+# nodes run on one host
+LIVE_HEAP = {
+    Network.PREPROD: 2 * GIB,
+    Network.PREVIEW: 2 * GIB,
+    Network.MAINNET: 12 * GIB,
+}
+# Memory left to the nodes; the rest is for the OS, the page cache and other tools
+MEMORY_FRACTION = 0.75
+# The node gains little from more GHC capabilities than this
+MAX_CAPABILITIES = 4
+
+
+def rts_options(
+        net: Network, networks: list[Network], cores: int,
+        memory: int | None) -> list[str]:
+    """
+    GHC RTS options for one network's node, sized so that the nodes of all `networks`
+    can share the host's cores and memory.
+    """
+    capabilities = max(1, min(MAX_CAPABILITIES, cores // len(networks)))
+    options = [f"-N{capabilities}"]
+    if memory is None:
+        return ["+RTS", *options, "-A16m", "-RTS"]
+
+    total_live = sum(LIVE_HEAP[n] for n in networks)
+    share = int(memory * MEMORY_FRACTION * LIVE_HEAP[net] / total_live)
+    # Larger allocation areas mean fewer minor GCs, if there is memory to spare
+    options.append("-A64m" if share >= 8 * GIB else "-A16m")
+    # Start with half the share, so the heap doesn't grow in many small steps
+    options.append(f"-H{share // 2 // MIB}m")
+    # The copying collector needs about twice the live heap at peak, which won't fit
+    # in this node's share: collect the old generation in place instead
+    if share < 2 * LIVE_HEAP[net]:
+        options.append("--nonmoving-gc")
+    return ["+RTS", *options, "-RTS"]
+
+
+def launcher_path(paths: Paths, net: Network) -> str:
+    return os.path.join(paths.bin, node_alias(net))
+
+
+def launcher_script(paths: Paths, net: Network, rts: list[str]) -> str:
+    network_paths: NetworkPaths = getattr(paths, net.value)
+    args = [
+        "cardano-node", "run",
+        "--topology", os.path.join(network_paths.config, "topology.json"),
+        "--database-path", network_paths.db,
+        "--socket-path", network_paths.socket,
+        "--port", str(NODE_PORTS[net]),
+        "--config", os.path.join(network_paths.config, "config.json"),
+        *rts,
+    ]
+    return "\n".join([
+        "#!/usr/bin/env bash",
+        f"# {net.value} node launcher, generated by cardano-ez-installer: re-run the installer",
+        "# to regenerate it (i.e. after adding memory or cores). Extra arguments are passed on.",
+        "set -e",
+        f"export CARDANO_NODE_SOCKET_PATH={shlex.quote(network_paths.socket)}",
+        "# Point the shared socket path at the node started last",
+        f"ln -sfn \"$CARDANO_NODE_SOCKET_PATH\" {shlex.quote(paths.socket)}",
+        f"exec {' '.join(shlex.quote(arg) for arg in args)} \"$@\"",
+        "",
+    ])
+
+
+def write_launchers(paths: Paths, cores: int, memory: int | None) -> None | NoReturn:
+    """
+    Writes a launcher script per network to CARDANO_PATH/bin, each with its own port and
+    socket, so the nodes of all set up networks can run side by side.
+    """
+    print_neutral(ind("Writing node launchers..."))
+    for net in Network:
+        path = launcher_path(paths, net)
+        if net not in paths.networks:
+            if os.path.exists(path):
+                os.remove(path)
+            continue
+        rts = rts_options(net, paths.networks, cores, memory)
+        write_text_atomic(path, launcher_script(paths, net, rts), 0o755)
+        print_neutral(ind2(
+            f"* {node_alias(net)}: port {NODE_PORTS[net]}, {' '.join(rts[1:-1])}"))
+    print_success_generic()
@@ -0,0 +1,103 @@
+import base64
+import os
+import socket
+from typing import NoReturn
+
+from .install_record import load_record
+from .nix_options import NixOptions
+from .utils import (STATE_DIRNAME, ind, ind2, print_neutral, print_success, print_success_generic,
+                    run_capture, run_quiet, state_path, write_text_atomic)
+
+# Ahead of the public caches (cache.nixos.org advertises 40)
+LOCAL_CACHE_PRIORITY = 10
+SECRET_KEY_FILENAME = "binary-cache-key.sec"
+
+
+def cache_url(cache_dir: str) -> str:
+    return f"file://{os.path.abspath(os.path.expanduser(cache_dir))}"
+
+
+def cache_public_keys(cardano_path: str | None) -> list[str]:
+    """
+    Keys trusted for local caches: the ones pinned in LOCAL_BINARY_CACHE_KEYS, and this
+    host's own. Keys are never read from a cache directory, since anyone who can write
+    to it could add their own key along with the paths it signs.
+    """
+    keys = os.environ.get('LOCAL_BINARY_CACHE_KEYS', '').split()
+    if cardano_path:
+        try:
+            with open(os.path.join(cardano_path, STATE_DIRNAME, SECRET_KEY_FILENAME)) as f:
+                keys.append(public_key(f.read()))
+        except FileNotFoundError:
+            pass
+    return keys
+
+
+def use_local_cache(cache_dir: str, opts: NixOptions, cardano_path: str | None) -> None:
+    """
+    Adds a local binary cache to the substituters of every build, trusting the pinned keys.
+    """
+    keys = cache_public_keys(cardano_path)
+    if not os.path.exists(os.path.join(os.path.expanduser(cache_dir), "nix-cache-info")):
+        print_neutral(ind2(f"* {cache_dir}: no binary cache exported there yet"))
+        return
+    if not keys:
+        print_neutral(ind2(
+            f"* {cache_dir}: LOCAL_BINARY_CACHE_KEYS isn't set, so its paths won't be used"))
+        return
+    opts.local_caches.append(cache_url(cache_dir))
+    opts.trusted_public_keys += [key for key in keys if key not in opts.trusted_public_keys]
+    print_success(ind2(f"* Using local binary cache {cache_dir}"))
+
+
+def public_key(secret_key: str) -> str:
+    # An ed25519 secret key holds its public key in its last 32 bytes
+    name, _, key = secret_key.strip().partition(":")
+    return f"{name}:{base64.b64encode(base64.b64decode(key)[32:]).decode()}"
+
+
+def signing_key(cardano_path: str) -> str | NoReturn:
+    """
+    Returns the path of this host's key for signing exported paths, generating it first
+    if needed.
+    """
+    path = state_path(cardano_path, SECRET_KEY_FILENAME)
+    if not os.path.exists(path):
+        secret_key = run_capture(
+            ["nix", "key", "generate-secret", "--key-name",
+             f"ez-installer-{socket.gethostname()}-1"],
+            "Error generating binary cache signing key", quiet=True)
+        write_text_atomic(path, secret_key, 0o600)
+    return path
+
+
+def export_closures(cache_dir: str, cardano_path: str) -> None | NoReturn:
+    """
+    Copies the closures of every installed component into a local binary cache, signed
+    with this host's key, so later installs here or on hosts sharing the directory can
+    substitute them instead of building. Paths already in the cache are skipped.
+    """
+    store_paths = sorted({
+        path for record in load_record(cardano_path).values() for path in record['store_paths']})
+    if not store_paths:
+        return
+    print_neutral(ind(f"Exporting installed closures to {cache_dir}..."))
+    cache_dir = os.path.abspath(os.path.expanduser(cache_dir))
+    os.makedirs(cache_dir, exist_ok=True)
+
+    key_path = signing_key(cardano_path)
+    with open(key_path) as f:
+        key = public_key(f.read())
+
+    info_path = os.path.join(cache_dir, "nix-cache-info")
+    if not os.path.exists(info_path):
+        write_text_atomic(
+            info_path, f"StoreDir: /nix/store\nWantMassQuery: 1\nPriority: {LOCAL_CACHE_PRIORITY}\n")
+    # zstd compresses the large GHC closures far faster than nix's default (xz)
+    run_quiet(
+        ["nix", "copy", "--to", f"{cache_url(cache_dir)}?compression=zstd&secret-key={key_path}",
+         *store_paths],
+        f"Error exporting to binary cache {cache_dir}")
+    # Other hosts have to pin the key to trust what this one exports
+    print_neutral(ind2(f"* Signed with {key} (add it to LOCAL_BINARY_CACHE_KEYS on other hosts)"))
+    print_success_generic()
@@ -1,7 +1,5 @@
 # Check Nix config
 import getpass
-import json
-import subprocess
 from functools import partial
 from typing import Any, Callable, TypedDict
 from src.utils import ind, ind2, print_fail, print_neutral, print_report
@@ -30,6 +28,17 @@ def get_required_attributes() -> RequiredAttrs:
     }
 
 
+def keeps_build_dependencies(nix_conf_json: dict[str, Any] | None) -> bool:
+    """
+    True if nix keeps the derivations and build-time dependencies of rooted paths, which
+    the nix-store clean-up relies on to spare the next upgrade a cold build.
+    """
+    if nix_conf_json is None:
+        return False
+    return all(nix_conf_json.get(flag, {}).get("value") is True
+               for flag in get_required_attributes()["flags"])
+
+
 def check_attr(
         nix_conf_json: dict[str, Any],
         attribute: str, pred: Callable[[Any],
@@ -75,10 +84,8 @@ def check_set_attr(
     return passed
 
 
-def check_nix_conf() -> bool:
+def check_nix_conf(nix_conf_json: dict[str, Any]) -> bool:
     print_neutral(f'\n{ind("Checking nix.conf...")}')
-    nix_conf_output = subprocess.check_output(["nix", "config", "show", "--json"])
-    nix_conf_json = json.loads(nix_conf_output)
     req_attributes = get_required_attributes()
     check_set_attr_ = partial(check_set_attr, nix_conf_json, req_attributes)
     attrs = ["experimental-features"]
@@ -0,0 +1,158 @@
+import getpass
+import hashlib
+import os
+import re
+from typing import NoReturn
+
+from .history import build_times, format_bytes, format_seconds
+from .install_record import load_record
+from .utils import (ind, ind2, print_fail, print_neutral, print_success_generic, run_capture, run_quiet,
+                    state_path)
+
+DEFAULT_KEEP_GENERATIONS = 3
+# Last line of `nix-store --gc`, i.e. "1234 store paths deleted, 5678.90 MiB freed"
+_freed_re = re.compile(r"(\d+) store paths deleted, ([\d.]+) (bytes|KiB|MiB|GiB|TiB) freed")
+_units = {"bytes": 1, "KiB": 1024, "MiB": 1024 ** 2, "GiB": 1024 ** 3, "TiB": 1024 ** 4}
+
+
+def user_gcroots_dir() -> str:
+    state_dir = os.environ.get('NIX_STATE_DIR', '/nix/var/nix')
+    return os.path.join(state_dir, 'gcroots', 'per-user', getpass.getuser())
+
+
+def root_paths(cardano_path: str, build_dependencies: bool) -> dict[str, list[str]]:
+    """
+    Store paths to keep for each installed component: its outputs and, with
+    `build_dependencies`, the derivations that built them. With keep-derivations and
+    keep-outputs set in nix.conf, a rooted derivation keeps its whole build closure,
+    toolchain and dependencies included.
+    """
+    record = load_record(cardano_path)
+    outputs = [path for entry in record.values() for path in entry['store_paths']
+               if os.path.exists(path)]
+    if not build_dependencies:
+        return {component: paths for component, entry in record.items()
+                if (paths := [path for path in entry['store_paths'] if path in outputs])}
+    if not outputs:
+        return {}
+    derivers = dict(zip(outputs, run_capture(
+        ["nix-store", "--query", "--deriver", *outputs],
+        "Error querying the derivations of the installed components", quiet=True).split()))
+    roots = {}
+    for component, entry in record.items():
+        paths = [path for path in entry['store_paths'] if path in derivers]
+        # Derivations garbage collected before keep-derivations was set show as "unknown-deriver"
+        paths += [derivers[path] for path in paths
+                  if derivers[path].endswith('.drv') and os.path.exists(derivers[path])]
+        if paths:
+            roots[component] = paths
+    return roots
+
+
+def add_gc_roots(cardano_path: str, roots: dict[str, list[str]]) -> None:
+    """
+    Registers indirect GC roots for the given store paths, replacing the ones added for
+    earlier installs, so their build closures survive garbage collection. Like roots made
+    by `nix build`, these are links in CARDANO_PATH registered in the user's gcroots.
+    """
+    links_dir = os.path.dirname(state_path(cardano_path, 'gcroots', 'roots'))
+    registry = user_gcroots_dir()
+    os.makedirs(registry, exist_ok=True)
+    # Names in the shared registry are qualified by tree, so several trees can keep roots
+    prefix = f"cardano-ez-installer-{hashlib.sha256(cardano_path.encode()).hexdigest()[:8]}-"
+
+    wanted = {f"{component}-{os.path.basename(path)}": path
+              for component, paths in roots.items() for path in paths}
+    for name in os.listdir(links_dir):
+        if name not in wanted:
+            os.remove(os.path.join(links_dir, name))
+    for name in os.listdir(registry):
+        if name.startswith(prefix) and name.removeprefix(prefix) not in wanted:
+            os.remove(os.path.join(registry, name))
+
+    for name, path in wanted.items():
+        for link, target in [(os.path.join(links_dir, name), path),
+                             (os.path.join(registry, prefix + name), os.path.join(links_dir, name))]:
+            if os.path.islink(link) and os.readlink(link) == target:
+                continue
+            tmp_link = f"{link}.{os.getpid()}.tmp"
+            os.symlink(target, tmp_link)
+            os.replace(tmp_link, link)
+
+
+def freed_bytes(gc_output: str) -> tuple[int, int] | None:
+    """
+    Reads the number of deleted store paths and the bytes freed from `nix-store --gc` output.
+    """
+    match = _freed_re.search(gc_output)
+    if match is None:
+        return None
+    return int(match[1]), int(float(match[2]) * _units[match[3]])
+
+
+def trim_generations(keep: int) -> int:
+    """
+    Deletes the user profile's generations older than the last `keep` (never the current
+    one), the way nix does: by removing their links. Returns how many were deleted.
+    `nix-env --delete-generations` would refuse profiles managed with `nix profile`.
+    """
+    profile_link = os.path.expanduser("~/.nix-profile")
+    if not os.path.islink(profile_link):
+        return 0
+    profile = os.path.join(os.path.dirname(profile_link), os.readlink(profile_link))
+    current = os.readlink(profile) if os.path.islink(profile) else None
+    profiles_dir, name = os.path.split(profile)
+    generation_re = re.compile(rf"{re.escape(name)}-(\d+)-link")
+    generations = sorted(
+        (int(match[1]), entry) for entry in os.listdir(profiles_dir)
+        if (match := generation_re.fullmatch(entry)))
+    old = [entry for _, entry in generations[:max(0, len(generations) - keep)]
+           if entry != os.path.basename(current or '')]
+    for entry in old:
+        os.remove(os.path.join(profiles_dir, entry))
+    return len(old)
+
+
+def collect_garbage(
+        cardano_path: str, keep_build_dependencies: bool,
+        keep_generations: int = DEFAULT_KEEP_GENERATIONS, full: bool = False) -> None | NoReturn:
+    """
+    Cleans up the nix-store without throwing away what the installed components were
+    built with: their outputs and build closures are rooted, only profile generations
+    beyond the last `keep_generations` are deleted, and then unrooted paths are collected.
+    Build closures can only be kept if nix.conf sets keep-derivations and keep-outputs
+    (`keep_build_dependencies`); otherwise only the outputs are.
+    With `full`, deletes every old generation and everything unrooted instead.
+    """
+    print_neutral(ind("Cleaning up nix-store..."))
+    if full:
+        run_quiet(["nix-collect-garbage", "-d"], "Error cleaning up nix-store")
+        print_success_generic()
+        return
+
+    roots = root_paths(cardano_path, keep_build_dependencies)
+    add_gc_roots(cardano_path, roots)
+    if keep_build_dependencies:
+        print_neutral(ind2(
+            f"* Kept the outputs and build dependencies of {', '.join(roots) or 'nothing'}"))
+    else:
+        print_neutral(ind2(f"* Kept the outputs of {', '.join(roots) or 'nothing'}"))
+        print_fail(ind2(
+            "* Build dependencies can't be kept without 'keep-derivations = true' and "
+            "'keep-outputs = true' in nix.conf, so the next upgrade may rebuild them (see README)"))
+    deleted = trim_generations(keep_generations)
+    print_neutral(ind2(f"* Deleted {deleted} profile generations older than the last {keep_generations}"))
+    freed = freed_bytes(run_capture(
+        ["nix-store", "--gc"], "Error collecting garbage", quiet=True))
+    if freed is not None:
+        print_neutral(ind2(f"* Freed {format_bytes(freed[1])} ({freed[0]} store paths)"))
+    # What a full clean-up would have cost the next upgrade
+    times = {name: seconds for name, seconds in build_times(cardano_path).items()
+             if name in roots} if keep_build_dependencies else {}
+    if times:
+        per_component = ", ".join(
+            f"{name} {format_seconds(seconds)}" for name, seconds in times.items())
+        print_neutral(ind2(
+            f"* Kept build dependencies that took {format_seconds(sum(times.values()))} to build "
+            f"from source on this host ({per_component})"))
+    print_success_generic()
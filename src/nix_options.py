@@ -0,0 +1,77 @@
+import threading
+from typing import Any
+
+GIB = 1024 ** 3
+
+# Peak memory of one GHC derivation build (the node's larger packages reach this)
+BUILD_JOB_MEMORY = 4 * GIB
+# Memory left to the OS and the nix daemon while building
+BUILD_MEMORY_RESERVE = 2 * GIB
+# Concurrent builds on a spinning disk mostly wait on each other's unpacking and linking
+HDD_MAX_JOBS = 2
+
+
+def build_jobs(cores: int, memory: int | None, disk: str | None) -> int:
+    """
+    Number of derivations to build at once: as many as fit in memory (and suit the disk).
+    """
+    jobs = cores
+    if memory is not None:
+        jobs = min(jobs, (memory - BUILD_MEMORY_RESERVE) // BUILD_JOB_MEMORY)
+    if disk == 'hdd':
+        jobs = min(jobs, HDD_MAX_JOBS)
+    return max(1, jobs)
+
+
+def build_cores(cores: int, jobs: int) -> int:
+    """
+    Cores each build may use, splitting them between the builds running at once.
+    """
+    return max(1, cores // max(1, jobs))
+
+
+class NixOptions():
+    """
+    Options shared by every nix build and profile install of a run.
+    Filled in by preflight steps before the builds start.
+    """
+    substituters: list[str] | None
+    # The probes they were ordered from (CacheProbe), to reorder them for each build
+    cache_probes: list[Any]
+    max_jobs: int | None
+    cores: int | None
+    # Local binary caches, probed along with the configured substituters
+    local_caches: list[str]
+    trusted_public_keys: list[str]
+    # What nix.conf trusts, without the keys above
+    conf_public_keys: list[str]
+    # Held by each nix build, so concurrent builds stay within max-jobs
+    build_slots: threading.Semaphore
+
+    def __init__(self):
+        self.substituters = None
+        self.cache_probes = []
+        self.max_jobs = None
+        self.cores = None
+        self.local_caches = []
+        self.trusted_public_keys = []
+        self.conf_public_keys = []
+        self.build_slots = threading.Semaphore(1)
+
+    def args(self, substituters: list[str] | None = None) -> list[str]:
+        """
+        Options for a nix command, with `substituters` instead of the run's if given.
+        """
+        args = []
+        substituters = self.substituters if substituters is None else substituters
+        if substituters is not None:
+            args += ["--option", "substituters", " ".join(substituters)]
+        elif self.local_caches:
+            args += ["--option", "extra-substituters", " ".join(self.local_caches)]
+        if self.trusted_public_keys:
+            args += ["--option", "extra-trusted-public-keys", " ".join(self.trusted_public_keys)]
+        if self.max_jobs is not None:
+            args += ["--max-jobs", str(self.max_jobs)]
+        if self.cores is not None:
+            args += ["--cores", str(self.cores)]
+        return args
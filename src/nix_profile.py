@@ -0,0 +1,100 @@
+import os
+import re
+import threading
+from typing import Callable, NoReturn
+
+from .utils import ind, print_neutral, print_success_generic, run_quiet
+
+
+def flag_groups(flags: list[str]) -> list[tuple[str, ...]]:
+    """
+    Splits command line flags into options with their values (i.e. `--option name value`).
+    """
+    groups: list[tuple[str, ...]] = []
+    for flag in flags:
+        if flag.startswith('-') or not groups:
+            groups.append((flag,))
+        else:
+            groups[-1] += (flag,)
+    return groups
+
+
+def current_generation() -> int | None:
+    """
+    The number of the user profile's current generation, read from its links.
+    """
+    profile_link = os.path.expanduser("~/.nix-profile")
+    if not os.path.islink(profile_link):
+        return None
+    profile = os.path.join(os.path.dirname(profile_link), os.readlink(profile_link))
+    if not os.path.islink(profile):
+        return None
+    match = re.fullmatch(
+        rf"{re.escape(os.path.basename(profile))}-(\d+)-link",
+        os.path.basename(os.readlink(profile)))
+    return int(match[1]) if match else None
+
+
+class ProfileTransaction():
+    """
+    Collects the profile removals and installs of a run and applies them with a single
+    `nix profile remove` and a single `nix profile install`, instead of one profile
+    generation per element. Installables must be absolute flake refs and should already
+    be built, so committing only links existing outputs into the profile. If the install
+    fails, the profile is rolled back to the generation it had before the removal.
+    """
+    removals: list[str]
+    installables: list[str]
+    flags: list[str]
+
+    def __init__(self):
+        self.removals = []
+        self.installables = []
+        self.flags = []
+        self._flag_sets: set[tuple[str, ...]] = set()
+        self._on_commit: list[Callable[[], None]] = []
+        self._lock = threading.Lock()
+
+    def add(
+            self, elements: list[str], installables: list[str], flags: list[str],
+            on_commit: Callable[[], None] | None = None) -> None:
+        """
+        Queues replacing the profile `elements` (names or regexes) with `installables`.
+        `on_commit` runs once the profile has been updated.
+        """
+        with self._lock:
+            self.removals += [e for e in elements if e not in self.removals]
+            self.installables += installables
+            for group in flag_groups(flags):
+                if group not in self._flag_sets:
+                    self._flag_sets.add(group)
+                    self.flags += group
+            if on_commit:
+                self._on_commit.append(on_commit)
+
+    def commit(self) -> None | NoReturn:
+        with self._lock:
+            if not self.installables:
+                return
+            print_neutral(ind("Updating nix profile..."))
+            generation = current_generation()
+            run_quiet(
+                ["nix", "profile", "remove", *self.removals],
+                "Error removing previous installs from nix profile")
+            try:
+                run_quiet(
+                    ["nix", "profile", "install", *self.flags, *self.installables],
+                    "Error installing into nix profile")
+            except SystemExit:
+                # Don't leave the profile without the removed components
+                if generation is not None:
+                    print_neutral(ind(f"Restoring nix profile generation {generation}..."))
+                    run_quiet(
+                        ["nix", "profile", "rollback", "--to", str(generation)],
+                        "Error restoring the previous nix profile generation")
+                raise
+            for callback in self._on_commit:
+                callback()
+            self.removals, self.installables, self.flags = [], [], []
+            self._flag_sets, self._on_commit = set(), []
+            print_success_generic()
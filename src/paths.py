@@ -1,7 +1,6 @@
 import os
 from enum import Enum
 from typing import NoReturn, TypedDict
-from .config_vars import ConfigVars
 
 
 class Network(Enum):
@@ -10,6 +9,10 @@ class Network(Enum):
     MAINNET = 'mainnet'
 
 
+def node_alias(net: Network) -> str:
+    return f"{'main' if net.value == 'mainnet' else net.value}-node"
+
+
 class Subdir(Enum):
     CONFIG = 'config'
     DB = 'db'
@@ -26,44 +29,47 @@ class NetworkPaths():
     path: str
     config: str
     db: str
+    socket: str
 
     def __init__(self, cardano_path: str, network: Network):
         self.network = network.value
         self.path = os.path.join(cardano_path, self.network)
         for subdir in Subdir:
             setattr(self, subdir.value, os.path.join(self.path, subdir.value))
+        # Each network's node has its own socket, so several can run at once
+        self.socket = os.path.join(self.path, 'node.socket')
 
 
 class Paths():
+    cardano_path: str
+    networks: list[Network]
     preprod: NetworkPaths
     preview: NetworkPaths
     mainnet: NetworkPaths
     socket: str
+    bin: str
 
-    def __init__(self, cardano_path: str):
+    def __init__(self, cardano_path: str, networks: list[Network] | None = None):
+        self.cardano_path = cardano_path
+        # Only these networks are set up, but paths are known for all of them
+        self.networks = networks or list(Network)
         for net in Network:
             setattr(self, net.value, NetworkPaths(cardano_path, net))
+        # Linked by the node launchers to the socket of the node started last
         self.socket = os.path.join(cardano_path, 'node.socket')
+        self.bin = os.path.join(cardano_path, 'bin')
 
     def make_paths(self) -> None | NoReturn:
-        for net in Network:
+        for net in self.networks:
             nps: NetworkPaths = getattr(self, net.value)
 
             if not os.path.exists(nps.path):
                 os.mkdir(nps.path)
 
-            os.chdir(nps.path)
             for subdir in Subdir:
                 path = getattr(nps, subdir.value)
                 if not os.path.exists(path):
                     os.mkdir(path)
 
-        # Create node.socket
-        if not os.path.exists(self.socket):
-            open(self.socket, 'a').close()
-
-
-def make_paths(cfg: ConfigVars) -> Paths | NoReturn:
-    paths: Paths = Paths(cfg['CARDANO_PATH'])
-    paths.make_paths()
-    return paths
+        if not os.path.exists(self.bin):
+            os.mkdir(self.bin)
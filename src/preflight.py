@@ -0,0 +1,241 @@
+import getpass
+import hashlib
+import json
+import os
+import platform
+import shutil
+import subprocess
+import sys
+import threading
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, Callable, NoReturn, TypedDict
+
+from .get_os_info import get_architecture, get_os_info
+from .hardware import cpu_count, disk_kind, total_memory
+from .nix_options import NixOptions, build_cores, build_jobs
+from .paths import Network
+from .utils import (STATE_DIRNAME, ind, ind2, print_fail, print_neutral, print_success, read_json,
+                    write_json_atomic)
+
+GIB = 1024 ** 3
+
+# Tools the installer runs: nix-collect-garbage ships with nix
+REQUIRED_TOOLS = ["nix", "git"]
+
+# Rough size of each network's node database, plus room to grow
+DB_SPACE = {
+    Network.PREPROD: 20 * GIB,
+    Network.PREVIEW: 15 * GIB,
+    Network.MAINNET: 250 * GIB,
+}
+# Source checkouts of the node, Aiken and Ogmios
+SRC_SPACE = 3 * GIB
+
+PREFLIGHT_CACHE = "preflight.json"
+
+# Nix's own defaults: anything else in nix.conf was set on purpose, and is left alone
+NIX_PARALLELISM_DEFAULTS = {'max-jobs': 1, 'cores': 0}
+
+Environment = TypedDict('Environment', {
+    'tools': dict[str, str | None],
+    'nix_conf': dict[str, Any] | None,
+    'os': list[str | None],
+    'architecture': list[str | None],
+    'cores': int,
+    'memory': int | None,
+    'disk': str | None,
+})
+
+
+def tool_version(tool: str) -> str | None:
+    try:
+        return subprocess.check_output(
+            [tool, "--version"], stderr=subprocess.DEVNULL, text=True).splitlines()[0]
+    except (OSError, subprocess.CalledProcessError, IndexError):
+        return None
+
+
+def nix_conf_json() -> dict[str, Any] | None:
+    try:
+        return json.loads(subprocess.check_output(
+            ["nix", "config", "show", "--json"], stderr=subprocess.DEVNULL))
+    except (OSError, ValueError, subprocess.CalledProcessError):
+        return None
+
+
+def nix_conf_files() -> list[str]:
+    conf_dir = os.environ.get('NIX_CONF_DIR', '/etc/nix')
+    config_home = os.environ.get('XDG_CONFIG_HOME', os.path.expanduser('~/.config'))
+    return [
+        os.path.join(conf_dir, 'nix.conf'),
+        os.path.join(config_home, 'nix', 'nix.conf'),
+    ]
+
+
+def fingerprint() -> str:
+    """
+    Identifies everything the cached probes depend on: the nix.conf files and the tool
+    binaries (by mtime, so upgrading a tool or editing nix.conf invalidates the cache).
+    """
+    parts: list[Any] = [
+        # Results cached by an installer that probed for less are stale too
+        sorted(Environment.__annotations__),
+        getpass.getuser(), os.environ.get('NIX_CONFIG'), platform.uname(),
+    ]
+    for path in [*nix_conf_files(), *filter(None, map(shutil.which, REQUIRED_TOOLS))]:
+        try:
+            stat = os.stat(path)
+            parts.append([os.path.realpath(path), stat.st_mtime_ns, stat.st_size])
+        except OSError:
+            parts.append([path, None])
+    return hashlib.sha256(json.dumps(parts).encode()).hexdigest()
+
+
+def probe_environment() -> Environment:
+    """
+    Runs every probe at once: each is a separate subprocess (or syscall).
+    """
+    probes: dict[str, Callable[[], Any]] = {
+        **{f"tool:{tool}": (lambda tool=tool: tool_version(tool)) for tool in REQUIRED_TOOLS},
+        'nix_conf': nix_conf_json,
+        'os': lambda: list(get_os_info()),
+        'architecture': lambda: list(get_architecture()),
+        'cores': cpu_count,
+        'memory': total_memory,
+        # Builds write to the nix store
+        'disk': lambda: disk_kind("/nix/store"),
+    }
+    with ThreadPoolExecutor(max_workers=len(probes)) as executor:
+        futures = {name: executor.submit(probe) for name, probe in probes.items()}
+        results = {name: future.result() for name, future in futures.items()}
+    return {
+        'tools': {tool: results[f"tool:{tool}"] for tool in REQUIRED_TOOLS},
+        'nix_conf': results['nix_conf'],
+        'os': results['os'],
+        'architecture': results['architecture'],
+        'cores': results['cores'],
+        'memory': results['memory'],
+        'disk': results['disk'],
+    }
+
+
+def get_environment() -> Environment:
+    """
+    Returns the probed environment, cached under CARDANO_PATH (once it exists) until the
+    fingerprint changes.
+    """
+    cardano_path = os.environ.get('CARDANO_PATH')
+    cache_path = os.path.join(cardano_path, STATE_DIRNAME, PREFLIGHT_CACHE) \
+        if cardano_path and os.path.isdir(cardano_path) else None
+    key = fingerprint()
+    cached = read_json(cache_path, {}) if cache_path else {}
+    if cached.get('fingerprint') == key:
+        # Cores and memory are cheap to read, and may change without any tool changing
+        return {**cached['environment'], 'cores': cpu_count(), 'memory': total_memory()}
+
+    env = probe_environment()
+    # A missing tool or unreadable config is worth probing for again next time
+    if cache_path and env['nix_conf'] is not None and all(env['tools'].values()):
+        os.makedirs(os.path.dirname(cache_path), exist_ok=True)
+        write_json_atomic(cache_path, {'fingerprint': key, 'environment': env})
+    return env
+
+
+def free_space(path: str) -> int | None:
+    # Free space changes between runs, so it's never cached (statvfs is cheap)
+    while path and not os.path.exists(path):
+        path = os.path.dirname(path)
+    try:
+        stat = os.statvfs(path or '/')
+    except OSError:
+        return None
+    return stat.f_bavail * stat.f_frsize
+
+
+def check_free_space(networks: list[Network]) -> None:
+    """
+    Warns when the filesystems holding CARDANO_PATH and CARDANO_SRC_PATH look too small
+    for the node databases and sources. Nothing is enforced: databases fill up over time.
+    """
+    needed: dict[str, int] = {}
+    for var, space in [
+            ('CARDANO_PATH', sum(DB_SPACE[net] for net in networks)),
+            ('CARDANO_SRC_PATH', SRC_SPACE)]:
+        if os.environ.get(var):
+            needed[var] = space
+    for var, space in needed.items():
+        free = free_space(os.path.expanduser(os.environ[var]))
+        if free is None:
+            continue
+        if free < space:
+            print_fail(ind2(
+                f"* {var}: {free // GIB} GiB free, {space // GIB} GiB recommended for the "
+                f"selected networks"))
+        else:
+            print_success(ind2(f"* {var}: {free // GIB} GiB free"))
+
+
+def check_environment(networks: list[Network]) -> Environment | NoReturn:
+    """
+    Checks the tools and hardware the installer relies on, exiting if a required tool is
+    missing. The nix.conf checks are left to `check_nix_conf`.
+    """
+    print_neutral(f'\n{ind("Checking environment...")}')
+    env = get_environment()
+    missing = [tool for tool, version in env['tools'].items() if version is None]
+    for tool, version in env['tools'].items():
+        if version is not None:
+            print_success(ind2(f"* {tool}: {version}"))
+    for tool in missing:
+        print_fail(ind(f"{tool}: not installed"))
+    if 'nix' not in missing and env['nix_conf'] is None:
+        print_fail(ind("nix.conf: unable to read it with `nix config show --json`"))
+        missing.append("nix.conf")
+    if missing:
+        print_fail(
+            f'\n{ind("Environment error: install the missing tools and try again (See README for help).")}\n')
+        sys.exit(1)
+
+    memory = f", {env['memory'] / GIB:.0f} GiB memory" if env['memory'] else ""
+    disk = f", {env['disk'].upper()}" if env['disk'] else ""
+    print_success(ind2(f"* {env['os'][0]} {env['os'][1]} on {env['architecture'][0]}: "
+                       f"{env['cores']} cores{memory}{disk}"))
+    check_free_space(networks)
+    return env
+
+
+def check_build_parallelism(
+        env: Environment, opts: NixOptions, builds: int = 1, max_jobs: int | None = None,
+        cores: int | None = None) -> None:
+    """
+    Sets how many derivations nix builds at once and with how many cores each: from the
+    overrides if given, else from nix.conf if it changes Nix's default, else fitted to
+    the hardware. These are host-wide, so max-jobs is split between the nix builds run
+    at the same time, of which there are at most `builds` and no more than max-jobs.
+    """
+    nix_conf = env['nix_conf'] or {}
+
+    def choose(setting: str, override: int | None, auto: int) -> tuple[int | None, Any, str]:
+        # Returns the value to pass (None leaves it to nix.conf), the value in effect and its source
+        default = NIX_PARALLELISM_DEFAULTS[setting]
+        conf_value = nix_conf.get(setting, {}).get('value', default)
+        if override is not None:
+            return override, override, "override"
+        if conf_value != default:
+            return None, conf_value, "from nix.conf"
+        return auto, auto, "auto"
+
+    opts.max_jobs, jobs, jobs_source = choose(
+        'max-jobs', max_jobs, build_jobs(env['cores'], env['memory'], env['disk']))
+    at_once = 1
+    jobs_line = f"max-jobs {jobs} ({jobs_source})"
+    if isinstance(jobs, int) and jobs > 0:
+        at_once = max(1, min(builds, jobs))
+        if at_once > 1:
+            opts.max_jobs = jobs // at_once
+            jobs_line = f"max-jobs {opts.max_jobs} (of {jobs}, {jobs_source})"
+    opts.build_slots = threading.Semaphore(at_once)
+    opts.cores, cores_value, cores_source = choose(
+        'cores', cores, build_cores(env['cores'], jobs if isinstance(jobs, int) else env['cores']))
+    print_success(ind2(
+        f"* nix builds: {at_once} at once, each with {jobs_line}, cores {cores_value} ({cores_source})"))
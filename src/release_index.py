@@ -0,0 +1,65 @@
+import os
+import threading
+from typing import TypedDict
+
+from .utils import read_json, state_path, write_json_atomic
+
+IndexEntry = TypedDict('IndexEntry', {
+    'etag': str | None,
+    'tags': list[str],
+})
+
+
+class ReleaseIndex():
+    """
+    On-disk cache of release tags per GitHub repository, keyed by 'org/repo'.
+    Stores the ETag of the first releases page so the list can be revalidated with a 304.
+    """
+    path: str
+    entries: dict[str, IndexEntry]
+
+    def __init__(self, path: str):
+        self.path = path
+        self.entries = read_json(path, {})
+        self._lock = threading.Lock()
+
+    @classmethod
+    def for_cardano_path(cls, cardano_path: str) -> 'ReleaseIndex':
+        return cls(state_path(cardano_path, 'release-index.json'))
+
+    def get(self, org: str, repo: str) -> IndexEntry | None:
+        with self._lock:
+            return self.entries.get(f"{org}/{repo}")
+
+    def has_tag(self, org: str, repo: str, tag: str) -> bool:
+        entry = self.get(org, repo)
+        return entry is not None and tag in entry['tags']
+
+    def update(self, org: str, repo: str, etag: str | None, tags: list[str]) -> None:
+        with self._lock:
+            self.entries[f"{org}/{repo}"] = {'etag': etag, 'tags': tags}
+            write_json_atomic(self.path, self.entries)
+
+
+def local_clone_tags(clone_path: str) -> set[str]:
+    """
+    Reads tag names straight from a clone's refs (loose and packed) without spawning git.
+    """
+    git_dir = os.path.join(clone_path, '.git')
+    tags: set[str] = set()
+    tags_dir = os.path.join(git_dir, 'refs', 'tags')
+    for dirpath, _, filenames in os.walk(tags_dir):
+        for filename in filenames:
+            ref = os.path.relpath(os.path.join(dirpath, filename), tags_dir)
+            tags.add(ref.replace(os.sep, '/'))
+
+    try:
+        with open(os.path.join(git_dir, 'packed-refs'), 'r') as f:
+            for line in f:
+                _, _, ref = line.rstrip('\n').partition(' ')
+                if ref.startswith('refs/tags/'):
+                    tags.add(ref[len('refs/tags/'):])
+    except OSError:
+        pass
+
+    return tags
@@ -0,0 +1,123 @@
+import json
+import os
+import re
+from concurrent.futures import ThreadPoolExecutor
+
+from .http_pool import HttpPool
+from .release_index import ReleaseIndex, local_clone_tags
+
+# Overridable so the validators can be pointed at a local stand-in for the API
+GITHUB_API_URL = os.environ.get("GITHUB_API_URL", "https://api.github.com")
+RELEASES_PER_PAGE = 100
+REQUEST_TIMEOUT = 10.0
+
+# Maps a report key (i.e. an .env variable) to the (org, repo, tag) it must resolve to
+ReleaseChecks = dict[str, tuple[str, str, str]]
+
+_next_link_re = re.compile(r'<([^>]+)>\s*;\s*rel="?next"?')
+
+
+class ReleaseLookupError(Exception):
+    pass
+
+
+def next_page_url(link_header: str | None) -> str | None:
+    """
+    Extracts the `rel="next"` target from a GitHub pagination `Link` header.
+    """
+    if not link_header:
+        return None
+    match = _next_link_re.search(link_header)
+    return match.group(1) if match else None
+
+
+def releases_url(org: str, repo: str) -> str:
+    return f"{GITHUB_API_URL.rstrip('/')}/repos/{org}/{repo}/releases?per_page={RELEASES_PER_PAGE}"
+
+
+def fetch_release_tags(
+        pool: HttpPool, org: str, repo: str, until: str | None = None,
+        etag: str | None = None) -> tuple[list[str] | None, str | None]:
+    """
+    Collects release tags for a repository, following the API's pagination.
+    Stops early once `until` has been seen.
+    The first page is revalidated against `etag`: if it is unchanged (HTTP 304) no newer
+    releases exist and `(None, etag)` is returned.
+    Returns the tags and the ETag of the first page.
+    """
+    url: str | None = releases_url(org, repo)
+    tags: list[str] = []
+    first_etag = None
+    headers = {"Accept": "application/vnd.github+json"}
+    if etag:
+        headers["If-None-Match"] = etag
+    while url:
+        response = pool.request(url, headers=headers)
+        if response.status == 304 and etag:
+            return (None, etag)
+        if response.status != 200:
+            raise ReleaseLookupError(
+                f"GitHub API returned HTTP {response.status} for {org}/{repo}")
+        if not tags:
+            first_etag = response.headers.get("etag")
+            headers.pop("If-None-Match", None)
+        page_tags = [release["tag_name"] for release in json.loads(response.body)]
+        tags.extend(page_tags)
+        if until is not None and until in page_tags:
+            break
+        url = next_page_url(response.headers.get("link"))
+    return (tags, first_etag)
+
+
+def check_release(
+        pool: HttpPool, org: str, repo: str, tag: str,
+        index: ReleaseIndex | None = None,
+        clone_path: str | None = None) -> str | None:
+    """
+    Answers from the local clone's tags or the release index first.
+    Only goes to the network when the tag is missing from both.
+    """
+    if clone_path and tag in local_clone_tags(clone_path):
+        return None
+    if index and index.has_tag(org, repo, tag):
+        return None
+
+    entry = index.get(org, repo) if index else None
+    try:
+        tags, etag = fetch_release_tags(
+            pool, org, repo, until=None if index else tag,
+            etag=entry['etag'] if entry else None)
+    except Exception as e:
+        return f"An error occurred with call to GitHub API: {e}"
+
+    if tags is None:
+        # Release list unchanged since it was indexed, so the tag doesn't exist
+        return f"{tag} is not a valid tag."
+    if index:
+        index.update(org, repo, etag, tags)
+    return None if tag in tags else f"{tag} is not a valid tag."
+
+
+def check_releases(
+        checks: ReleaseChecks, index: ReleaseIndex | None = None,
+        src_path: str | None = None,
+        timeout: float = REQUEST_TIMEOUT) -> dict[str, str | None]:
+    """
+    Validates all release tags concurrently over a shared connection pool.
+    Clones under `src_path` are expected to be named after their repository.
+    Returns an error message (or None) for every key in `checks`.
+    """
+    if not checks:
+        return {}
+    pool = HttpPool(timeout=timeout)
+    try:
+        with ThreadPoolExecutor(max_workers=len(checks)) as executor:
+            futures = {
+                key: executor.submit(
+                    check_release, pool, org, repo, tag, index,
+                    os.path.join(src_path, repo) if src_path else None)
+                for key, (org, repo, tag) in checks.items()
+            }
+            return {key: future.result() for key, future in futures.items()}
+    finally:
+        pool.close()
@@ -0,0 +1,137 @@
+import sys
+from concurrent.futures import FIRST_COMPLETED, Future, ThreadPoolExecutor, wait
+from typing import Any, Callable, NamedTuple, NoReturn
+
+from .journal import Journal, step_key
+from .trace import span
+from .utils import cancel_children, ind, log_step, print_fail, print_success
+
+DEFAULT_JOBS = 4
+
+
+class Task(NamedTuple):
+    name: str
+    run: Callable[[], Any]
+    deps: tuple[str, ...] = ()
+    # What the step's outcome depends on (besides its dependencies), as JSON-able data.
+    # Steps with inputs are journaled, so a resumed run can skip them
+    inputs: Any = None
+    # Applies a journaled result (i.e. to shared state) when the step is skipped
+    replay: Callable[[Any], None] | None = None
+
+
+def check_graph(tasks: list[Task]) -> None:
+    """
+    Raises ValueError for unknown dependencies, duplicate names or cycles.
+    """
+    names = [task.name for task in tasks]
+    if len(set(names)) != len(names):
+        raise ValueError("duplicate task names")
+    by_name = {task.name: task for task in tasks}
+    for task in tasks:
+        for dep in task.deps:
+            if dep not in by_name:
+                raise ValueError(f"task '{task.name}' depends on unknown task '{dep}'")
+
+    done: set[str] = set()
+    remaining = list(tasks)
+    while remaining:
+        ready = [t for t in remaining if set(t.deps) <= done]
+        if not ready:
+            cycle = ", ".join(t.name for t in remaining)
+            raise ValueError(f"dependency cycle between tasks: {cycle}")
+        done.update(t.name for t in ready)
+        remaining = [t for t in remaining if t.name not in done]
+
+
+def run_traced(task: Task) -> Any:
+    with span(task.name, deps=list(task.deps)), log_step(task.name):
+        return task.run()
+
+
+def task_keys(tasks: list[Task]) -> dict[str, str | None]:
+    """
+    Journal keys of the tasks (None for tasks that aren't journaled). A task's key covers
+    its dependencies' keys, so changed inputs invalidate every step after them.
+    """
+    by_name = {task.name: task for task in tasks}
+    keys: dict[str, str | None] = {}
+
+    def key(name: str) -> str | None:
+        if name not in keys:
+            task = by_name[name]
+            keys[name] = None if task.inputs is None else \
+                step_key(name, task.inputs, [key(dep) for dep in task.deps])
+        return keys[name]
+
+    for task in tasks:
+        key(task.name)
+    return keys
+
+
+def run_tasks(
+        tasks: list[Task], jobs: int = DEFAULT_JOBS,
+        journal: Journal | None = None) -> None | NoReturn:
+    """
+    Runs tasks as soon as their dependencies have completed, at most `jobs` at a time.
+    Tasks the journal records as completed with the same inputs are skipped, and each
+    completed task is journaled. On the first failure no further tasks are started,
+    running commands are stopped and the installer exits.
+    """
+    check_graph(tasks)
+    keys = task_keys(tasks)
+    pending = list(tasks)
+    done: set[str] = set()
+    running: dict[Future, Task] = {}
+    failure: tuple[str, BaseException] | None = None
+
+    def journaled(task: Task) -> bool:
+        key = keys[task.name]
+        entry = journal.completed(task.name, key) if journal and key else None
+        if entry is None:
+            return False
+        with span(task.name, deps=list(task.deps), skipped=True):
+            if task.replay:
+                task.replay(entry['result'])
+        print_success(ind(f"Skipping '{task.name}': completed by the previous run"))
+        return True
+
+    with ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+        def submit_ready() -> None:
+            # Skipping a task can make others ready, so repeat until nothing was skipped
+            skipped = True
+            while skipped:
+                skipped = False
+                for task in [t for t in pending if set(t.deps) <= done]:
+                    pending.remove(task)
+                    if journaled(task):
+                        done.add(task.name)
+                        skipped = True
+                    else:
+                        running[executor.submit(run_traced, task)] = task
+
+        submit_ready()
+        while running:
+            finished, _ = wait(running, return_when=FIRST_COMPLETED)
+            for future in finished:
+                task = running.pop(future)
+                exc = future.exception()
+                if exc is not None:
+                    failure = failure or (task.name, exc)
+                else:
+                    done.add(task.name)
+                    if journal and keys[task.name]:
+                        journal.record(task.name, keys[task.name], future.result())
+            if failure:
+                cancel_children()
+                for future in running:
+                    future.cancel()
+                wait(running)
+                break
+            submit_ready()
+
+    if failure:
+        name, exc = failure
+        if not isinstance(exc, SystemExit):
+            print_fail(ind(f"Step '{name}' failed: {exc}"))
+        sys.exit(1)
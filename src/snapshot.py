@@ -0,0 +1,409 @@
+import hashlib
+import os
+import shutil
+import subprocess
+import tarfile
+import threading
+import time
+import urllib.parse
+from concurrent.futures import Future, ThreadPoolExecutor
+from contextlib import contextmanager, nullcontext
+from pathlib import PurePosixPath
+from typing import IO, Iterator, TypedDict
+
+from .http_pool import HttpPool
+from .utils import ind2, print_neutral, read_json, write_json_atomic
+
+MIB = 1024 ** 2
+SNAPSHOT_TIMEOUT = 60.0
+COPY_CHUNK_BYTES = 4 * MIB
+# Members up to this size are read whole and written by the worker pool; larger ones
+# (i.e. ledger snapshots) are streamed straight to disk
+POOLED_MEMBER_BYTES = 64 * MIB
+MAX_IN_FLIGHT_BYTES = 512 * MIB
+PROGRESS_SAVE_SECONDS = 5.0
+
+# Leading magic bytes -> (tarfile stream compression, external decompressor)
+COMPRESSIONS = [
+    (b'\x1f\x8b', 'gz', None),
+    (b'BZh', 'bz2', None),
+    (b'\xfd7zXZ\x00', 'xz', None),
+    (b'\x28\xb5\x2f\xfd', '', 'zstd'),
+    (b'\x04\x22\x4d\x18', '', 'lz4'),
+]
+
+FileEntry = TypedDict('FileEntry', {
+    'size': int,
+    'sha256': str,
+})
+
+ProgressState = TypedDict('ProgressState', {
+    'source': str,
+    'done': dict[str, FileEntry],
+    'offset': int,
+})
+
+BootstrapReport = TypedDict('BootstrapReport', {
+    'written': int,
+    'skipped': int,
+    'bytes_written': int,
+    'seconds': float,
+})
+
+
+class SnapshotError(Exception):
+    pass
+
+
+class Prepended():
+    """
+    A read-only stream with bytes already read from it (i.e. for sniffing) put back in front.
+    """
+
+    def __init__(self, head: bytes, stream: IO[bytes]):
+        self._head = head
+        self._stream = stream
+
+    def read(self, size: int = -1) -> bytes:
+        if not self._head:
+            return self._stream.read(size)
+        if size < 0:
+            data, self._head = self._head + self._stream.read(), b''
+            return data
+        data, self._head = self._head[:size], self._head[size:]
+        if len(data) < size:
+            data += self._stream.read(size - len(data))
+        return data
+
+
+class Progress():
+    """
+    Records the files already restored into a database, so an interrupted restore can
+    skip them when it is run again. For uncompressed archives it also records the offset
+    of the first member not yet restored, so the archive can be read on from there.
+    """
+    path: str
+    state: ProgressState
+    tracks_offset: bool
+
+    def __init__(self, path: str, source: str):
+        self.path = path
+        self.state = read_json(path, None) or {'source': source, 'done': {}, 'offset': 0}
+        self.tracks_offset = False
+        self._reached = 0
+        self._pending: dict[str, int] = {}
+        self._lock = threading.Lock()
+        self._saved_at = time.monotonic()
+
+    def resume_offset(self, db_path: str) -> int:
+        """
+        The archive offset to resume reading at, or 0 if any file recorded as done has
+        since gone missing or changed size.
+        """
+        offset = self.state.get('offset', 0)
+        if offset and all(
+                self.is_done(name, os.path.join(db_path, name), entry['size'])
+                for name, entry in self.state['done'].items()):
+            return offset
+        return 0
+
+    def reached(self, offset: int) -> None:
+        """
+        Records the archive offset of the member about to be read.
+        """
+        with self._lock:
+            self._reached = offset
+
+    def started(self, name: str, offset: int) -> None:
+        with self._lock:
+            self._pending[name] = offset
+
+    def is_done(self, name: str, dest: str, size: int) -> bool:
+        entry = self.state['done'].get(name)
+        try:
+            return entry is not None and entry['size'] == size == os.path.getsize(dest)
+        except OSError:
+            return False
+
+    def mark_done(self, name: str, entry: FileEntry) -> None:
+        with self._lock:
+            self.state['done'][name] = entry
+            self._pending.pop(name, None)
+            if time.monotonic() - self._saved_at >= PROGRESS_SAVE_SECONDS:
+                self._save()
+
+    def _save(self) -> None:
+        # Files still being written may be behind the member being read
+        self.state['offset'] = (
+            min(self._pending.values(), default=self._reached) if self.tracks_offset else 0)
+        write_json_atomic(self.path, self.state)
+        self._saved_at = time.monotonic()
+
+    def save(self) -> None:
+        with self._lock:
+            self._save()
+
+    def remove(self) -> None:
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+class ByteBudget():
+    """
+    Bounds the bytes read ahead of the writers.
+    """
+
+    def __init__(self, limit: int):
+        self.limit = limit
+        self.used = 0
+        self._cond = threading.Condition()
+
+    def acquire(self, size: int) -> None:
+        with self._cond:
+            # A member larger than the budget only has to wait for an idle pool
+            self._cond.wait_for(lambda: self.used == 0 or self.used + size <= self.limit)
+            self.used += size
+
+    def release(self, size: int) -> None:
+        with self._cond:
+            self.used -= size
+            self._cond.notify_all()
+
+
+def member_name(name: str) -> str | None:
+    """
+    Normalizes an archive path to a path relative to the database directory, stripping
+    a leading `db/` (so the directory itself is ''). Returns None for paths that would
+    escape it.
+    """
+    parts = [p for p in PurePosixPath(name).parts if p not in ('', '.')]
+    if parts[:1] == ['db']:
+        parts = parts[1:]
+    if PurePosixPath(name).is_absolute() or '..' in parts:
+        return None
+    return '/'.join(parts)
+
+
+def is_url(source: str) -> bool:
+    return urllib.parse.urlsplit(source).scheme in ('http', 'https')
+
+
+@contextmanager
+def open_source(source: str, offset: int = 0) -> Iterator[IO[bytes]]:
+    """
+    Opens a path or URL to read from `offset` on, with a `Range` request for URLs. If the
+    server ignores the range, the bytes before it are read and dropped.
+    """
+    if is_url(source):
+        pool = HttpPool(timeout=SNAPSHOT_TIMEOUT)
+        headers = {"Range": f"bytes={offset}-"} if offset else None
+        try:
+            with pool.open(source, headers) as response:
+                if response.status == 200:
+                    while offset > 0:
+                        chunk = response.read(min(offset, COPY_CHUNK_BYTES))
+                        if not chunk:
+                            break
+                        offset -= len(chunk)
+                elif not (offset and response.status == 206):
+                    raise SnapshotError(f"HTTP {response.status} fetching {source}")
+                yield response
+        finally:
+            pool.close()
+    else:
+        path = urllib.parse.urlsplit(source).path if source.startswith('file://') else source
+        with open(path, 'rb') as f:
+            f.seek(offset)
+            yield f
+
+
+def decompressor(tool: str) -> list[str]:
+    if shutil.which(tool):
+        return [tool, "-dc"]
+    return ["nix", "shell", f"nixpkgs#{tool}", "-c", tool, "-dc"]
+
+
+@contextmanager
+def decompressed(raw: IO[bytes]) -> Iterator[tuple[IO[bytes], str, bool]]:
+    """
+    Yields the archive stream, its tarfile compression mode and whether it is compressed
+    at all. Formats tarfile can't decompress (zstd, lz4) are piped through the external
+    tool instead.
+    """
+    head = raw.read(8)
+    stream = Prepended(head, raw)
+    mode, tool = '', None
+    for magic, magic_mode, magic_tool in COMPRESSIONS:
+        if head.startswith(magic):
+            mode, tool = magic_mode, magic_tool
+    if tool is None:
+        yield stream, mode, bool(mode)
+        return
+
+    proc = subprocess.Popen(
+        decompressor(tool), stdin=subprocess.PIPE, stdout=subprocess.PIPE)
+
+    def feed() -> None:
+        try:
+            for chunk in iter(lambda: stream.read(COPY_CHUNK_BYTES), b''):
+                proc.stdin.write(chunk)
+        except (BrokenPipeError, OSError):
+            pass
+        finally:
+            try:
+                proc.stdin.close()
+            except OSError:
+                pass
+
+    feeder = threading.Thread(target=feed, daemon=True)
+    feeder.start()
+    try:
+        yield proc.stdout, '', True
+        # tarfile stops at the end-of-archive marker: drain any padding after it, so
+        # the tool isn't killed by a closed pipe
+        while proc.stdout.read(COPY_CHUNK_BYTES):
+            pass
+    except BaseException:
+        proc.kill()
+        proc.stdout.close()
+        proc.wait()
+        raise
+    proc.stdout.close()
+    feeder.join()
+    if proc.wait() != 0:
+        raise SnapshotError(f"{tool} failed to decompress the archive")
+
+
+def load_checksums(source: str) -> dict[str, str]:
+    """
+    Reads a `sha256sum`-style list ("<hex digest>  <path>") of the archive's files.
+    """
+    with open_source(source) as f:
+        text = f.read().decode()
+    checksums = {}
+    for line in text.splitlines():
+        digest, _, name = line.strip().partition(' ')
+        name = member_name(name.strip().lstrip('*'))
+        if digest and name:
+            checksums[name] = digest.lower()
+    return checksums
+
+
+def restore(
+        db_path: str, progress_path: str, source: str, checksums_source: str | None = None,
+        jobs: int = 4) -> BootstrapReport:
+    """
+    Streams a (compressed) tar archive of a node database into `db_path` without keeping
+    a copy of the archive. Files are written by a pool of workers, hashed as they are
+    written and checked against the checksum list if given. Each file is renamed into
+    place once complete, and recorded in a progress file, so restoring again after an
+    interruption skips the files already written. An uncompressed archive is read on
+    from the first unfinished file; a compressed one has to be read from the start.
+    """
+    progress = Progress(progress_path, source)
+    if progress.state['source'] != source:
+        raise SnapshotError(
+            f"an unfinished restore from {progress.state['source']} is in progress: "
+            f"resume it, or delete {db_path} and {progress_path} to start over")
+    if not os.path.exists(progress_path) and os.path.isdir(db_path) and os.listdir(db_path):
+        raise SnapshotError(f"{db_path} is not empty: delete it first to restore a snapshot")
+
+    checksums = load_checksums(checksums_source) if checksums_source else None
+    os.makedirs(db_path, exist_ok=True)
+    report: BootstrapReport = {'written': 0, 'skipped': 0, 'bytes_written': 0, 'seconds': 0.0}
+    offset = progress.resume_offset(db_path)
+    # Files before the offset aren't read again
+    seen: set[str] = set(progress.state['done']) if offset else set()
+    # Kept if the source can't be opened
+    progress.reached(offset)
+    progress.tracks_offset = bool(offset)
+    report_lock = threading.Lock()
+    budget = ByteBudget(MAX_IN_FLIGHT_BYTES)
+    start = time.monotonic()
+
+    def write_file(name: str, chunks: Iterator[bytes], size: int, mtime: float) -> None:
+        dest = os.path.join(db_path, name)
+        tmp_path = f"{dest}.partial"
+        sha256 = hashlib.sha256()
+        os.makedirs(os.path.dirname(dest), exist_ok=True)
+        with open(tmp_path, 'wb') as f:
+            for chunk in chunks:
+                sha256.update(chunk)
+                f.write(chunk)
+        digest = sha256.hexdigest()
+        if checksums is not None and checksums.get(name) != digest:
+            os.remove(tmp_path)
+            raise SnapshotError(
+                f"checksum mismatch for {name}" if name in checksums
+                else f"{name} is not in the checksum list")
+        os.utime(tmp_path, (mtime, mtime))
+        os.replace(tmp_path, dest)
+        progress.mark_done(name, {'size': size, 'sha256': digest})
+        with report_lock:
+            report['written'] += 1
+            report['bytes_written'] += size
+
+    def write_pooled(name: str, data: bytes, mtime: float) -> None:
+        try:
+            write_file(name, iter([data]), len(data), mtime)
+        finally:
+            budget.release(len(data))
+
+    futures: list[Future] = []
+    try:
+        # A resumed read starts at a member header, with nothing to sniff
+        with open_source(source, offset) as raw, \
+                (nullcontext((raw, '', False)) if offset else decompressed(raw)) \
+                as (stream, mode, compressed), \
+                tarfile.open(fileobj=stream, mode=f"r|{mode}") as tar, \
+                ThreadPoolExecutor(max_workers=max(1, jobs)) as executor:
+            progress.tracks_offset = not compressed
+            for member in tar:
+                progress.reached(offset + member.offset)
+                name = member_name(member.name)
+                if name is None or not (name or member.isdir()):
+                    raise SnapshotError(f"unsafe path in archive: {member.name}")
+                if member.isdir():
+                    os.makedirs(os.path.join(db_path, name), exist_ok=True)
+                    continue
+                if not member.isfile():
+                    continue
+                seen.add(name)
+                if progress.is_done(name, os.path.join(db_path, name), member.size):
+                    continue
+                # Stop reading as soon as a write has failed
+                for future in [f for f in futures if f.done()]:
+                    future.result()
+                    futures.remove(future)
+                progress.started(name, offset + member.offset)
+                data = tar.extractfile(member)
+                if member.size <= POOLED_MEMBER_BYTES:
+                    budget.acquire(member.size)
+                    futures.append(executor.submit(
+                        write_pooled, name, data.read(), member.mtime))
+                else:
+                    write_file(
+                        name, iter(lambda: data.read(COPY_CHUNK_BYTES), b''),
+                        member.size, member.mtime)
+            for future in futures:
+                future.result()
+    finally:
+        progress.save()
+
+    if checksums is not None:
+        missing = sorted(set(checksums) - seen)
+        if missing:
+            raise SnapshotError(
+                f"{len(missing)} files in the checksum list are missing from the archive "
+                f"(i.e. {missing[0]})")
+    progress.remove()
+    report['skipped'] = len(seen) - report['written']
+    report['seconds'] = time.monotonic() - start
+    return report
+
+
+def print_report(report: BootstrapReport) -> None:
+    rate = report['bytes_written'] / MIB / max(report['seconds'], 0.001)
+    print_neutral(ind2(
+        f"{report['written']} files written ({report['bytes_written'] // MIB} MiB, "
+        f"{rate:.0f} MiB/s), {report['skipped']} already restored"))
@@ -0,0 +1,37 @@
+import json
+import os
+from typing import Any
+
+# Recorded state readers shared with `status`, which can't afford the installer's imports
+# (subprocess, threading...): keep this module's to json and os
+
+# Installer bookkeeping (caches, manifests, records) lives under CARDANO_PATH
+STATE_DIRNAME = '.ez-installer'
+
+
+def read_json(path: str, default: Any = None) -> Any:
+    try:
+        with open(path, 'r') as f:
+            return json.load(f)
+    except (OSError, ValueError):
+        return default
+
+
+def profile_manifest_path() -> str:
+    profile = os.path.expanduser("~/.nix-profile")
+    return os.path.join(os.path.realpath(profile), "manifest.json")
+
+
+def profile_store_paths() -> set[str] | None:
+    """
+    Reads the store paths installed in the user's nix profile straight from its manifest.
+    Returns None if the profile has no (readable) manifest.
+    """
+    manifest = read_json(profile_manifest_path())
+    if not isinstance(manifest, dict):
+        return None
+    elements = manifest.get("elements", [])
+    # Manifest v3 maps element names to elements; earlier versions use a list
+    if isinstance(elements, dict):
+        elements = list(elements.values())
+    return {path for element in elements for path in element.get("storePaths", [])}
@@ -0,0 +1,141 @@
+import json
+import os
+import shlex
+import stat
+import sys
+from typing import Any
+
+# Only what the report needs: `status` is meant for shell prompts and monitoring agents,
+# so it must not pay for the installer's imports (http, nix probes, sqlite...)
+from .paths import Network, NetworkPaths, Paths
+from .state import STATE_DIRNAME, profile_store_paths, read_json
+
+ENV_FILE = os.path.join(os.path.dirname(os.path.dirname(os.path.abspath(__file__))), ".env")
+
+
+def env_file_var(var: str) -> str | None:
+    """
+    Reads a variable exported in .env, for when it hasn't been sourced.
+    """
+    try:
+        with open(ENV_FILE) as f:
+            lines = f.readlines()
+    except OSError:
+        return None
+    for line in lines:
+        if line.startswith(f"export {var}="):
+            words = shlex.split(line.removeprefix("export "), comments=True)
+            return os.path.expandvars(words[0].partition("=")[2]) if words else None
+    return None
+
+
+def dir_size(path: str) -> int | None:
+    """
+    Total size of the files under a directory (from their metadata), or None if it's missing.
+    """
+    if not os.path.isdir(path):
+        return None
+    total = 0
+    pending = [path]
+    while pending:
+        try:
+            entries = os.scandir(pending.pop())
+        except OSError:
+            continue
+        with entries:
+            for entry in entries:
+                try:
+                    if entry.is_dir(follow_symlinks=False):
+                        pending.append(entry.path)
+                    elif entry.is_file(follow_symlinks=False):
+                        total += entry.stat(follow_symlinks=False).st_size
+                except OSError:
+                    continue
+    return total
+
+
+def socket_status(path: str) -> str:
+    try:
+        return "present" if stat.S_ISSOCK(os.stat(path).st_mode) else "absent"
+    except OSError:
+        return "absent"
+
+
+def get_status(cardano_path: str) -> dict[str, Any]:
+    """
+    Collects what is installed and where from the install record, the nix profile's
+    manifest and the filesystem: no network access and no nix evaluation.
+    """
+    paths = Paths(cardano_path)
+    installed = profile_store_paths()
+    components = {
+        name: {
+            'release': entry['release'],
+            'commit': entry['commit'],
+            'store_paths': entry['store_paths'],
+            'in_profile': installed is not None and all(
+                p in installed and os.path.exists(p) for p in entry['store_paths']),
+        } for name, entry in sorted(read_json(
+            os.path.join(cardano_path, STATE_DIRNAME, 'installed.json'), {}).items())
+    }
+    networks = {}
+    for net in Network:
+        nps: NetworkPaths = getattr(paths, net.value)
+        if not os.path.isdir(nps.path):
+            continue
+        networks[net.value] = {
+            'config': nps.config,
+            'db': nps.db,
+            'db_size': dir_size(nps.db),
+            'socket': nps.socket,
+            'socket_status': socket_status(nps.socket),
+        }
+    return {
+        'cardano_path': cardano_path,
+        'components': components,
+        'networks': networks,
+        'socket': paths.socket,
+        'socket_target': os.path.realpath(paths.socket) if os.path.islink(paths.socket) else None,
+    }
+
+
+def format_size(n: int | None) -> str:
+    if n is None:
+        return "missing"
+    if n < 1024:
+        return f"{n} B"
+    for unit in ["KiB", "MiB", "GiB"]:
+        n /= 1024
+        if n < 1024:
+            break
+    return f"{n:.1f} {unit}"
+
+
+def print_status(status: dict[str, Any]) -> None:
+    print(f"CARDANO_PATH: {status['cardano_path']}")
+    if not status['components']:
+        print("Components: none installed")
+    for name, component in status['components'].items():
+        state = "in profile" if component['in_profile'] else "not in profile"
+        print(f"{name} {component['release']} ({component['commit'][:12]}, {state})")
+        for path in component['store_paths']:
+            print(f"  {path}")
+    for net, nps in status['networks'].items():
+        print(f"{net}:")
+        print(f"  config: {nps['config']}")
+        print(f"  db:     {nps['db']} ({format_size(nps['db_size'])})")
+        print(f"  socket: {nps['socket']} ({nps['socket_status']})")
+    target = status['socket_target']
+    print(f"Socket: {status['socket']}" + (f" -> {target}" if target else " (no node started yet)"))
+
+
+def main(as_json: bool = False) -> None:
+    cardano_path = os.environ.get('CARDANO_PATH') or env_file_var('CARDANO_PATH')
+    if not cardano_path:
+        print("CARDANO_PATH: not exported in .env", file=sys.stderr)
+        sys.exit(1)
+    status = get_status(cardano_path)
+    if as_json:
+        print(json.dumps(status, indent=2))
+    else:
+        print_status(status)
@@ -0,0 +1,248 @@
+import json
+import os
+import time
+import urllib.parse
+from concurrent.futures import ThreadPoolExecutor
+from typing import Any, NamedTuple
+
+from .http_pool import HttpPool
+from .nix_options import NixOptions
+from .trace import span
+from .utils import ind, ind2, print_fail, print_neutral, print_success, run_capture
+
+# Caches requested by the node install flags and the Ogmios flake's nixConfig.
+# Overridable so probes can be pointed at local stand-ins
+KNOWN_SUBSTITUTERS = os.environ.get(
+    "BUILD_SUBSTITUTERS", "https://cache.iog.io https://cache.zw3rk.com").split()
+PROBE_TIMEOUT = 5.0
+LOOKUP_WORKERS = 16
+DEFAULT_PRIORITY = 50
+
+
+class CacheProbe(NamedTuple):
+    url: str
+    latency: float | None
+    priority: int
+    error: str | None
+
+
+def read_cache_file(pool: HttpPool, url: str, name: str) -> bytes | None:
+    """
+    Reads a file from a binary cache over HTTP(S) or from a file:// cache.
+    Returns None if the cache doesn't have it.
+    """
+    parts = urllib.parse.urlsplit(url)
+    if parts.scheme == 'file':
+        try:
+            with open(os.path.join(parts.path, name), 'rb') as f:
+                return f.read()
+        except FileNotFoundError:
+            return None
+    response = pool.request(f"{url.rstrip('/')}/{name}")
+    if response.status == 404:
+        return None
+    if response.status != 200:
+        raise OSError(f"HTTP {response.status}")
+    return response.body
+
+
+def probe_cache(pool: HttpPool, url: str) -> CacheProbe:
+    start = time.monotonic()
+    try:
+        info = read_cache_file(pool, url, "nix-cache-info")
+    except Exception as e:
+        return CacheProbe(url, None, DEFAULT_PRIORITY, str(e) or type(e).__name__)
+    latency = time.monotonic() - start
+    if info is None:
+        return CacheProbe(url, None, DEFAULT_PRIORITY, "not a binary cache")
+
+    priority = DEFAULT_PRIORITY
+    for line in info.decode(errors='replace').splitlines():
+        key, _, value = line.partition(":")
+        if key.strip() == "Priority" and value.strip().isdigit():
+            priority = int(value.strip())
+    return CacheProbe(url, latency, priority, None)
+
+
+def probe_substituters(urls: list[str]) -> list[CacheProbe]:
+    pool = HttpPool(timeout=PROBE_TIMEOUT)
+    try:
+        with ThreadPoolExecutor(max_workers=max(1, len(urls))) as executor:
+            return list(executor.map(lambda url: probe_cache(pool, url), urls))
+    finally:
+        pool.close()
+
+
+def order_substituters(probes: list[CacheProbe], hit_rates: dict[str, float] = {}) -> list[str]:
+    """
+    Drops unreachable caches and orders the rest fastest-first.
+    Nix consults caches by their advertised priority first; among equals, caches with
+    more of the wanted outputs (when known) come first, then the faster ones.
+    """
+    alive = [p for p in probes if p.error is None]
+    return [p.url for p in sorted(
+        alive, key=lambda p: (p.priority, -hit_rates.get(p.url, 0.0), p.latency))]
+
+
+def configured_substituters(
+        nix_conf_json: dict[str, Any], local_caches: list[str] = []) -> list[str]:
+    configured = nix_conf_json.get("substituters", {}).get("value", [])
+    urls: list[str] = []
+    for url in [*local_caches, *configured, *KNOWN_SUBSTITUTERS]:
+        if url.rstrip('/') not in [u.rstrip('/') for u in urls]:
+            urls.append(url)
+    return urls
+
+
+def use_substituters(
+        nix_conf_json: dict[str, Any], opts: NixOptions, probes: list[CacheProbe]) -> None:
+    """
+    Passes the live caches to nix (probes may be read back from the journal as lists).
+    """
+    opts.cache_probes = [CacheProbe(*probe) for probe in probes]
+    opts.substituters = order_substituters(opts.cache_probes)
+    opts.conf_public_keys = nix_conf_json.get("trusted-public-keys", {}).get("value", [])
+
+
+def preflight_substituters(
+        nix_conf_json: dict[str, Any], opts: NixOptions) -> list[CacheProbe]:
+    """
+    Measures every configured substituter and passes the live ones to nix fastest-first.
+    Returns their probes.
+    """
+    print_neutral(ind("Probing binary caches..."))
+    probes = probe_substituters(configured_substituters(nix_conf_json, opts.local_caches))
+    for probe in probes:
+        if probe.error is None:
+            print_success(ind2(
+                f"* {probe.url}: {probe.latency * 1000:.0f} ms (priority {probe.priority})"))
+        else:
+            print_fail(ind2(f"* {probe.url}: unreachable ({probe.error}), skipping"))
+
+    alive = [probe for probe in probes if probe.error is None]
+    if not alive:
+        print_fail(ind2(
+            "No binary cache is reachable: everything will be built from source."))
+    use_substituters(nix_conf_json, opts, alive)
+    return alive
+
+
+def out_paths(installables: list[str], flags: list[str]) -> list[str]:
+    """
+    Evaluates installables (without building them) and returns their output paths.
+    """
+    output = run_capture(
+        ["nix", "build", "--dry-run", "--json", "--no-link", *flags, *installables],
+        "Error evaluating build outputs", quiet=True)
+    return [path for drv in json.loads(output) for path in drv["outputs"].values()]
+
+
+def flake_path(installable: str) -> str:
+    """
+    Directory of the flake.nix an installable refers to (see `flake_ref`).
+    """
+    ref = installable.partition("#")[0]
+    if not ref.startswith("git+file://"):
+        return ref
+    parts = urllib.parse.urlsplit(ref.removeprefix("git+"))
+    subdir = urllib.parse.parse_qs(parts.query).get("dir", [""])[0]
+    return os.path.join(parts.path, subdir)
+
+
+def flake_public_keys(flake_dir: str) -> list[str]:
+    """
+    Keys a flake's nixConfig trusts, which nix applies along with --accept-flake-config.
+    """
+    nix_config = json.loads(run_capture(
+        ["nix", "eval", "--json", "--file", os.path.join(flake_dir, "flake.nix"),
+         "--apply", "flake: flake.nixConfig or {}"],
+        "Error reading the flake's nixConfig", quiet=True))
+    keys = []
+    for setting in ["trusted-public-keys", "extra-trusted-public-keys"]:
+        value = nix_config.get(setting, [])
+        keys += value.split() if isinstance(value, str) else value
+    return keys
+
+
+def trusted_key_names(installables: list[str], flags: list[str], opts: NixOptions) -> set[str]:
+    """
+    Names of the keys a build will accept signatures from: nix.conf's, the local caches'
+    and the ones its flags (or, with --accept-flake-config, its flakes) add.
+    """
+    keys = [*opts.conf_public_keys, *opts.trusted_public_keys]
+    for flag, value in zip(flags, flags[1:]):
+        if flag in ["--trusted-public-keys", "--extra-trusted-public-keys"]:
+            keys += value.split()
+    if "--accept-flake-config" in flags:
+        for flake in {flake_path(installable) for installable in installables}:
+            keys += flake_public_keys(flake)
+    return {key.partition(":")[0] for key in keys}
+
+
+def narinfo_signers(narinfo: bytes) -> set[str]:
+    return {line.partition(":")[2].strip().partition(":")[0]
+            for line in narinfo.decode(errors='replace').splitlines() if line.startswith("Sig:")}
+
+
+def find_substitutes(
+        paths: list[str], caches: list[str], trusted_keys: set[str]) -> dict[str, list[bool | None]]:
+    """
+    Looks up each path's narinfo in each cache. For every cache, returns whether it has each
+    path signed by a trusted key: True, False if only by keys nix won't accept, None if not at all.
+    """
+    pool = HttpPool(timeout=PROBE_TIMEOUT)
+
+    def lookup(url: str, path: str) -> bool | None:
+        try:
+            narinfo = read_cache_file(pool, url, f"{os.path.basename(path)[:32]}.narinfo")
+        except Exception:
+            return None
+        return None if narinfo is None else bool(narinfo_signers(narinfo) & trusted_keys)
+
+    lookups = [(url, path) for url in caches for path in paths]
+    try:
+        with ThreadPoolExecutor(max_workers=min(len(lookups), LOOKUP_WORKERS) or 1) as executor:
+            found = list(executor.map(lambda lookup_args: lookup(*lookup_args), lookups))
+    finally:
+        pool.close()
+    return {url: found[i * len(paths):(i + 1) * len(paths)] for i, url in enumerate(caches)}
+
+
+def check_substitutes(
+        name: str, installables: list[str], flags: list[str],
+        opts: NixOptions) -> list[str] | None:
+    """
+    Reports each cache's hit rate for the outputs about to be built (those not already in
+    the local store), and warns if any output has to be built from source. Caches only
+    count if nix will accept their signatures. Returns the caches to pass to the build:
+    without the ones whose narinfos are all signed by untrusted keys, ordered by hit rate
+    among caches of the same priority.
+    """
+    caches = opts.substituters or []
+    paths = out_paths(installables, [*flags, *opts.args()])
+    # Outputs already in the store are neither substituted nor built
+    missing = [path for path in paths if not os.path.exists(path)]
+    # Recorded in the run history as whether the component came from a cache
+    with span("check substitutes", 'cache', outputs=len(paths)) as span_args:
+        found = find_substitutes(missing, caches, trusted_key_names(installables, flags, opts)) \
+            if missing and caches else {}
+        substituted = [any(found[url][i] for url in found) for i in range(len(missing))]
+        span_args['substituted'] = len(paths) - len(missing) + sum(substituted)
+    if not found:
+        return opts.substituters
+
+    hit_rates = {}
+    for url, hits in found.items():
+        hit_rates[url] = hits.count(True) / len(hits)
+        if hits.count(False) and not hits.count(True):
+            print_fail(ind2(f"* {name}: {url} is signed by a key nix doesn't trust, skipping"))
+        else:
+            print_neutral(ind2(
+                f"* {name}: {url} has {hits.count(True)} of {len(hits)} outputs "
+                f"({hit_rates[url]:.0%})"))
+    for path, hit in zip(missing, substituted):
+        if not hit:
+            print_fail(ind2(
+                f"{name}: {os.path.basename(path)} is in no binary cache and will be built from source (this can take hours)"))
+    return [url for url in order_substituters(opts.cache_probes, hit_rates)
+            if any(found[url]) or False not in found[url]]
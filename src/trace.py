@@ -0,0 +1,85 @@
+import json
+import os
+import threading
+import time
+from contextlib import contextmanager
+from typing import Any, Iterator
+
+
+class Tracer():
+    """
+    Records timed spans (installer phases, external commands) and writes them in the
+    Chrome trace-event format, viewable in chrome://tracing or Perfetto. Spans on the
+    same thread nest by time, so commands show up under the phase that ran them.
+    """
+    enabled: bool
+    events: list[dict[str, Any]]
+
+    def __init__(self):
+        self.enabled = False
+        self.events = []
+        self._lock = threading.Lock()
+        self._start = time.perf_counter_ns()
+        self._local = threading.local()
+        self._thread_names: dict[int | None, str] = {}
+
+    def enable(self) -> None:
+        self.enabled = True
+
+    def _now_us(self) -> float:
+        return (time.perf_counter_ns() - self._start) / 1000
+
+    @contextmanager
+    def span(self, name: str, cat: str, **args: Any) -> Iterator[dict[str, Any]]:
+        """
+        Times the enclosed block. The yielded dict is recorded as the span's arguments,
+        so details only known at the end (i.e. exit codes) can be added to it.
+        """
+        if not self.enabled:
+            yield args
+            return
+        stack = self._local.__dict__.setdefault('stack', [])
+        if stack:
+            args['parent'] = stack[-1]
+        stack.append(name)
+        start = self._now_us()
+        try:
+            yield args
+        except BaseException as e:
+            args.setdefault('error', repr(e))
+            raise
+        finally:
+            end = self._now_us()
+            stack.pop()
+            thread = threading.current_thread()
+            with self._lock:
+                self.events.append({
+                    'name': name,
+                    'cat': cat,
+                    'ph': 'X',
+                    'ts': start,
+                    'dur': end - start,
+                    'pid': os.getpid(),
+                    'tid': thread.ident,
+                    'args': args,
+                })
+                self._thread_names[thread.ident] = thread.name
+
+    def write(self, path: str) -> None:
+        with self._lock:
+            metadata = [
+                {'name': 'thread_name', 'ph': 'M', 'pid': os.getpid(), 'tid': tid,
+                 'args': {'name': thread_name}}
+                for tid, thread_name in self._thread_names.items()
+            ]
+            events = sorted(self.events, key=lambda e: e['ts'])
+        with open(path, 'w') as f:
+            json.dump({'traceEvents': metadata + events,
+                      'displayTimeUnit': 'ms'}, f)
+
+
+tracer = Tracer()
+
+
+def span(name: str, cat: str = 'phase', **args: Any):
+    return tracer.span(name, cat, **args)
@@ -1,25 +1,267 @@
+import json
+import os
+import re
+import signal
 import subprocess
 import sys
+import tempfile
+import threading
+from collections import deque
+from contextlib import contextmanager
 from datetime import datetime
+from typing import IO, Any, Iterator
 
+from .state import STATE_DIRNAME, read_json
+from .trace import span
 
-def run(cmd: list[str], err: str) -> None:
-    result = subprocess.run(cmd)
-    if result.returncode != 0:
+
+# Child processes currently running, so a failing install can stop its siblings
+_children: set[subprocess.Popen] = set()
+_children_lock = threading.Lock()
+cancelled = threading.Event()
+
+# Quiet command output goes to rotating per-step logs; failures show only the tail
+TAIL_LINES = 50
+MAX_LINE_BYTES = 64 * 1024
+LOG_ROTATIONS = 3
+_log_dir: str | None = None
+_log_lock = threading.Lock()
+_rotated: set[str] = set()
+_step = threading.local()
+
+
+def _start(cmd: list[str], cwd: str | None, **kwargs: Any) -> subprocess.Popen:
+    with _children_lock:
+        if cancelled.is_set():
+            raise SystemExit(1)
+        proc = subprocess.Popen(cmd, cwd=cwd, **kwargs)
+        _children.add(proc)
+    return proc
+
+
+def _wait(proc: subprocess.Popen, span_args: dict[str, Any]) -> None:
+    """
+    Reaps a command with wait4, so its peak RSS and CPU time can be recorded.
+    """
+    _, status, rusage = os.wait4(proc.pid, 0)
+    proc.returncode = os.waitstatus_to_exitcode(status)
+    # ru_maxrss is in kilobytes on Linux but in bytes on macOS
+    max_rss = rusage.ru_maxrss // 1024 if sys.platform == 'darwin' else rusage.ru_maxrss
+    span_args.update({
+        'exit_code': proc.returncode,
+        'max_rss_kb': max_rss,
+        'user_cpu_s': rusage.ru_utime,
+        'sys_cpu_s': rusage.ru_stime,
+    })
+
+
+def _drain(pipe: IO[bytes], log: IO[bytes] | None, tail: deque[bytes]) -> None:
+    """
+    Copies a pipe to the step log as it is written, keeping only its last lines in memory.
+    Lines are read in bounded chunks, so progress output without newlines can't grow a buffer.
+    """
+    for line in iter(lambda: pipe.readline(MAX_LINE_BYTES), b''):
+        if log:
+            log.write(line)
+        tail.append(line)
+
+
+def _print_failure(err: str, tail: deque[bytes], log: IO[bytes] | None) -> None:
+    output = b''.join(tail).decode(errors='replace').strip()
+    print_fail(ind2(f"{err}: {output}"))
+    if log:
+        print_fail(ind2(f"Full output: {log.name}"))
+
+
+def _finish(proc: subprocess.Popen) -> None:
+    with _children_lock:
+        _children.discard(proc)
+    for pipe in [proc.stdout, proc.stderr]:
+        if pipe:
+            pipe.close()
+    if cancelled.is_set() and proc.returncode != 0:
+        # Stopped because another step failed: that step reports the error
+        raise SystemExit(1)
+
+
+def cancel_children() -> None:
+    """
+    Stops all running commands and prevents new ones from starting.
+    """
+    with _children_lock:
+        cancelled.set()
+        for proc in _children:
+            if proc.returncode is None:
+                try:
+                    os.kill(proc.pid, signal.SIGTERM)
+                except ProcessLookupError:
+                    pass
+
+
+def _command_span(cmd: list[str], cwd: str | None):
+    name = " ".join(os.path.basename(arg) if i == 0 else arg
+                    for i, arg in enumerate(cmd[:2]))
+    return span(name, 'command', cmd=cmd, cwd=cwd or os.getcwd())
+
+
+def run(cmd: list[str], err: str, cwd: str | None = None) -> None:
+    with _command_span(cmd, cwd) as span_args:
+        proc = _start(cmd, cwd)
+        try:
+            _wait(proc, span_args)
+        finally:
+            _finish(proc)
+    if proc.returncode != 0:
         print_fail(ind2(err))
         sys.exit(1)
 
 
-def run_quiet(cmd: list[str], err: str) -> None:
-    try:
-        subprocess.run(
-            cmd, check=True, stdout=subprocess.PIPE, stderr=subprocess.PIPE,
-            text=True)
-    except subprocess.CalledProcessError as e:
-        print_fail(ind2(f"{err}: {e.stderr.strip()}"))
+def run_quiet(cmd: list[str], err: str, cwd: str | None = None) -> None:
+    """
+    Runs a command without showing its output, which is streamed to the step's log file.
+    """
+    tail: deque[bytes] = deque(maxlen=TAIL_LINES)
+    with _command_span(cmd, cwd) as span_args, _command_log(cmd, cwd) as log:
+        proc = _start(cmd, cwd, stdout=subprocess.PIPE, stderr=subprocess.STDOUT)
+        try:
+            _drain(proc.stdout, log, tail)
+            _wait(proc, span_args)
+        finally:
+            _finish(proc)
+    if proc.returncode != 0:
+        _print_failure(err, tail, log)
         sys.exit(1)
 
 
+def run_capture(
+        cmd: list[str], err: str, cwd: str | None = None,
+        quiet: bool = False) -> str:
+    """
+    Runs a command and returns its stdout. Stderr is shown unless `quiet`, in which case
+    it is streamed to the step's log file and only printed if the command fails.
+    """
+    tail: deque[bytes] = deque(maxlen=TAIL_LINES)
+    with _command_span(cmd, cwd) as span_args, _command_log(cmd, cwd) as log:
+        proc = _start(
+            cmd, cwd, stdout=subprocess.PIPE,
+            stderr=subprocess.PIPE if quiet else None)
+        try:
+            reader = None
+            if proc.stderr:
+                # Drained on a helper thread, so neither pipe can fill up and block the command
+                reader = threading.Thread(
+                    target=_drain, args=(proc.stderr, log, tail), daemon=True)
+                reader.start()
+            stdout = proc.stdout.read().decode()
+            if reader:
+                reader.join()
+            _wait(proc, span_args)
+        finally:
+            _finish(proc)
+    if proc.returncode != 0:
+        if quiet:
+            _print_failure(err, tail, log)
+        else:
+            print_fail(ind2(err))
+        sys.exit(1)
+    return stdout
+
+
+# Command logs
+def set_log_dir(path: str) -> None:
+    """
+    Starts writing the output of quiet commands to per-step log files in `path`.
+    """
+    global _log_dir
+    os.makedirs(path, exist_ok=True)
+    _log_dir = path
+
+
+@contextmanager
+def log_step(name: str) -> Iterator[None]:
+    """
+    Sends the output of commands run by this thread to the log file of step `name`.
+    """
+    _step.name = name
+    try:
+        yield
+    finally:
+        del _step.name
+
+
+def _rotate(path: str) -> None:
+    """
+    Shifts `path` to `path.1`, `path.1` to `path.2` and so on, dropping the oldest.
+    """
+    for n in range(LOG_ROTATIONS - 1, 0, -1):
+        newer = path if n == 1 else f"{path}.{n - 1}"
+        if os.path.exists(newer):
+            os.replace(newer, f"{path}.{n}")
+
+
+@contextmanager
+def _command_log(cmd: list[str], cwd: str | None) -> Iterator[IO[bytes] | None]:
+    """
+    Opens the current step's log file for appending, rotating logs from earlier runs
+    on first use.
+    """
+    if _log_dir is None:
+        yield None
+        return
+    step = getattr(_step, 'name', 'install')
+    filename = re.sub(r'[^A-Za-z0-9_.-]+', '-', step).strip('-') + '.log'
+    path = os.path.join(_log_dir, filename)
+    with _log_lock:
+        if path not in _rotated:
+            _rotated.add(path)
+            _rotate(path)
+    with open(path, 'ab') as log:
+        log.write(f"$ {' '.join(cmd)}  (in {cwd or os.getcwd()})\n".encode())
+        log.flush()
+        yield log
+
+
+# State file helpers
+def state_path(cardano_path: str, *parts: str) -> str:
+    """
+    Returns a path inside the installer's state directory, creating parent directories as needed.
+    """
+    path = os.path.join(cardano_path, STATE_DIRNAME, *parts)
+    os.makedirs(os.path.dirname(path), exist_ok=True)
+    return path
+
+
+def write_json_atomic(path: str, data: Any) -> None:
+    """
+    Writes JSON to a sibling temp file and renames it into place, so readers never see a partial file.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            json.dump(data, f, indent=2, sort_keys=True)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
+def write_text_atomic(path: str, text: str, mode: int = 0o644) -> None:
+    """
+    Writes text to a sibling temp file with the given mode and renames it into place.
+    """
+    fd, tmp_path = tempfile.mkstemp(
+        dir=os.path.dirname(path), prefix=f".{os.path.basename(path)}.")
+    try:
+        with os.fdopen(fd, 'w') as f:
+            f.write(text)
+        os.chmod(tmp_path, mode)
+        os.replace(tmp_path, path)
+    except BaseException:
+        os.unlink(tmp_path)
+        raise
+
+
 # Formatting helpers
 def ind(txt: str, n: int = 1) -> str:
     timestamp = datetime.now().strftime('%Y-%m-%d %H:%M:%S')
@@ -0,0 +1,109 @@
+import os
+import subprocess
+
+import pytest
+
+from src import git_source
+
+
+def git(*args: str, cwd: str | None = None) -> str:
+    return subprocess.run(
+        ["git", "-c", "user.name=test", "-c", "user.email=test@example.com", *args],
+        cwd=cwd, check=True, capture_output=True, text=True).stdout.strip()
+
+
+@pytest.fixture(autouse=True)
+def clean_env(monkeypatch):
+    for var in ['CLONE_MODE', 'GIT_MIRROR_PATH']:
+        monkeypatch.delenv(var, raising=False)
+
+
+@pytest.fixture
+def origin(tmp_path) -> str:
+    """
+    A local bare repository with three commits, the last two tagged as releases.
+    """
+    work = str(tmp_path / "work")
+    os.makedirs(work)
+    git("init", "--quiet", work)
+    for i in range(3):
+        with open(os.path.join(work, "flake.nix"), "w") as f:
+            f.write(f"# release {i}\n")
+        git("add", "flake.nix", cwd=work)
+        git("commit", "--quiet", "-m", f"commit {i}", cwd=work)
+        if i:
+            git("tag", f"1.{i}.0", cwd=work)
+    bare = str(tmp_path / "cardano-node.git")
+    git("clone", "--quiet", "--bare", work, bare)
+    # Lets partial clones filter out file contents, as GitHub does
+    git("config", "uploadpack.allowfilter", "true", cwd=bare)
+    return f"file://{bare}"
+
+
+def fetch(monkeypatch, src_path: str, origin: str, release: str, mode: str) -> str:
+    monkeypatch.setenv('CLONE_MODE', mode)
+    return git_source.fetch_source(src_path, origin, release, "cardano-node")
+
+
+def commit_count(repo_path: str) -> int:
+    return int(git("rev-list", "--count", "HEAD", cwd=repo_path))
+
+
+def test_shallow_checkout_has_only_the_release_commit(monkeypatch, tmp_path, origin):
+    repo_path = fetch(monkeypatch, str(tmp_path / "src"), origin, "1.2.0", 'shallow')
+    assert repo_path == str(tmp_path / "src" / "cardano-node")
+    assert git_source.is_shallow(repo_path)
+    assert commit_count(repo_path) == 1
+    assert git("describe", "--tags", cwd=repo_path) == "1.2.0"
+    assert git_source.flake_ref(repo_path, "cardano-node") == \
+        f"git+file://{repo_path}?shallow=1#cardano-node"
+    # Only the release tag is fetched
+    assert git("tag", cwd=repo_path).split() == ["1.2.0"]
+
+
+def test_switching_modes_in_place(monkeypatch, tmp_path, origin):
+    src_path = str(tmp_path / "src")
+    repo_path = fetch(monkeypatch, src_path, origin, "1.1.0", 'shallow')
+
+    fetch(monkeypatch, src_path, origin, "1.1.0", 'full')
+    assert not git_source.is_shallow(repo_path)
+    assert commit_count(repo_path) == 2
+    assert git_source.flake_ref(repo_path, "cardano-node", "server") == \
+        f"{repo_path}/server#cardano-node"
+
+    fetch(monkeypatch, src_path, origin, "1.2.0", 'shallow')
+    assert git_source.is_shallow(repo_path)
+    assert git("describe", "--tags", cwd=repo_path) == "1.2.0"
+
+
+def test_partial_checkout_filters_blobs(monkeypatch, tmp_path, origin):
+    repo_path = fetch(monkeypatch, str(tmp_path / "src"), origin, "1.2.0", 'partial')
+    assert not git_source.is_shallow(repo_path)
+    assert commit_count(repo_path) == 3
+    assert git("config", "remote.origin.partialclonefilter", cwd=repo_path) == "blob:none"
+    with open(os.path.join(repo_path, "flake.nix")) as f:
+        assert f.read() == "# release 2\n"
+
+
+def test_present_tag_is_not_fetched_again(monkeypatch, tmp_path, origin):
+    src_path = str(tmp_path / "src")
+    repo_path = fetch(monkeypatch, src_path, origin, "1.2.0", 'full')
+    # Any fetch would now fail
+    git("remote", "set-url", "origin", str(tmp_path / "gone.git"), cwd=repo_path)
+    fetch(monkeypatch, src_path, origin, "1.2.0", 'full')
+    assert git("describe", "--tags", cwd=repo_path) == "1.2.0"
+
+
+def test_mirror_is_shared_as_alternate(monkeypatch, tmp_path, origin):
+    mirror_root = str(tmp_path / "mirrors")
+    monkeypatch.setenv('GIT_MIRROR_PATH', mirror_root)
+    repo_path = fetch(monkeypatch, str(tmp_path / "src"), origin, "1.2.0", 'full')
+    mirror_path = os.path.join(mirror_root, "cardano-node.git")
+    assert git_source.has_tag(mirror_path, "1.2.0")
+    with open(os.path.join(repo_path, ".git", "objects", "info", "alternates")) as f:
+        assert f.read().split() == [os.path.join(mirror_path, "objects")]
+
+
+def test_unknown_mode_exits(monkeypatch, tmp_path, origin):
+    with pytest.raises(SystemExit):
+        fetch(monkeypatch, str(tmp_path / "src"), origin, "1.2.0", 'sparse')
@@ -0,0 +1,131 @@
+import json
+from http.server import BaseHTTPRequestHandler
+
+import pytest
+
+from src import releases
+from src.http_pool import HttpPool
+from src.release_index import ReleaseIndex
+
+TAGS = [f"8.{i}.0" for i in range(150)]
+ETAG = '"releases-v1"'
+
+
+class ApiHandler(BaseHTTPRequestHandler):
+    """
+    Stand-in for the GitHub releases API: two pages linked by a `Link` header, with an
+    ETag on the first page.
+    """
+    protocol_version = "HTTP/1.1"
+    requests: list[tuple[str, str | None]]
+    client_ports: set[int]
+
+    def do_GET(self) -> None:
+        self.requests.append((self.path, self.headers.get("If-None-Match")))
+        self.client_ports.add(self.client_address[1])
+        if self.path == "/moved":
+            self.respond(301, b"", {"Location": "/repos/org/repo/releases?per_page=100"})
+        elif self.path == "/repos/org/repo/releases?per_page=100":
+            if self.headers.get("If-None-Match") == ETAG:
+                self.respond(304, b"", {"ETag": ETAG})
+                return
+            next_url = f"http://{self.headers['Host']}/repos/org/repo/releases?per_page=100&page=2"
+            self.respond(
+                200, self.page(TAGS[:100]), {"ETag": ETAG, "Link": f'<{next_url}>; rel="next"'})
+        elif self.path == "/repos/org/repo/releases?per_page=100&page=2":
+            self.respond(200, self.page(TAGS[100:]), {})
+        else:
+            self.respond(404, b"", {})
+
+    def page(self, tags: list[str]) -> bytes:
+        return json.dumps([{"tag_name": tag} for tag in tags]).encode()
+
+    def respond(self, status: int, body: bytes, headers: dict[str, str]) -> None:
+        self.send_response(status)
+        for key, value in headers.items():
+            self.send_header(key, value)
+        self.send_header("Content-Length", str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+@pytest.fixture
+def api(http_server, monkeypatch):
+    handler = type('Handler', (ApiHandler,), {'requests': [], 'client_ports': set()})
+    url = http_server(handler)
+    monkeypatch.setattr(releases, 'GITHUB_API_URL', url)
+    return url, handler
+
+
+def test_pool_reuses_connections(api):
+    url, handler = api
+    pool = HttpPool()
+    try:
+        for _ in range(3):
+            assert pool.request(f"{url}/repos/org/repo/releases?per_page=100&page=2").status == 200
+    finally:
+        pool.close()
+    assert len(handler.requests) == 3
+    assert len(handler.client_ports) == 1
+
+
+def test_pool_follows_redirects(api):
+    url, handler = api
+    pool = HttpPool()
+    try:
+        response = pool.request(f"{url}/moved")
+    finally:
+        pool.close()
+    assert response.status == 200
+    assert response.headers['etag'] == ETAG
+    assert [path for path, _ in handler.requests] == ["/moved", "/repos/org/repo/releases?per_page=100"]
+
+
+def test_fetch_release_tags_follows_pages(api):
+    _, handler = api
+    pool = HttpPool()
+    try:
+        tags, etag = releases.fetch_release_tags(pool, "org", "repo")
+        early_tags, _ = releases.fetch_release_tags(pool, "org", "repo", until="8.5.0")
+    finally:
+        pool.close()
+    assert tags == TAGS
+    assert etag == ETAG
+    assert early_tags == TAGS[:100]
+    assert len(handler.requests) == 3
+
+
+def test_fetch_release_tags_revalidates_with_etag(api):
+    _, handler = api
+    pool = HttpPool()
+    try:
+        assert releases.fetch_release_tags(pool, "org", "repo", etag=ETAG) == (None, ETAG)
+    finally:
+        pool.close()
+    assert handler.requests == [("/repos/org/repo/releases?per_page=100", ETAG)]
+
+
+def test_check_releases_answers_from_index(api, tmp_path):
+    _, handler = api
+    index = ReleaseIndex(str(tmp_path / "release-index.json"))
+    checks = {'NODE_RELEASE': ("org", "repo", "8.120.0")}
+
+    assert releases.check_releases(checks, index) == {'NODE_RELEASE': None}
+    assert len(handler.requests) == 2
+    # Indexed tags need no request at all
+    assert releases.check_releases(checks, ReleaseIndex(index.path)) == {'NODE_RELEASE': None}
+    assert len(handler.requests) == 2
+
+    # A tag missing from the index revalidates the first page, and the 304 settles it
+    missing = releases.check_releases({'NODE_RELEASE': ("org", "repo", "9.0.0")}, index)
+    assert missing == {'NODE_RELEASE': "9.0.0 is not a valid tag."}
+    assert handler.requests[-1] == ("/repos/org/repo/releases?per_page=100", ETAG)
+    assert len(handler.requests) == 3
+
+
+def test_check_releases_reports_api_errors(api):
+    result = releases.check_releases({'AIKEN_RELEASE': ("org", "missing", "v1.0.0")})
+    assert result['AIKEN_RELEASE'].startswith("An error occurred with call to GitHub API")
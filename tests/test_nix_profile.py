@@ -0,0 +1,80 @@
+import os
+import sys
+
+import pytest
+
+from src import nix_profile
+from src.nix_profile import ProfileTransaction, current_generation, flag_groups
+
+NODE_FLAGS = ["--accept-flake-config", "--extra-substituters", "https://cache.zw3rk.com",
+              "--no-warn-dirty"]
+
+
+@pytest.fixture
+def home(tmp_path, monkeypatch) -> str:
+    """
+    A home directory whose profile is at generation 7, linked the way nix links it.
+    """
+    profiles = tmp_path / "profiles"
+    profiles.mkdir()
+    for generation in [6, 7]:
+        (profiles / f"profile-{generation}-link").mkdir()
+    os.symlink("profile-7-link", profiles / "profile")
+    os.symlink(profiles / "profile", tmp_path / ".nix-profile")
+    monkeypatch.setenv('HOME', str(tmp_path))
+    return str(tmp_path)
+
+
+@pytest.fixture
+def commands(monkeypatch) -> list[list[str]]:
+    """
+    Records the commands run, failing `nix profile install` as a full store would.
+    """
+    run: list[list[str]] = []
+
+    def run_quiet(cmd: list[str], err: str) -> None:
+        run.append(cmd)
+        if cmd[:3] == ["nix", "profile", "install"] and "#broken" in cmd[-1]:
+            sys.exit(1)
+
+    monkeypatch.setattr(nix_profile, 'run_quiet', run_quiet)
+    return run
+
+
+def test_flag_groups():
+    assert flag_groups(NODE_FLAGS) == [
+        ("--accept-flake-config",), ("--extra-substituters", "https://cache.zw3rk.com"),
+        ("--no-warn-dirty",)]
+    assert flag_groups(["--option", "cores", "2"]) == [("--option", "cores", "2")]
+
+
+def test_current_generation(home):
+    assert current_generation() == 7
+
+
+def test_current_generation_without_profile_links(tmp_path, monkeypatch):
+    monkeypatch.setenv('HOME', str(tmp_path))
+    assert current_generation() is None
+
+
+def test_commit_dedupes_individual_flags(home, commands):
+    txn = ProfileTransaction()
+    committed = []
+    txn.add(["cardano-node"], ["/src/node#cardano-node"], NODE_FLAGS, lambda: committed.append(1))
+    txn.add(["ogmios"], ["/src/ogmios#ogmios"], ["--accept-flake-config", "--no-warn-dirty"])
+    txn.commit()
+    assert commands == [
+        ["nix", "profile", "remove", "cardano-node", "ogmios"],
+        ["nix", "profile", "install", *NODE_FLAGS, "/src/node#cardano-node", "/src/ogmios#ogmios"],
+    ]
+    assert committed == [1]
+
+
+def test_failed_install_restores_previous_generation(home, commands):
+    txn = ProfileTransaction()
+    committed = []
+    txn.add(["ogmios"], ["/src/ogmios#broken"], [], lambda: committed.append(1))
+    with pytest.raises(SystemExit):
+        txn.commit()
+    assert commands[-1] == ["nix", "profile", "rollback", "--to", "7"]
+    assert committed == []
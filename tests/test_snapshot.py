@@ -0,0 +1,255 @@
+import hashlib
+import io
+import json
+import os
+import tarfile
+from http.server import SimpleHTTPRequestHandler
+
+import pytest
+
+from src.snapshot import SnapshotError, member_name, restore
+
+FILES = {
+    "db/immutable/00000.chunk": b"chunk 0" * 1000,
+    "db/immutable/00000.primary": b"primary 0",
+    "db/immutable/00001.chunk": b"chunk 1" * 1000,
+    "db/ledger/1234": b"ledger" * 5000,
+    "db/protocolMagicId": b"1",
+}
+
+
+def make_archive(path, files: dict[str, bytes], mode: str = "w:gz") -> str:
+    with tarfile.open(path, mode) as tar:
+        for name, data in files.items():
+            info = tarfile.TarInfo(name)
+            info.size = len(data)
+            info.mtime = 1700000000
+            tar.addfile(info, io.BytesIO(data))
+    return str(path)
+
+
+def write_checksums(path, files: dict[str, bytes]) -> str:
+    path.write_text("".join(
+        f"{hashlib.sha256(data).hexdigest()}  {name}\n" for name, data in files.items()))
+    return str(path)
+
+
+def read_db(db_path: str) -> dict[str, bytes]:
+    files = {}
+    for dirpath, _, filenames in os.walk(db_path):
+        for filename in filenames:
+            path = os.path.join(dirpath, filename)
+            with open(path, 'rb') as f:
+                files["db/" + os.path.relpath(path, db_path)] = f.read()
+    return files
+
+
+@pytest.fixture
+def db(tmp_path) -> tuple[str, str]:
+    return str(tmp_path / "preprod" / "db"), str(tmp_path / "preprod" / "progress.json")
+
+
+def test_member_name():
+    assert member_name("db/immutable/00000.chunk") == "immutable/00000.chunk"
+    assert member_name("./db") == ""
+    assert member_name("ledger/1234") == "ledger/1234"
+    assert member_name("db/../../etc/passwd") is None
+    assert member_name("/etc/passwd") is None
+
+
+@pytest.mark.parametrize("mode", ["w", "w:gz", "w:bz2", "w:xz"])
+def test_restore(tmp_path, db, mode):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar", FILES, mode)
+    report = restore(db_path, progress_path, archive, write_checksums(tmp_path / "sums", FILES))
+    assert read_db(db_path) == FILES
+    assert (report['written'], report['skipped']) == (len(FILES), 0)
+    assert report['bytes_written'] == sum(len(data) for data in FILES.values())
+    assert os.path.getmtime(os.path.join(db_path, "protocolMagicId")) == 1700000000
+    assert not os.path.exists(progress_path)
+
+
+def test_restore_over_http(tmp_path, db, http_server):
+    db_path, progress_path = db
+    make_archive(tmp_path / "db.tar.gz", FILES)
+    write_checksums(tmp_path / "sums", FILES)
+    handler = type('Handler', (SimpleHTTPRequestHandler,), {
+        '__init__': lambda self, *args: SimpleHTTPRequestHandler.__init__(
+            self, *args, directory=str(tmp_path)),
+        'log_message': lambda self, *args: None,
+    })
+    url = http_server(handler)
+    restore(db_path, progress_path, f"{url}/db.tar.gz", f"{url}/sums")
+    assert read_db(db_path) == FILES
+
+
+def test_resume_skips_restored_files(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", FILES)
+    # A checksum list without the ledger snapshot stops the restore part way through
+    partial_sums = {name: data for name, data in FILES.items() if name != "db/ledger/1234"}
+    with pytest.raises(SnapshotError, match="ledger/1234 is not in the checksum list"):
+        restore(db_path, progress_path, archive, write_checksums(tmp_path / "partial", partial_sums),
+                jobs=1)
+    assert os.path.exists(progress_path)
+    assert not os.path.exists(os.path.join(db_path, "ledger", "1234.partial"))
+
+    report = restore(db_path, progress_path, archive, write_checksums(tmp_path / "sums", FILES))
+    assert read_db(db_path) == FILES
+    assert report['skipped'] >= 1
+    assert report['written'] + report['skipped'] == len(FILES)
+    assert not os.path.exists(progress_path)
+
+
+class RangeHandler(SimpleHTTPRequestHandler):
+    """
+    Serves files from `directory`, honouring `Range: bytes=N-` requests.
+    """
+    directory: str
+    ranges: list[str | None]
+
+    def __init__(self, *args):
+        super().__init__(*args, directory=self.directory)
+
+    def do_GET(self) -> None:
+        self.ranges.append(self.headers.get("Range"))
+        if not self.headers.get("Range"):
+            super().do_GET()
+            return
+        start = int(self.headers["Range"].removeprefix("bytes=").rstrip("-"))
+        with open(self.translate_path(self.path), 'rb') as f:
+            f.seek(start)
+            data = f.read()
+        self.send_response(206)
+        self.send_header("Content-Length", str(len(data)))
+        self.end_headers()
+        self.wfile.write(data)
+
+    def log_message(self, *args) -> None:
+        pass
+
+
+def fail_at_ledger(tmp_path, db_path: str, progress_path: str, source: str) -> int:
+    """
+    Restores with a checksum list missing the ledger snapshot, which stops part way through,
+    and returns the offset recorded to resume at.
+    """
+    partial_sums = {name: data for name, data in FILES.items() if name != "db/ledger/1234"}
+    with pytest.raises(SnapshotError, match="ledger/1234 is not in the checksum list"):
+        restore(db_path, progress_path, source, write_checksums(tmp_path / "partial", partial_sums),
+                jobs=1)
+    with open(progress_path) as f:
+        return json.load(f)['offset']
+
+
+@pytest.mark.parametrize("served", [False, True])
+def test_uncompressed_resume_reads_on_from_offset(tmp_path, db, http_server, served):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar", FILES, "w")
+    handler = type('Handler', (RangeHandler,), {'directory': str(tmp_path), 'ranges': []})
+    source = f"{http_server(handler)}/db.tar" if served else archive
+    offset = fail_at_ledger(tmp_path, db_path, progress_path, source)
+    with tarfile.open(archive) as tar:
+        assert offset == tar.getmember("db/ledger/1234").offset
+
+    report = restore(db_path, progress_path, source, write_checksums(tmp_path / "sums", FILES))
+    assert read_db(db_path) == FILES
+    assert (report['written'], report['skipped']) == (1, len(FILES) - 1)
+    if served:
+        assert handler.ranges == [None, f"bytes={offset}-"]
+
+
+def test_resume_without_range_support(tmp_path, db, http_server):
+    db_path, progress_path = db
+    make_archive(tmp_path / "db.tar", FILES, "w")
+    handler = type('Handler', (SimpleHTTPRequestHandler,), {
+        '__init__': lambda self, *args: SimpleHTTPRequestHandler.__init__(
+            self, *args, directory=str(tmp_path)),
+        'log_message': lambda self, *args: None,
+    })
+    source = f"{http_server(handler)}/db.tar"
+    assert fail_at_ledger(tmp_path, db_path, progress_path, source) > 0
+    # The full archive comes back, and the bytes before the offset are dropped
+    report = restore(db_path, progress_path, source)
+    assert read_db(db_path) == FILES
+    assert (report['written'], report['skipped']) == (1, len(FILES) - 1)
+
+
+def test_compressed_resume_reads_from_start(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", FILES)
+    assert fail_at_ledger(tmp_path, db_path, progress_path, archive) == 0
+
+
+def test_resume_reads_from_start_if_restored_files_changed(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar", FILES, "w")
+    fail_at_ledger(tmp_path, db_path, progress_path, archive)
+    os.remove(os.path.join(db_path, "immutable", "00000.chunk"))
+    report = restore(db_path, progress_path, archive)
+    assert read_db(db_path) == FILES
+    assert report['written'] == 2
+
+
+def test_resume_rewrites_changed_files(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", FILES)
+    restore(db_path, progress_path, archive)
+    # A progress file left by an interrupted run, with one of its files since truncated
+    done = {member_name(name): {'size': len(data), 'sha256': hashlib.sha256(data).hexdigest()}
+            for name, data in FILES.items()}
+    with open(progress_path, 'w') as f:
+        json.dump({'source': archive, 'done': done}, f)
+    with open(os.path.join(db_path, "immutable", "00001.chunk"), 'wb') as f:
+        f.write(b"truncated")
+
+    report = restore(db_path, progress_path, archive)
+    assert read_db(db_path) == FILES
+    assert (report['written'], report['skipped']) == (1, len(FILES) - 1)
+
+
+def test_checksum_mismatch(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", FILES)
+    bad_sums = {**FILES, "db/protocolMagicId": b"2"}
+    with pytest.raises(SnapshotError, match="checksum mismatch for protocolMagicId"):
+        restore(db_path, progress_path, archive, write_checksums(tmp_path / "sums", bad_sums))
+    assert not os.path.exists(os.path.join(db_path, "protocolMagicId"))
+    assert not os.path.exists(os.path.join(db_path, "protocolMagicId.partial"))
+
+
+def test_missing_files_are_reported(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", FILES)
+    sums = write_checksums(tmp_path / "sums", {**FILES, "db/immutable/00002.chunk": b""})
+    with pytest.raises(SnapshotError, match="1 files in the checksum list are missing"):
+        restore(db_path, progress_path, archive, sums)
+
+
+@pytest.mark.parametrize("name", ["../evil", "db/../../evil", "/tmp/evil"])
+def test_unsafe_paths_are_refused(tmp_path, db, name):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", {name: b"evil", **FILES})
+    with pytest.raises(SnapshotError, match="unsafe path in archive"):
+        restore(db_path, progress_path, archive)
+    assert not os.path.exists(tmp_path / "evil")
+    assert not os.path.exists(tmp_path / "preprod" / "evil")
+
+
+def test_other_restore_in_progress(tmp_path, db):
+    db_path, progress_path = db
+    archive = make_archive(tmp_path / "db.tar.gz", FILES)
+    os.makedirs(os.path.dirname(progress_path))
+    with open(progress_path, 'w') as f:
+        f.write('{"source": "https://example.com/other.tar", "done": {}}')
+    with pytest.raises(SnapshotError, match="unfinished restore from https://example.com/other.tar"):
+        restore(db_path, progress_path, archive)
+
+
+def test_non_empty_db_is_refused(tmp_path, db):
+    db_path, progress_path = db
+    os.makedirs(db_path)
+    with open(os.path.join(db_path, "clean"), 'w') as f:
+        f.write("")
+    with pytest.raises(SnapshotError, match="is not empty"):
+        restore(db_path, progress_path, make_archive(tmp_path / "db.tar.gz", FILES))
@@ -0,0 +1,113 @@
+import os
+
+import pytest
+
+from src import substituters
+from src.nix_options import NixOptions
+from src.substituters import CacheProbe
+
+HASHES = ["a" * 32, "b" * 32]
+PATHS = [f"/nix/store/{digest}-cardano-node" for digest in HASHES]
+
+
+def make_cache(root, name: str, narinfos: dict[str, str], priority: int | None = None) -> str:
+    """
+    Writes a file:// binary cache with a narinfo signed by the given key for each hash.
+    """
+    path = root / name
+    path.mkdir()
+    info = "StoreDir: /nix/store\n" + (f"Priority: {priority}\n" if priority is not None else "")
+    (path / "nix-cache-info").write_text(info)
+    for digest, key_name in narinfos.items():
+        (path / f"{digest}.narinfo").write_text(
+            f"StorePath: /nix/store/{digest}-cardano-node\nSig: {key_name}:c2lnbmF0dXJl\n")
+    return f"file://{path}"
+
+
+@pytest.fixture
+def caches(tmp_path) -> dict[str, str]:
+    return {
+        'full': make_cache(tmp_path, "full", {HASHES[0]: "trusted-1", HASHES[1]: "trusted-1"}, 40),
+        'half': make_cache(tmp_path, "half", {HASHES[0]: "trusted-1"}, 40),
+        'untrusted': make_cache(tmp_path, "untrusted", {HASHES[0]: "other-1", HASHES[1]: "other-1"}),
+        'empty': make_cache(tmp_path, "empty", {}, 10),
+    }
+
+
+def test_probe_reads_priority(caches, tmp_path):
+    probes = substituters.probe_substituters(
+        [caches['full'], caches['untrusted'], f"file://{tmp_path}/missing"])
+    assert [(p.url, p.priority, p.error) for p in probes] == [
+        (caches['full'], 40, None),
+        (caches['untrusted'], substituters.DEFAULT_PRIORITY, None),
+        (f"file://{tmp_path}/missing", substituters.DEFAULT_PRIORITY, "not a binary cache"),
+    ]
+    assert probes[0].latency is not None and probes[2].latency is None
+
+
+def test_order_by_priority_hit_rate_then_latency():
+    probes = [
+        CacheProbe("slow", 0.3, 40, None),
+        CacheProbe("fast", 0.1, 40, None),
+        CacheProbe("local", 0.5, 10, None),
+        CacheProbe("down", None, 10, "timed out"),
+    ]
+    assert substituters.order_substituters(probes) == ["local", "fast", "slow"]
+    assert substituters.order_substituters(probes, {"slow": 1.0, "fast": 0.5}) == \
+        ["local", "slow", "fast"]
+
+
+def test_find_substitutes_per_cache(caches):
+    found = substituters.find_substitutes(PATHS, list(caches.values()), {"trusted-1"})
+    assert found == {
+        caches['full']: [True, True],
+        caches['half']: [True, None],
+        caches['untrusted']: [False, False],
+        caches['empty']: [None, None],
+    }
+
+
+def test_check_substitutes(caches, monkeypatch):
+    opts = NixOptions()
+    substituters.use_substituters(
+        {"trusted-public-keys": {"value": ["trusted-1:a2V5"]}}, opts,
+        substituters.probe_substituters(list(caches.values())))
+    monkeypatch.setattr(substituters, 'out_paths', lambda installables, flags: PATHS)
+
+    used = substituters.check_substitutes("cardano-node", ["/src#cardano-node"], [], opts)
+    # Untrusted signatures rule the cache out; among equal priorities, hits come first
+    assert used == [caches['empty'], caches['full'], caches['half']]
+
+
+def test_check_substitutes_skips_local_outputs(caches, monkeypatch):
+    opts = NixOptions()
+    substituters.use_substituters({}, opts, substituters.probe_substituters([caches['half']]))
+    opts.trusted_public_keys = ["trusted-1:a2V5"]
+    monkeypatch.setattr(substituters, 'out_paths', lambda installables, flags: PATHS)
+    monkeypatch.setattr(os.path, 'exists', lambda path: path == PATHS[1])
+    looked_up = []
+    find_substitutes = substituters.find_substitutes
+
+    def find(paths, urls, trusted_keys):
+        looked_up.extend(paths)
+        return find_substitutes(paths, urls, trusted_keys)
+
+    monkeypatch.setattr(substituters, 'find_substitutes', find)
+    assert substituters.check_substitutes("cardano-node", ["/src#cardano-node"], [], opts) == \
+        [caches['half']]
+    assert looked_up == [PATHS[0]]
+
+
+def test_trusted_key_names_from_flags():
+    opts = NixOptions()
+    opts.conf_public_keys = ["cache.nixos.org-1:a2V5"]
+    opts.trusted_public_keys = ["ez-installer-host-1:a2V5"]
+    flags = ["--extra-trusted-public-keys", "loony-tools:a2V5", "--no-warn-dirty"]
+    assert substituters.trusted_key_names(["/src#x"], flags, opts) == \
+        {"cache.nixos.org-1", "ez-installer-host-1", "loony-tools"}
+
+
+def test_flake_path():
+    assert substituters.flake_path("/src/ogmios/server#ogmios") == "/src/ogmios/server"
+    assert substituters.flake_path("git+file:///src/ogmios?shallow=1&dir=server#ogmios") == \
+        "/src/ogmios/server"